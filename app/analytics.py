@@ -0,0 +1,126 @@
+"""Daily sales rollups.
+
+daily_sales holds orders, units and revenue (what was charged for the lines: line totals less
+the order's coupon discount, spread over its lines in proportion to their totals; delivery
+fees excluded) per day, company, shop and product, along with that coupon_discount, so
+dashboard queries read a few hundred rollup rows instead of scanning bookings. orders counts
+the orders that contain the product, so summed over several products an order with two of
+them counts twice.
+
+The rollup is driven by a watermark on bookings.order_id. Every run finds the days of the
+bookings written since the watermark, plus the last TRAILING_DAYS days (by the database's
+CURRENT_DATE, the one checkout stamps order_date with), and recomputes those
+days as a whole from bookings and order_items, so a run is idempotent. A booking whose id was
+allocated before the watermark but which committed after it is invisible to the watermark;
+it is counted only because its day (checkout stamps CURRENT_DATE) is still inside the trailing
+window when it commits. Anything written later for an older day is not picked up on its own:
+rebuild that day with reaggregate(day), e.g. after orders were corrected:
+
+    python -m app.analytics 2023-08-14
+"""
+import argparse
+import datetime
+import sys
+
+from sqlalchemy import text
+
+from . import jobs, scheduler
+from .database import session_scope
+
+WATERMARK = "daily_sales"
+ROLLUP_LOCK_KEY = 72_040
+TRAILING_DAYS = 2  # today and yesterday, so a checkout committing just after midnight is counted
+GROUP_COLUMNS = {"day": "day", "shop": "shop_id", "product": "product_id"}
+
+REFRESH_DAYS = [
+    "DELETE FROM daily_sales WHERE day = ANY(:days)",
+    """
+    INSERT INTO daily_sales (company_id, day, shop_id, product_id, orders, units, revenue, coupon_discount)
+    SELECT company_id, day, shop_id, product_id, COUNT(DISTINCT order_id), SUM(count),
+           SUM(line_total - coupon_share), SUM(coupon_share)
+    FROM (
+        SELECT COALESCE(b.company_id, c.company_id) AS company_id, b.order_date AS day,
+               COALESCE(b.shop_id, 0) AS shop_id, COALESCE(i.product_id, 0) AS product_id, b.order_id, i.count,
+               COALESCE(i.line_total, 0) AS line_total,
+               COALESCE(b.coupon_discount * i.line_total / NULLIF(b.product_total, 0), 0) AS coupon_share
+        FROM bookings b
+        JOIN order_items i ON i.order_id = b.order_id
+        LEFT JOIN carts c ON c.cart_id = b.cart_id
+        WHERE b.order_date = ANY(:days) AND COALESCE(b.company_id, c.company_id) IS NOT NULL
+    ) lines
+    GROUP BY 1, 2, 3, 4
+    """,
+]
+
+PENDING_DAYS = text("""
+    SELECT COALESCE(array_agg(DISTINCT order_date), '{}') AS days, MAX(order_id) AS last_order_id,
+           CURRENT_DATE AS today
+    FROM bookings
+    WHERE order_id > :after
+""")
+
+SALES = """
+    SELECT {columns}, SUM(orders) AS orders, SUM(units) AS units, SUM(revenue) AS revenue,
+           SUM(coupon_discount) AS coupon_discount
+    FROM daily_sales
+    WHERE company_id = (SELECT company_id FROM companies WHERE company_name = :company_name)
+      AND day BETWEEN :start AND :end
+      AND (CAST(:shop_id AS bigint) IS NULL OR shop_id = :shop_id)
+    GROUP BY {columns}
+    ORDER BY {columns}
+"""
+
+
+def refresh_days(db, days):
+    for statement in REFRESH_DAYS:
+        db.execute(text(statement), {"days": list(days)})
+
+
+@jobs.handler("analytics.rollup")
+@scheduler.every(60)
+def rollup():
+    """Bring daily_sales up to date with the bookings written since the last run."""
+    with session_scope() as db:
+        if not db.execute(text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": ROLLUP_LOCK_KEY}).scalar():
+            return
+        db.execute(text("INSERT INTO rollup_watermarks (name) VALUES (:name) ON CONFLICT DO NOTHING"),
+                   {"name": WATERMARK})
+        after = db.execute(text("SELECT last_order_id FROM rollup_watermarks WHERE name = :name"),
+                           {"name": WATERMARK}).scalar()
+        pending = db.execute(PENDING_DAYS, {"after": after}).one()
+        trailing = {pending.today - datetime.timedelta(days=n) for n in range(TRAILING_DAYS)}
+        refresh_days(db, set(pending.days) | trailing)
+        if pending.last_order_id is not None:
+            db.execute(text("UPDATE rollup_watermarks SET last_order_id = :last_order_id, updated_at = now() "
+                            "WHERE name = :name"), {"name": WATERMARK, "last_order_id": pending.last_order_id})
+
+
+@jobs.handler("analytics.reaggregate")
+def reaggregate(day):
+    if isinstance(day, str):
+        day = datetime.date.fromisoformat(day)
+    with session_scope() as db:
+        db.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": ROLLUP_LOCK_KEY})
+        refresh_days(db, [day])
+
+
+def sales(db, company_name, start, end, group_by=("day",), shop_id=None):
+    """Rollup rows of the company between start and end, grouped by any of day, shop and product."""
+    columns = ", ".join(GROUP_COLUMNS[group] for group in group_by)
+    rows = db.execute(text(SALES.format(columns=columns)), {"company_name": company_name, "start": start,
+                                                           "end": end, "shop_id": shop_id}).mappings()
+    return [dict(row) for row in rows]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rebuild the daily sales rollup of closed days.")
+    parser.add_argument("days", nargs="+", type=datetime.date.fromisoformat)
+    args = parser.parse_args(argv)
+    for day in args.days:
+        reaggregate(day)
+        print(f"{day}: re-aggregated")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
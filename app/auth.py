@@ -0,0 +1,146 @@
+"""Customer login/sign-up and signed session tokens.
+
+Tokens are itsdangerous-signed (HMAC) payloads carrying the caller's contact, company and
+role, so a request can be attributed to its caller by checking a signature in memory
+instead of reading customers/companies or running bcrypt. Verified tokens are cached.
+
+The company tokens of the companies listed in ONECART_ADMIN_COMPANIES (comma-separated
+names) also pass current_admin.
+"""
+import hashlib
+import logging
+import os
+import time
+
+from fastapi import Depends, HTTPException
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+from sqlalchemy import text
+
+from . import schemas
+from .cache import TTLCache
+
+TOKEN_SECRET = os.environ.get("ONECART_TOKEN_SECRET")
+if not TOKEN_SECRET:
+    # The development secret is public, so anyone could sign tokens with it: opt in explicitly.
+    if os.environ.get("ONECART_DEV") != "1":
+        raise RuntimeError("ONECART_TOKEN_SECRET is not set (set ONECART_DEV=1 to use the development secret)")
+    logging.warning("ONECART_TOKEN_SECRET is not set; using the development token secret")
+    TOKEN_SECRET = "onecart-development-token-secret"
+TOKEN_MAX_AGE = 30 * 24 * 3600
+# Companies whose tokens may change what every tenant sees, such as discount rules (prices are
+# not per company in this schema).
+ADMIN_COMPANIES = {name.strip() for name in os.environ.get("ONECART_ADMIN_COMPANIES", "").split(",") if name.strip()}
+
+serializer = URLSafeTimedSerializer(TOKEN_SECRET, salt="onecart-session",
+                                    signer_kwargs={"digest_method": hashlib.sha256})
+verified_tokens = TTLCache(ttl=300, maxsize=100000)
+bearer = HTTPBearer(auto_error=False)
+
+# (company_name, customer_contact) -> customer row; login is the first call on every app open.
+membership_cache = TTLCache(ttl=300, maxsize=50000)
+
+AUTHENTICATE_USER = text("""
+    WITH new_user AS (
+        INSERT INTO customers (customer_id, customer_name, customer_contact, customer_birthdate, email_id, wallet,
+                               prev_pay_mode)
+        VALUES (:customer_id, :customer_name, :customer_contact, :customer_birthdate, :email_id, :wallet,
+                :prev_pay_mode)
+        ON CONFLICT (customer_contact) DO NOTHING
+        RETURNING *
+    ), new_membership AS (
+        INSERT INTO user_companies (company_name, user_contact)
+        VALUES (:company_name, :customer_contact)
+        ON CONFLICT DO NOTHING
+        RETURNING user_contact
+    )
+    SELECT u.*,
+           EXISTS (SELECT 1 FROM new_user) AS user_created,
+           EXISTS (SELECT 1 FROM new_membership) AS joined_company
+    FROM (SELECT 1) one
+    LEFT JOIN LATERAL (SELECT * FROM new_user
+                       UNION ALL
+                       SELECT * FROM customers WHERE customer_contact = :customer_contact
+                       LIMIT 1) u ON true
+""")
+
+CUSTOMER = text("SELECT * FROM customers WHERE customer_contact = :customer_contact")
+
+
+def authenticate_user(db, company_name, user_data):
+    """Sign the customer up and/or add them to the company in one statement.
+
+    Returns (message, customer). Both inserts are ON CONFLICT DO NOTHING, so concurrent first
+    logins for the same phone do not fail, but the loser's statement cannot see the winner's
+    customer row: its snapshot predates the winner's commit, and ON CONFLICT DO NOTHING does
+    not return the conflicting row. The statement then returns only the flags, and the
+    customer is read by a second statement, which sees the committed row. Raises
+    IntegrityError when the company does not exist.
+    """
+    key = (company_name, user_data.customer_contact)
+    customer = membership_cache.get(key)
+    if customer is not None:
+        return "New user successfully Logged in for this company!", customer
+
+    row = db.execute(AUTHENTICATE_USER, {**user_data.model_dump(), "company_name": company_name}).mappings().one()
+    db.commit()
+
+    customer = {column: value for column, value in row.items() if column not in ("user_created", "joined_company")}
+    if customer["customer_contact"] is None:
+        customer = dict(db.execute(CUSTOMER, {"customer_contact": user_data.customer_contact}).mappings().one())
+    membership_cache.set(key, customer)
+    if row["user_created"]:
+        return "New user successfully created!", customer
+    if row["joined_company"]:
+        return "New user successfully Logged in!", customer
+    return "New user successfully Logged in for this company!", customer
+
+
+def forget_user(customer_contact):
+    membership_cache.discard_where(lambda key: key[1] == customer_contact)
+
+
+def issue_token(contact, company_name, role):
+    return serializer.dumps({"contact": contact, "company_name": company_name, "role": role})
+
+
+def verify_token(token):
+    """Return the token's schemas.Identity, or None if the signature is bad or it has expired."""
+    identity = verified_tokens.get(token)
+    if identity is not None:
+        return identity
+    try:
+        payload, signed_at = serializer.loads(token, max_age=TOKEN_MAX_AGE, return_timestamp=True)
+    except BadSignature:
+        return None
+    identity = schemas.Identity(**payload)
+    remaining = TOKEN_MAX_AGE - (time.time() - signed_at.timestamp())
+    verified_tokens.set(token, identity, ttl=min(verified_tokens.ttl, remaining))
+    return identity
+
+
+def current_identity(credentials: HTTPAuthorizationCredentials = Depends(bearer)):
+    if credentials is None:
+        raise HTTPException(status_code=401, detail="Missing bearer token")
+    identity = verify_token(credentials.credentials)
+    if identity is None:
+        raise HTTPException(status_code=401, detail="Invalid or expired token")
+    return identity
+
+
+def current_customer(identity: schemas.Identity = Depends(current_identity)):
+    if identity.role != "customer":
+        raise HTTPException(status_code=403, detail="Customer token required")
+    return identity
+
+
+def current_company(identity: schemas.Identity = Depends(current_identity)):
+    if identity.role != "company":
+        raise HTTPException(status_code=403, detail="Company token required")
+    return identity
+
+
+def current_admin(identity: schemas.Identity = Depends(current_company)):
+    if identity.company_name not in ADMIN_COMPANIES:
+        raise HTTPException(status_code=403, detail="Admin token required")
+    return identity
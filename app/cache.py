@@ -0,0 +1,52 @@
+"""Per-process caches."""
+import threading
+import time
+
+
+class TTLCache:
+    """Thread-safe mapping whose entries expire after ttl seconds; holds at most maxsize entries."""
+
+    def __init__(self, ttl, maxsize=10000):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        entry = self._data.get(key)
+        if entry is None:
+            return default
+        expires, value = entry
+        if expires < time.monotonic():
+            with self._lock:
+                self._data.pop(key, None)
+            return default
+        return value
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            if len(self._data) >= self.maxsize:
+                self._evict()
+            self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+
+    def pop(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def discard_where(self, predicate):
+        with self._lock:
+            for key in [key for key in self._data if predicate(key)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def _evict(self):
+        now = time.monotonic()
+        for key in [key for key, (expires, _) in self._data.items() if expires < now]:
+            del self._data[key]
+        # Still full: drop the oldest tenth (dicts keep insertion order).
+        if len(self._data) >= self.maxsize:
+            for key in list(self._data)[:max(1, self.maxsize // 10)]:
+                del self._data[key]
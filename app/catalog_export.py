@@ -0,0 +1,119 @@
+"""Streaming catalog export.
+
+Products are read through a server-side cursor with their brand, categories and variants
+aggregated by Postgres into one row per product, then encoded chunk by chunk, so memory
+use does not grow with the catalog and the first bytes go out as soon as Postgres
+returns the first batch.
+"""
+import csv
+import io
+import json
+
+from sqlalchemy import func, literal_column, select
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+
+from . import models
+from .database import engine
+from .product_summary import VARIANT_COLUMNS
+
+BATCH_SIZE = 500
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+CSV_COLUMNS = [
+    "product_id", "product_name", "details", "brand_id", "brand_name", "categories",
+    "variant_id", "quantity", "variant_cost", "discounted_cost", "discount", "count", "ratings",
+    "description", "image",
+]
+
+
+def catalog_query():
+    variant = models.ProductVariant
+    variants = (
+        select(func.coalesce(func.json_agg(aggregate_order_by(func.json_build_object(
+            *(arg for column in VARIANT_COLUMNS for arg in (column, getattr(variant, column)))
+        ), variant.variant_id)), literal_column("'[]'::json")))
+        .where(variant.product_id == models.Products.product_id)
+        .scalar_subquery()
+    )
+    categories = (
+        select(func.coalesce(func.json_agg(aggregate_order_by(func.json_build_object(
+            "category_id", models.Categories.category_id,
+            "category_name", models.Categories.category_name,
+        ), models.Categories.category_id)), literal_column("'[]'::json")))
+        .select_from(models.CategoryProduct)
+        .join(models.Categories, models.Categories.category_id == models.CategoryProduct.category_id)
+        .where(models.CategoryProduct.product_id == models.Products.product_id)
+        .scalar_subquery()
+    )
+    return (
+        select(
+            models.Products.product_id,
+            models.Products.product_name,
+            models.Products.details,
+            models.Brand.brand_id,
+            models.Brand.brand_name,
+            models.Brand.brand_image,
+            categories.label("categories"),
+            variants.label("variants"),
+        )
+        .join(models.Brand, models.Brand.brand_id == models.Products.brand_id)
+        .where(models.Products.is_deleted == False)
+        .order_by(models.Products.product_id)
+    )
+
+
+def stream_products():
+    """Yield lists of product dicts, BATCH_SIZE at a time, from a server-side cursor."""
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=BATCH_SIZE).execute(catalog_query())
+        for partition in result.partitions():
+            yield [
+                {
+                    "product_id": row.product_id,
+                    "product_name": row.product_name,
+                    "details": row.details,
+                    "brand": {"brand_id": row.brand_id, "brand_name": row.brand_name,
+                              "brand_image": row.brand_image},
+                    "categories": row.categories,
+                    "variants": row.variants,
+                }
+                for row in partition
+            ]
+
+
+def export_ndjson():
+    for products in stream_products():
+        yield "".join(json.dumps(product, default=str) + "\n" for product in products)
+
+
+def export_csv():
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_COLUMNS)
+    yield buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    for products in stream_products():
+        for product in products:
+            categories = "|".join(category["category_name"] for category in product["categories"])
+            for variant in product["variants"] or [{}]:
+                writer.writerow([
+                    product["product_id"], product["product_name"], product["details"],
+                    product["brand"]["brand_id"], product["brand"]["brand_name"], categories,
+                    variant.get("variant_id"), variant.get("quantity"), variant.get("variant_cost"),
+                    variant.get("discounted_cost"), variant.get("discount"), variant.get("count"),
+                    variant.get("ratings"), variant.get("description"), "|".join(variant.get("image") or []),
+                ])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+EXPORTERS = {
+    "ndjson": export_ndjson,
+    "csv": export_csv,
+}
@@ -0,0 +1,231 @@
+"""Supplier catalog import.
+
+An uploaded CSV (same columns as the /exportProducts CSV) is read in batches. Each batch is
+validated with a pydantic TypeAdapter and the valid rows are COPYed into the unlogged
+catalog_import_rows staging table. Once the whole file is staged it is merged into brands,
+categories, products, product_variants and product_categories with a handful of set-based
+statements in one transaction. Progress and per-line errors are kept on the
+catalog_imports row. Re-importing a soft-deleted product restores it.
+
+The count of a variant on flash sale is left alone: its stock lives in app.inventory's
+shards until the sale ends.
+
+Brands, categories and products are matched by name and variants by (product, quantity).
+Those columns carry no unique constraint in this schema, so new rows are inserted with
+INSERT ... SELECT ... WHERE NOT EXISTS under an advisory lock that serialises imports;
+product_categories has a primary key and uses ON CONFLICT DO NOTHING.
+"""
+import csv
+import io
+import json
+import os
+from itertools import islice
+from typing import List
+
+from pydantic import TypeAdapter, ValidationError
+from sqlalchemy import func, text, update
+
+from . import facets, jobs, models, product_summary, schemas
+from .database import session_scope
+
+BATCH_SIZE = 5000
+MAX_REPORTED_ERRORS = 1000
+IMPORT_LOCK_KEY = 72_029
+
+rows_adapter = TypeAdapter(List[schemas.CatalogImportRow])
+
+STAGING_COLUMNS = [
+    "import_id", "line_no", "product_name", "details", "brand_name", "brand_image", "categories",
+    "variant_cost", "count", "discounted_cost", "discount", "quantity", "description", "image", "ratings",
+]
+
+MERGE_STATEMENTS = [
+    # brands and categories referenced by name that do not exist yet
+    """
+    INSERT INTO brands (brand_name, brand_image)
+    SELECT DISTINCT ON (s.brand_name) s.brand_name, s.brand_image
+    FROM catalog_import_rows s
+    WHERE s.import_id = :import_id
+      AND NOT EXISTS (SELECT 1 FROM brands b WHERE b.brand_name = s.brand_name)
+    ORDER BY s.brand_name, s.line_no
+    """,
+    """
+    INSERT INTO categories (category_name, category_image)
+    SELECT DISTINCT c.name, ''
+    FROM catalog_import_rows s, json_array_elements_text(s.categories) AS c(name)
+    WHERE s.import_id = :import_id
+      AND NOT EXISTS (SELECT 1 FROM categories k WHERE k.category_name = c.name)
+    """,
+    # products: refresh existing ones, then add the new ones
+    """
+    UPDATE products p
+    SET brand_id = src.brand_id, details = src.details, is_deleted = false, deleted_at = NULL
+    FROM (
+        SELECT DISTINCT ON (s.product_name) s.product_name, s.details,
+               (SELECT min(b.brand_id) FROM brands b WHERE b.brand_name = s.brand_name) AS brand_id
+        FROM catalog_import_rows s
+        WHERE s.import_id = :import_id
+        ORDER BY s.product_name, s.line_no DESC
+    ) src
+    WHERE p.product_name = src.product_name
+      AND (p.brand_id IS DISTINCT FROM src.brand_id OR p.details IS DISTINCT FROM src.details OR p.is_deleted)
+    """,
+    """
+    INSERT INTO products (brand_id, product_name, details)
+    SELECT src.brand_id, src.product_name, src.details
+    FROM (
+        SELECT DISTINCT ON (s.product_name) s.product_name, s.details,
+               (SELECT min(b.brand_id) FROM brands b WHERE b.brand_name = s.brand_name) AS brand_id
+        FROM catalog_import_rows s
+        WHERE s.import_id = :import_id
+        ORDER BY s.product_name, s.line_no DESC
+    ) src
+    WHERE NOT EXISTS (SELECT 1 FROM products p WHERE p.product_name = src.product_name)
+    """,
+    # variants are keyed by (product, quantity); the last line in the file wins
+    """
+    CREATE TEMPORARY TABLE import_variants ON COMMIT DROP AS
+    SELECT DISTINCT ON (p.product_id, s.quantity)
+           p.product_id, s.quantity, s.variant_cost, s.brand_name, s.count, s.discounted_cost, s.discount,
+           s.description, s.image, s.ratings
+    FROM catalog_import_rows s
+    JOIN LATERAL (SELECT min(product_id) AS product_id FROM products WHERE product_name = s.product_name) p ON true
+    WHERE s.import_id = :import_id
+    ORDER BY p.product_id, s.quantity, s.line_no DESC
+    """,
+    # lock the matched variants first, so the next statement sees any flash sale started meanwhile
+    """
+    SELECT v.variant_id FROM product_variants v
+    JOIN import_variants i ON i.product_id = v.product_id AND i.quantity = v.quantity
+    ORDER BY v.variant_id
+    FOR UPDATE OF v
+    """,
+    """
+    UPDATE product_variants v
+    SET variant_cost = i.variant_cost, brand_name = i.brand_name,
+        count = CASE WHEN EXISTS (SELECT 1 FROM flash_sales f WHERE f.variant_id = v.variant_id) THEN v.count
+                     ELSE i.count END,
+        discounted_cost = i.discounted_cost, discount = i.discount, base_discount = i.discount,
+        description = i.description,
+        image = i.image, ratings = i.ratings
+    FROM import_variants i
+    WHERE v.product_id = i.product_id AND v.quantity = i.quantity
+    """,
+    """
+    INSERT INTO product_variants (product_id, quantity, variant_cost, brand_name, count, discounted_cost,
+                                  discount, base_discount, description, image, ratings)
+    SELECT i.product_id, i.quantity, i.variant_cost, i.brand_name, i.count, i.discounted_cost, i.discount,
+           i.discount, i.description, i.image, i.ratings
+    FROM import_variants i
+    WHERE NOT EXISTS (SELECT 1 FROM product_variants v WHERE v.product_id = i.product_id AND v.quantity = i.quantity)
+    """,
+    """
+    INSERT INTO product_categories (product_id, category_id)
+    SELECT DISTINCT p.product_id, k.category_id
+    FROM catalog_import_rows s
+    CROSS JOIN LATERAL json_array_elements_text(s.categories) AS c(name)
+    JOIN LATERAL (SELECT min(product_id) AS product_id FROM products WHERE product_name = s.product_name) p ON true
+    JOIN LATERAL (SELECT min(category_id) AS category_id FROM categories WHERE category_name = c.name) k ON true
+    WHERE s.import_id = :import_id
+    ON CONFLICT DO NOTHING
+    """,
+    product_summary.REFRESH.format(products="SELECT DISTINCT product_id FROM import_variants"),
+    "DELETE FROM catalog_import_rows WHERE import_id = :import_id",
+]
+
+
+def parse_line(line):
+    """Turn the '|'-separated list cells of a CSV line into lists before validation."""
+    row = {key: value for key, value in line.items() if key is not None and value not in (None, "")}
+    for key in ("categories", "image"):
+        if key in row:
+            row[key] = [item for item in row[key].split("|") if item]
+    return row
+
+
+def validate(batch):
+    """Return (valid [(line_no, row)], errors [{"line": n, "errors": [...]}]) for one batch."""
+    line_numbers = [line_no for line_no, _ in batch]
+    data = [parse_line(line) for _, line in batch]
+    try:
+        return list(zip(line_numbers, rows_adapter.validate_python(data))), []
+    except ValidationError as e:
+        by_index = {}
+        for error in e.errors():
+            index, *field = error["loc"]
+            by_index.setdefault(index, []).append({"field": ".".join(map(str, field)), "message": error["msg"]})
+
+    errors = [{"line": line_numbers[index], "errors": messages} for index, messages in sorted(by_index.items())]
+    keep = [index for index in range(len(data)) if index not in by_index]
+    rows = rows_adapter.validate_python([data[index] for index in keep])
+    return [(line_numbers[index], row) for index, row in zip(keep, rows)], errors
+
+
+def copy_rows(db, import_id, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for line_no, row in rows:
+        record = [
+            import_id, line_no, row.product_name, row.details, row.brand_name, row.brand_image,
+            json.dumps(row.categories), row.variant_cost, row.count, row.discounted_cost, row.discount,
+            row.quantity, row.description, json.dumps(row.image), row.ratings,
+        ]
+        writer.writerow(["\\N" if value is None else value for value in record])
+    buffer.seek(0)
+    cursor = db.connection().connection.cursor()
+    cursor.copy_expert(
+        f"COPY catalog_import_rows ({', '.join(STAGING_COLUMNS)}) FROM STDIN WITH (FORMAT csv, NULL '\\N')", buffer)
+
+
+def set_status(db, import_id, **values):
+    db.execute(update(models.CatalogImport).where(models.CatalogImport.import_id == import_id).values(**values))
+
+
+def stage(import_id, path):
+    processed = valid = failed = 0
+    reported = []
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        lines = enumerate(csv.DictReader(f), start=2)
+        while True:
+            batch = list(islice(lines, BATCH_SIZE))
+            if not batch:
+                break
+            rows, errors = validate(batch)
+            processed += len(batch)
+            valid += len(rows)
+            failed += len(errors)
+            reported.extend(errors[:MAX_REPORTED_ERRORS - len(reported)])
+            with session_scope() as db:
+                if rows:
+                    copy_rows(db, import_id, rows)
+                set_status(db, import_id, processed_rows=processed, valid_rows=valid, error_rows=failed,
+                           errors=reported)
+
+
+def merge(import_id):
+    with session_scope() as db:
+        db.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": IMPORT_LOCK_KEY})
+        for statement in MERGE_STATEMENTS:
+            db.execute(text(statement), {"import_id": import_id})
+        # Imported costs and discounts are priced against the active rules and deals.
+        jobs.enqueue(db, "repricing.run", unique=True)
+        facets.invalidate(db)
+        set_status(db, import_id, status="done", finished_at=func.now())
+
+
+def run_import(import_id, path):
+    """Stage and merge one uploaded file; meant to run as a background task."""
+    try:
+        with session_scope() as db:
+            set_status(db, import_id, status="running")
+        stage(import_id, path)
+        with session_scope() as db:
+            set_status(db, import_id, status="merging")
+        merge(import_id)
+    except Exception as e:
+        with session_scope() as db:
+            db.execute(text("DELETE FROM catalog_import_rows WHERE import_id = :import_id"), {"import_id": import_id})
+            set_status(db, import_id, status="failed", message=repr(e), finished_at=func.now())
+        raise
+    finally:
+        os.remove(path)
@@ -0,0 +1,275 @@
+"""Cart checkout.
+
+place_order turns a customer's cart into a Bookings row in one transaction:
+
+1. lock the cart row (a double-submitted checkout waits and then finds the cart empty),
+   and quote delivery with quote_delivery(): the shop app.fulfilment picks for the address
+   fulfils the order at that shop's fee (a company with no located shops yet is charged the
+   serviceability quote, with no shop),
+2. lock the cart's variants in variant_id order, so concurrent checkouts that share variants
+   always queue on them in the same order and cannot deadlock,
+3. check stock, then decrement every line with one UPDATE; variants on flash sale are not
+   locked here but take their stock from the sharded counters in app.inventory (a sale that
+   started after the cart was read is found once the variants are locked, and a sale that
+   ended before its shards were taken from is found when they come up short; either way the
+   checkout starts over once),
+4. insert the booking with totals and the products snapshot computed by a single
+   INSERT ... SELECT over the cart lines (less the coupon, if the coupons row is active and
+   the cart company's and the total reaches its minimum; the coupon cache, which other
+   workers refresh late, is only used to display carts), and its order_items rows in the
+   same statement,
+5. empty the cart.
+
+Follow-up work (the invoice, the product summaries of the sold products) is queued with
+app.jobs in the same transaction and runs after the response.
+"""
+from sqlalchemy import text
+
+from . import coupons, fulfilment, geo, inventory, jobs, numbering, schemas, serviceability
+from .orders import ITEMS_FROM_SNAPSHOT
+
+
+class CheckoutError(Exception):
+    def __init__(self, status, message, data=None):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.data = data or {}
+
+
+class FlashSaleStarted(Exception):
+    pass
+
+
+class FlashSaleEnded(Exception):
+    pass
+
+
+CART_LINES = """
+    SELECT variant_id, SUM(count) AS quantity
+    FROM cart_items
+    WHERE cart_id = :cart_id
+    GROUP BY variant_id
+"""
+
+LOCK_CART = text(f"""
+    SELECT c.cart_id, c.company_id, co.company_name, a.pincode, pc.latitude, pc.longitude,
+           CURRENT_DATE AS order_date,
+           (SELECT json_agg(json_build_object('variant_id', l.variant_id, 'quantity', l.quantity,
+                                              'available', NOT p.is_deleted) ORDER BY l.variant_id)
+            FROM ({CART_LINES.replace(":cart_id", "c.cart_id")}) l
+            JOIN flash_sales f ON f.variant_id = l.variant_id
+            JOIN product_variants v ON v.variant_id = l.variant_id
+            JOIN products p ON p.product_id = v.product_id) AS flash_lines
+    FROM carts c
+    JOIN companies co ON co.company_id = c.company_id
+    LEFT JOIN address a ON a.address_id = :address_id AND a.user_contact = :customer_contact
+    LEFT JOIN pincodes pc ON pc.pincode = a.pincode
+    WHERE c.customer_contact = :customer_contact AND (CAST(:cart_id AS integer) IS NULL OR c.cart_id = :cart_id)
+    ORDER BY c.cart_id
+    LIMIT 1
+    FOR UPDATE OF c
+""")
+
+LOCK_VARIANTS = text(f"""
+    SELECT v.variant_id, v.product_id, v.count AS stock, l.quantity, NOT p.is_deleted AS available
+    FROM ({CART_LINES}) l
+    JOIN product_variants v ON v.variant_id = l.variant_id
+    JOIN products p ON p.product_id = v.product_id
+    WHERE v.variant_id <> ALL(CAST(:flash_ids AS bigint[]))
+    ORDER BY v.variant_id
+    FOR UPDATE OF v
+""")
+
+DECREMENT_STOCK = text(f"""
+    UPDATE product_variants v
+    SET count = v.count - l.quantity
+    FROM ({CART_LINES}) l
+    WHERE v.variant_id = l.variant_id AND v.variant_id <> ALL(CAST(:flash_ids AS bigint[]))
+""")
+
+INSERT_BOOKING = text(f"""
+    WITH booking AS (
+        INSERT INTO bookings (cart_id, user_contact, address_id, order_number, order_date, product_total,
+                              order_amount, delivery_fees, invoice_number, invoice_amount, products, company_id,
+                              shop_id, coupon_id, coupon_discount)
+        SELECT :cart_id, :customer_contact, :address_id, :order_number, CURRENT_DATE, t.product_total,
+               t.product_total - c.discount + :delivery_fees, :delivery_fees, :invoice_number,
+               t.product_total - c.discount + :delivery_fees, t.products, :company_id, CAST(:shop_id AS bigint),
+               CASE WHEN c.discount > 0 THEN CAST(:coupon_id AS integer) END, c.discount
+        FROM (
+            SELECT SUM(COALESCE(v.discounted_cost, v.variant_cost) * l.quantity) AS product_total,
+                   json_agg(json_build_object(
+                       'product_id', v.product_id,
+                       'variant_id', v.variant_id,
+                       'product_name', p.product_name,
+                       'quantity', v.quantity,
+                       'count', l.quantity,
+                       'variant_cost', v.variant_cost,
+                       'unit_price', COALESCE(v.discounted_cost, v.variant_cost),
+                       'line_total', COALESCE(v.discounted_cost, v.variant_cost) * l.quantity
+                   ) ORDER BY v.variant_id) AS products
+            FROM ({CART_LINES}) l
+            JOIN product_variants v ON v.variant_id = l.variant_id
+            JOIN products p ON p.product_id = v.product_id
+        ) t
+        LEFT JOIN coupons cp
+            ON cp.coupon_id = CAST(:coupon_id AS integer) AND cp."isActive" AND cp.company_id = :company_id
+        CROSS JOIN LATERAL (
+            SELECT CASE WHEN t.product_total >= cp.min_order_amount
+                        THEN LEAST(cp.discount_amount, t.product_total) ELSE 0 END AS discount
+        ) c
+        WHERE CAST(:coupon_id AS integer) IS NULL OR cp.coupon_id IS NOT NULL
+        RETURNING *
+    ), items AS (
+        {ITEMS_FROM_SNAPSHOT.format(source="booking")}
+    )
+    SELECT * FROM booking
+""")
+
+CLEAR_CART = text("DELETE FROM cart_items WHERE cart_id = :cart_id")
+
+CART_PRICING = text("""
+    SELECT c.company_id, co.company_name, c.delivery_fee AS planned_fee, a.pincode, pc.latitude, pc.longitude,
+           COALESCE(SUM(ci.count), 0) AS item_count,
+           COALESCE(SUM(v.variant_cost * ci.count), 0) AS cart_total,
+           COALESCE(SUM(COALESCE(v.discounted_cost, v.variant_cost) * ci.count), 0) AS payable
+    FROM carts c
+    JOIN companies co ON co.company_id = c.company_id
+    LEFT JOIN address a ON a.address_id = :address_id AND a.user_contact = :customer_contact
+    LEFT JOIN pincodes pc ON pc.pincode = a.pincode
+    LEFT JOIN cart_items ci ON ci.cart_id = c.cart_id
+    LEFT JOIN product_variants v ON v.variant_id = ci.variant_id
+    WHERE c.cart_id = :cart_id AND c.customer_contact = :customer_contact
+    GROUP BY c.cart_id, co.company_name, a.pincode, pc.latitude, pc.longitude
+""")
+
+
+def quote_delivery(db, company_id, company_name, pincode, latitude, longitude):
+    """(quote, plan) for delivering to an address; quote is None if it cannot be served.
+
+    The quote is app.serviceability's for the pincode, with the fee of the shop app.fulfilment
+    plans for the pincode's position when that is known (plan is None otherwise). A company
+    none of whose shops is located yet (shop_coordinates not parsed) keeps the serviceability
+    quote with no plan; only a company with located shops, none of them within a band, is
+    refused.
+    """
+    serviceability.service_map.ensure_loaded(db)
+    quote = serviceability.service_map.quote(company_id, pincode)
+    if quote is None or latitude is None:
+        return quote, None
+    plan = fulfilment.plan(db, company_name, latitude, longitude)
+    if plan is not None:
+        return {**quote, "fee": plan["fee"]}, plan
+    located_shops, _ = geo.shops.company(company_name)
+    return (None, None) if located_shops else (quote, None)
+
+
+def price_cart(db, customer_contact, cart_id, address_id=None):
+    """Totals of the cart with the best applicable coupon, as schemas.CheckoutScreen; None if no such cart.
+
+    Delivery is quoted with quote_delivery() to address_id when given, as checkout charges it,
+    else at the fee planned for the customer's latest address by app.fulfilment (or the default fee).
+    """
+    totals = db.execute(CART_PRICING, {"cart_id": cart_id, "customer_contact": customer_contact,
+                                       "address_id": address_id}).first()
+    if totals is None:
+        return None
+    coupons.cache.ensure_loaded(db)
+    coupon, coupon_discount = coupons.cache.best_for(totals.company_id, totals.payable)
+    quote = {"fee": totals.planned_fee if totals.planned_fee is not None else serviceability.DEFAULT_FEE,
+             "eta_minutes": None}
+    if totals.pincode is not None:
+        quote, _ = quote_delivery(db, totals.company_id, totals.company_name, totals.pincode, totals.latitude,
+                                  totals.longitude)
+    delivery = quote["fee"] if quote and totals.item_count else 0
+    return schemas.CheckoutScreen(
+        cart_item_count=totals.item_count,
+        cart_total=round(totals.cart_total, 2),
+        discount_sum=round(totals.cart_total - totals.payable, 2),
+        coupon_applied=coupon["coupon_name"] if coupon else None,
+        coupon_id=coupon["coupon_id"] if coupon else None,
+        coupon_discount=coupon_discount,
+        delivery_charges=delivery,
+        serviceable=quote is not None,
+        delivery_eta_minutes=quote["eta_minutes"] if quote else None,
+        total_bill=round(totals.payable - coupon_discount + delivery, 2),
+    )
+
+
+def place_order(db, customer_contact, address_id, cart_id=None, coupon_id=None):
+    """Check out the customer's cart and commit. Returns the bookings row; raises CheckoutError."""
+    try:
+        return _place_order(db, customer_contact, address_id, cart_id, coupon_id)
+    except (FlashSaleStarted, FlashSaleEnded):
+        pass
+    try:
+        return _place_order(db, customer_contact, address_id, cart_id, coupon_id)
+    except (FlashSaleStarted, FlashSaleEnded):
+        raise CheckoutError(409, "Stock of some items is changing, please try again")
+
+
+def _place_order(db, customer_contact, address_id, cart_id, coupon_id):
+    try:
+        cart = db.execute(LOCK_CART, {"customer_contact": customer_contact, "address_id": address_id,
+                                      "cart_id": cart_id}).first()
+        if cart is None:
+            raise CheckoutError(404, "Cart not found")
+        if cart.pincode is None:
+            raise CheckoutError(404, "Address not found")
+        delivery, plan = quote_delivery(db, cart.company_id, cart.company_name, cart.pincode, cart.latitude,
+                                        cart.longitude)
+        if delivery is None:
+            raise CheckoutError(400, "Delivery is not available to this address")
+        flash_lines = cart.flash_lines or []
+        params = {"cart_id": cart.cart_id, "company_id": cart.company_id, "customer_contact": customer_contact,
+                  "address_id": address_id, "flash_ids": [line["variant_id"] for line in flash_lines]}
+        lines = db.execute(LOCK_VARIANTS, params).all()
+        if inventory.on_sale(db, [line.variant_id for line in lines]):
+            # Their stock moved to the shards after LOCK_CART read flash_lines.
+            raise FlashSaleStarted()
+        if not lines and not flash_lines:
+            raise CheckoutError(400, "Cart is empty")
+        unavailable = [line.variant_id for line in lines if not line.available]
+        unavailable += [line["variant_id"] for line in flash_lines if not line["available"]]
+        short = [{"variant_id": line.variant_id, "requested": line.quantity, "available": line.stock}
+                 for line in lines if line.available and line.stock < line.quantity]
+        if unavailable or short:
+            raise CheckoutError(409, "Some items are out of stock",
+                                {"unavailable": unavailable, "out_of_stock": short})
+
+        db.execute(DECREMENT_STOCK, params)
+        for line in flash_lines:
+            try:
+                inventory.take(db, line["variant_id"], line["quantity"])
+            except inventory.OutOfStock as e:
+                if not inventory.on_sale(db, [e.variant_id]):
+                    # The sale ended after LOCK_CART read flash_lines; its stock is back in product_variants.
+                    raise FlashSaleEnded()
+                raise CheckoutError(409, "Some items are out of stock", {
+                    "unavailable": [],
+                    "out_of_stock": [{"variant_id": e.variant_id, "requested": e.requested,
+                                      "available": e.available}],
+                })
+        order_number, invoice_number = numbering.new_order_numbers(db, cart.company_id, cart.order_date)
+        booking = db.execute(INSERT_BOOKING, {
+            **params, "order_number": order_number, "invoice_number": invoice_number, "delivery_fees": delivery["fee"],
+            "shop_id": plan["shop_id"] if plan else None, "coupon_id": coupon_id,
+        }).mappings().first()
+        if booking is None:
+            # INSERT_BOOKING found no active coupon coupon_id of the cart's company.
+            raise CheckoutError(400, "Coupon is not valid")
+        db.execute(CLEAR_CART, params)
+        jobs.enqueue(db, "invoices.render", {"order_id": booking["order_id"]})
+        if lines:
+            # After commit, so checkouts never wait on each other's summary rows; flash sale
+            # stock reaches the summaries through inventory.reconcile.
+            jobs.enqueue(db, "product_summary.refresh",
+                         {"product_ids": sorted({line.product_id for line in lines})})
+        if flash_lines:
+            jobs.enqueue(db, "inventory.reconcile", delay=5, unique=True)
+        db.commit()
+        return dict(booking)
+    except Exception:
+        db.rollback()
+        raise
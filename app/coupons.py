@@ -0,0 +1,96 @@
+"""Coupon applicability, answered from memory.
+
+Every coupon belongs to a company and applies only to that company's carts. Each company's
+active coupons are held sorted by min_order_amount together with a running "best so far"
+array, so the best coupon for a cart total is one bisect: among the coupons whose minimum
+the total reaches, the one with the largest discount (capped at the total). Pricing a cart
+therefore needs no coupon query. Coupons created before they had a company have no
+company_id and apply to no cart.
+
+The cache is loaded on first use. Coupon writes through the API reload it in the worker
+that made them; every REFRESH_SECONDS each worker compares the table's (count, max
+updated_at) with what it loaded and reloads on a difference.
+"""
+import bisect
+import threading
+
+from sqlalchemy import text
+
+from . import scheduler
+from .database import session_scope
+
+REFRESH_SECONDS = 30
+
+ACTIVE_COUPONS = text("""
+    SELECT coupon_id, company_id, coupon_name, coupon_image, description, discount_amount, min_order_amount
+    FROM coupons
+    WHERE "isActive"
+    ORDER BY company_id, min_order_amount, discount_amount DESC, coupon_id
+""")
+
+VERSION = text("SELECT COUNT(*), MAX(updated_at) FROM coupons")
+
+
+class CouponCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        self.loaded = False
+        self.version = None
+        self.by_id = {}
+        self.by_company = {}  # company_id -> (minimums, best_upto)
+
+    def load(self, db):
+        version = tuple(db.execute(VERSION).one())
+        coupons = [dict(row) for row in db.execute(ACTIVE_COUPONS).mappings()]
+        by_company = {}
+        for coupon in coupons:
+            if coupon["company_id"] is None:
+                continue
+            minimums, best_upto = by_company.setdefault(coupon["company_id"], ([], []))
+            best = best_upto[-1] if best_upto else None
+            if best is None or coupon["discount_amount"] > best["discount_amount"]:
+                best = coupon
+            minimums.append(coupon["min_order_amount"])
+            best_upto.append(best)
+        with self._lock:
+            self.by_id = {coupon["coupon_id"]: coupon for coupon in coupons}
+            self.by_company = by_company
+            self.version, self.loaded = version, True
+
+    def ensure_loaded(self, db):
+        if not self.loaded:
+            self.load(db)
+
+    def for_company(self, company_id):
+        """The company's active coupons."""
+        return [coupon for coupon in self.by_id.values() if coupon["company_id"] == company_id]
+
+    def get(self, company_id, coupon_id):
+        """The coupon if it is active and belongs to the company, else None."""
+        coupon = self.by_id.get(coupon_id)
+        return coupon if coupon is not None and coupon["company_id"] == company_id else None
+
+    def best_for(self, company_id, total):
+        """(coupon, discount) of the company's best coupon for a cart total, or (None, 0)."""
+        with self._lock:
+            minimums, best_upto = self.by_company.get(company_id, ([], []))
+            position = bisect.bisect_right(minimums, total)
+            coupon = best_upto[position - 1] if position else None
+        if coupon is None or total <= 0:
+            return None, 0.0
+        return coupon, round(min(coupon["discount_amount"], total), 2)
+
+
+cache = CouponCache()
+
+
+@scheduler.every(REFRESH_SECONDS)
+def refresh():
+    if not cache.loaded:
+        return
+    with session_scope() as db:
+        if tuple(db.execute(VERSION).one()) != cache.version:
+            cache.load(db)
@@ -0,0 +1,18 @@
+"""Shared single-statement write helpers."""
+from sqlalchemy import select, update
+
+
+def update_returning(db, model, values, *criteria):
+    """UPDATE model SET values WHERE criteria RETURNING the row, in one round trip.
+
+    Returns None when no row matched. The returned object is detached from the session so it
+    stays loaded after the caller commits and can be returned as-is without another SELECT.
+    """
+    if values:
+        statement = update(model).where(*criteria).values(**values).returning(model)
+        row = db.execute(statement, execution_options={"synchronize_session": False}).scalars().first()
+    else:
+        row = db.execute(select(model).where(*criteria)).scalars().first()
+    if row is not None:
+        db.expunge(row)
+    return row
@@ -0,0 +1,211 @@
+"""Active deals, answered from memory.
+
+DealIndex keeps every deal together with a heap of its activation (deal_start) and
+expiration (deal_end) events. Reads first sweep the clock forward, popping the events that
+are due (O(log n) each, and each event is popped once), then return the per-shop or
+per-company active set directly, so "active deals now" never touches the database.
+
+The index is loaded on first use and kept current by refresh(): every REFRESH_SECONDS it
+reads the deals whose updated_at moved since the last refresh, and every RELOAD_SECONDS (or
+when the deal count no longer matches, i.e. a deal was deleted elsewhere) it reloads
+everything, which also picks up product and price changes in the cached deal payloads.
+Deal writes through the API update the local index immediately; other workers see them at
+their next refresh.
+"""
+import datetime
+import heapq
+import threading
+import time
+
+from sqlalchemy import text
+
+from . import scheduler
+from .database import session_scope
+from .product_summary import VARIANT_JSON
+
+REFRESH_SECONDS = 15
+RELOAD_SECONDS = 300
+# Rows committed shortly after a refresh can carry an updated_at just before its high-water
+# mark; re-reading this much overlap each time is cheap and upserts are idempotent.
+REFRESH_OVERLAP = datetime.timedelta(seconds=5)
+
+START, END = 1, 0  # at equal times an expiration is applied before an activation
+
+DEALS_QUERY = f"""
+    SELECT d.deal_id, d.shop_id, d.product_id, d.deal_name, d.deal_type, d.deal_description, d.deal_discount,
+           d.deal_start, d.deal_end, d.updated_at, s.company_name, s.shop_name,
+           p.product_name, p.details,
+           (SELECT {VARIANT_JSON}
+            FROM product_variants v WHERE v.product_id = d.product_id
+            ORDER BY v.variant_id LIMIT 1) AS variant
+    FROM deals d
+    JOIN shops s ON s.shop_id = d.shop_id
+    JOIN products p ON p.product_id = d.product_id AND NOT p.is_deleted
+"""
+
+ALL_DEALS = text(DEALS_QUERY)
+ONE_DEAL = text(DEALS_QUERY + " WHERE d.deal_id = :deal_id")
+CHANGED_DEALS = text(DEALS_QUERY + " WHERE d.updated_at > :since")
+DEAL_COUNT = text("SELECT COUNT(*) FROM deals d JOIN products p ON p.product_id = d.product_id AND NOT p.is_deleted")
+
+
+class DealIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        self.deals = {}
+        self.versions = {}
+        self.events = []
+        self.by_shop = {}
+        self.by_company = {}
+        self.clock = None
+        self.high_water = None
+        self.loaded_at = None
+        self.refreshed_at = None
+
+    # -- maintenance ---------------------------------------------------------------
+
+    def _activate(self, deal):
+        self.by_shop.setdefault(deal["shop_id"], {})[deal["deal_id"]] = deal
+        self.by_company.setdefault(deal["company_name"], {})[deal["deal_id"]] = deal
+
+    def _deactivate(self, deal):
+        self.by_shop.get(deal["shop_id"], {}).pop(deal["deal_id"], None)
+        self.by_company.get(deal["company_name"], {}).pop(deal["deal_id"], None)
+
+    def _put(self, deal):
+        old = self.deals.pop(deal["deal_id"], None)
+        if old is not None:
+            self._deactivate(old)
+        version = self.versions.get(deal["deal_id"], 0) + 1
+        self.versions[deal["deal_id"]] = version
+        self.deals[deal["deal_id"]] = deal
+        if self.clock is not None and deal["deal_start"] <= self.clock < deal["deal_end"]:
+            self._activate(deal)
+        elif self.clock is None or deal["deal_start"] > self.clock:
+            heapq.heappush(self.events, (deal["deal_start"], START, deal["deal_id"], version))
+        if self.clock is None or deal["deal_end"] > self.clock:
+            heapq.heappush(self.events, (deal["deal_end"], END, deal["deal_id"], version))
+
+    def _remove(self, deal_id):
+        deal = self.deals.pop(deal_id, None)
+        if deal is not None:
+            self._deactivate(deal)
+        self.versions[deal_id] = self.versions.get(deal_id, 0) + 1
+
+    def _advance(self, now):
+        if self.clock is not None and now < self.clock:
+            # The clock went backwards (e.g. a tz change); rebuild the sweep from scratch.
+            deals = list(self.deals.values())
+            self.deals, self.events, self.by_shop, self.by_company, self.clock = {}, [], {}, {}, None
+            for deal in deals:
+                self._put(deal)
+        while self.events and self.events[0][0] <= now:
+            _, kind, deal_id, version = heapq.heappop(self.events)
+            if self.versions.get(deal_id) != version:
+                continue
+            deal = self.deals[deal_id]
+            if kind == START and deal["deal_end"] > now:
+                self._activate(deal)
+            elif kind == END:
+                self._deactivate(deal)
+        self.clock = now
+        if len(self.events) > 4 * len(self.deals) + 1000:
+            self.events = [event for event in self.events if self.versions.get(event[2]) == event[3]]
+            heapq.heapify(self.events)
+
+    def upsert(self, deal):
+        with self._lock:
+            self._put(deal)
+
+    def remove(self, deal_id):
+        with self._lock:
+            self._remove(deal_id)
+
+    def load(self, rows):
+        with self._lock:
+            self.clear()
+            for row in rows:
+                self._put(as_deal(row))
+            self.high_water = max((deal["updated_at"] for deal in self.deals.values()), default=None)
+            self.loaded_at = self.refreshed_at = time.monotonic()
+
+    def apply_changes(self, rows):
+        with self._lock:
+            for row in rows:
+                deal = as_deal(row)
+                self._put(deal)
+                if self.high_water is None or deal["updated_at"] > self.high_water:
+                    self.high_water = deal["updated_at"]
+            self.refreshed_at = time.monotonic()
+
+    # -- queries -------------------------------------------------------------------
+
+    def _active(self, attribute, key, now):
+        with self._lock:
+            self._advance(now or datetime.datetime.now())
+            deals = list(getattr(self, attribute).get(key, {}).values())
+        return sorted(deals, key=lambda deal: (-deal["deal_discount"], deal["deal_end"], deal["deal_id"]))
+
+    def for_shop(self, shop_id, now=None):
+        return self._active("by_shop", shop_id, now)
+
+    def for_company(self, company_name, now=None):
+        return self._active("by_company", company_name, now)
+
+    def all_active(self, now=None):
+        with self._lock:
+            self._advance(now or datetime.datetime.now())
+            deals = [deal for active in self.by_shop.values() for deal in active.values()]
+        return sorted(deals, key=lambda deal: (-deal["deal_discount"], deal["deal_end"], deal["deal_id"]))
+
+
+def as_deal(row):
+    deal = dict(row)
+    variant = deal.pop("variant", None)
+    deal["variants"] = [variant] if variant else []
+    return deal
+
+
+def public(deal):
+    return {key: value for key, value in deal.items() if key not in ("updated_at", "company_name")}
+
+
+index = DealIndex()
+
+
+def reindex(db, deal_id):
+    """Re-read one deal after a local write and put it (or its removal) into the index."""
+    row = db.execute(ONE_DEAL, {"deal_id": deal_id}).mappings().first()
+    if row is None:
+        index.remove(deal_id)
+        return None
+    deal = as_deal(row)
+    index.upsert(deal)
+    return public(deal)
+
+
+def ensure_loaded(db):
+    if index.loaded_at is None:
+        index.load(db.execute(ALL_DEALS).mappings())
+
+
+def refresh(db):
+    now = time.monotonic()
+    if index.loaded_at is None or now - index.loaded_at > RELOAD_SECONDS:
+        index.load(db.execute(ALL_DEALS).mappings())
+        return
+    since = index.high_water - REFRESH_OVERLAP if index.high_water else datetime.datetime.min
+    index.apply_changes(db.execute(CHANGED_DEALS, {"since": since}).mappings())
+    if db.execute(DEAL_COUNT).scalar() != len(index.deals):
+        index.load(db.execute(ALL_DEALS).mappings())
+
+
+@scheduler.every(REFRESH_SECONDS)
+def refresh_periodically():
+    if index.loaded_at is None:
+        return
+    with session_scope() as db:
+        refresh(db)
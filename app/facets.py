@@ -0,0 +1,295 @@
+"""Faceted product filtering over in-memory bitsets.
+
+Every live product gets a dense ordinal. For each facet value (a brand, a category, a price
+band, a "discount of at least" threshold, a "rating of at least" threshold) the index holds
+a bitset over the ordinals, packed eight products to a byte. Brands and categories filter
+by OR-ing the selected values' bitsets; price, discount and rating filter by comparing the
+per-ordinal arrays (lowest variant price, best discount, best rating). The page is the AND of
+those masks. Facet counts are computed the usual way for multi-select facets: each facet
+is counted against the other facets' filters only, by AND-ing its stacked value bitsets with
+that mask and summing a 16-bit popcount table lookup. A query is a few vectorized byte
+operations, with no SQL.
+
+The index is loaded on first use. Catalog writes through the API call update() with the
+products they touched; only those products' bits are rewritten. Bulk writes (catalog
+imports, repricing), which usually run in a job worker, call invalidate() in their
+transaction: it bumps the "facets" row of cache_versions, and every worker compares that
+with the version it loaded every REFRESH_SECONDS and reloads on a difference. Every worker
+also reloads every RELOAD_SECONDS to pick up the API writes of other workers.
+
+    python -m app.facets --benchmark 100000   # time filtered queries over synthetic products
+"""
+import argparse
+import sys
+import threading
+import time
+
+import numpy as np
+from sqlalchemy import text
+
+from . import scheduler
+from .database import session_scope
+from .product_summary import DEFAULT_VARIANT, listing
+
+RELOAD_SECONDS = 300
+REFRESH_SECONDS = 30
+PRICE_BANDS = [0, 100, 250, 500, 1000, 2500]  # lower edges; the last band is open-ended
+DISCOUNT_THRESHOLDS = [10, 25, 50]
+RATING_THRESHOLDS = [4, 3, 2]
+FACETS = ("brand", "category", "price", "discount", "rating")
+POPCOUNT = np.array([bin(word).count("1") for word in range(1 << 16)], dtype=np.uint8)  # bits set per uint16
+
+PRODUCTS_QUERY = f"""
+    SELECT p.product_id, p.brand_id, p.product_name, p.details, s.min_cost AS price, s.best_discount AS discount,
+           (SELECT MAX(v.ratings) FROM product_variants v WHERE v.product_id = p.product_id) AS rating,
+           (SELECT array_agg(pc.category_id) FROM product_categories pc WHERE pc.product_id = p.product_id)
+               AS category_ids,
+           {DEFAULT_VARIANT} AS variant
+    FROM products p
+    LEFT JOIN product_summaries s ON s.product_id = p.product_id
+    WHERE NOT p.is_deleted {{condition}}
+    ORDER BY p.product_id
+"""
+
+ALL_PRODUCTS = text(PRODUCTS_QUERY.format(condition=""))
+SOME_PRODUCTS = text(PRODUCTS_QUERY.format(condition="AND p.product_id = ANY(:ids)"))
+
+VERSION = text("SELECT version FROM cache_versions WHERE name = 'facets'")
+
+BUMP_VERSION = text("""
+    INSERT INTO cache_versions (name, version) VALUES ('facets', 1)
+    ON CONFLICT (name) DO UPDATE SET version = cache_versions.version + 1, updated_at = now()
+""")
+
+
+def price_band(price):
+    return max(0, int(np.searchsorted(PRICE_BANDS, price, side="right")) - 1)
+
+
+def band_label(band):
+    upper = PRICE_BANDS[band + 1] if band + 1 < len(PRICE_BANDS) else None
+    return f"{PRICE_BANDS[band]}-{upper}" if upper is not None else f"{PRICE_BANDS[band]}+"
+
+
+def facet_values(row):
+    """The (facet, value) keys a product row sets bits for."""
+    keys = {("brand", row["brand_id"])}
+    keys.update(("category", category_id) for category_id in row["category_ids"] or ())
+    if row["price"] is not None:
+        keys.add(("price", price_band(row["price"])))
+    keys.update(("discount", threshold) for threshold in DISCOUNT_THRESHOLDS if (row["discount"] or 0) >= threshold)
+    keys.update(("rating", threshold) for threshold in RATING_THRESHOLDS
+                if row["rating"] is not None and row["rating"] >= threshold)
+    return keys
+
+
+class FacetIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        self.loaded_at = None
+        self.version = None
+        self.stale = False
+        self.capacity = 0
+        self.ordinals = {}
+        self.payloads = []
+        self.keys = []
+        self.bitsets = {}
+        self.live = np.zeros(0, dtype=np.uint8)
+        self.price = self.discount = self.rating = np.zeros(0)
+        self._stacks = {}
+
+    # -- maintenance ---------------------------------------------------------------
+
+    def _set(self, ordinal, row):
+        byte, bit = ordinal >> 3, np.uint8(0x80 >> (ordinal & 7))
+        for key in self.keys[ordinal]:
+            self.bitsets[key][byte] &= ~bit
+        self.keys[ordinal] = set()
+        self.live[byte] &= ~bit
+        self.price[ordinal] = self.discount[ordinal] = self.rating[ordinal] = np.nan
+        self.payloads[ordinal] = None
+        if row is None:
+            return
+        self.keys[ordinal] = facet_values(row)
+        for key in self.keys[ordinal]:
+            if key not in self.bitsets:
+                self.bitsets[key] = np.zeros(self.capacity // 8, dtype=np.uint8)
+            self.bitsets[key][byte] |= bit
+        self.live[byte] |= bit
+        self.price[ordinal] = np.nan if row["price"] is None else row["price"]
+        self.discount[ordinal] = row["discount"] or 0
+        self.rating[ordinal] = np.nan if row["rating"] is None else row["rating"]
+        self.payloads[ordinal] = listing(row["product_id"], row)
+
+    def load(self, rows, version=None):
+        rows = list(rows)
+        with self._lock:
+            self.clear()
+            self.version = version
+            self.capacity = max(1024, -(-2 * len(rows) // 64) * 64)  # room to grow, in whole uint16 words
+            self.live = np.zeros(self.capacity // 8, dtype=np.uint8)
+            self.price, self.discount, self.rating = (np.full(self.capacity, np.nan) for _ in range(3))
+            self.payloads, self.keys = [None] * self.capacity, [set() for _ in range(self.capacity)]
+            for ordinal, row in enumerate(rows):
+                self.ordinals[row["product_id"]] = ordinal
+                self._set(ordinal, row)
+            self.loaded_at = time.monotonic()
+
+    def apply(self, product_ids, rows):
+        """Rewrite the bits of product_ids from their fresh rows (missing rows: deleted). False if full."""
+        rows = {row["product_id"]: row for row in rows}
+        with self._lock:
+            if len(self.ordinals) + len(set(rows) - set(self.ordinals)) > self.capacity:
+                return False
+            for product_id in product_ids:
+                ordinal = self.ordinals.get(product_id)
+                if ordinal is None:
+                    if product_id not in rows:
+                        continue
+                    ordinal = self.ordinals[product_id] = len(self.ordinals)
+                self._set(ordinal, rows.get(product_id))
+            self._stacks = {}
+        return True
+
+    def mark_stale(self):
+        self.stale = True
+
+    # -- queries -------------------------------------------------------------------
+
+    def _stack(self, facet):
+        """(values, 2-D array of their bitsets) of one facet, rebuilt after updates."""
+        if facet not in self._stacks:
+            values = sorted(value for name, value in self.bitsets if name == facet)
+            matrix = np.array([self.bitsets[(facet, value)] for value in values], dtype=np.uint8).reshape(
+                len(values), self.capacity // 8)
+            self._stacks[facet] = (values, matrix)
+        return self._stacks[facet]
+
+    def _any(self, facet, values):
+        mask = np.zeros(self.capacity // 8, dtype=np.uint8)
+        for value in values:
+            bitset = self.bitsets.get((facet, value))
+            if bitset is not None:
+                mask |= bitset
+        return mask
+
+    def search(self, brand_ids=(), category_ids=(), min_price=None, max_price=None, min_discount=None,
+               min_rating=None, offset=0, limit=20):
+        """{"total", "products" (one page, in ordinal order), "facets" (counts per facet value)}."""
+        with self._lock:
+            masks = {}
+            if brand_ids:
+                masks["brand"] = self._any("brand", brand_ids)
+            if category_ids:
+                masks["category"] = self._any("category", category_ids)
+            if min_price is not None or max_price is not None:
+                within = ~np.isnan(self.price)
+                if min_price is not None:
+                    within &= self.price >= min_price
+                if max_price is not None:
+                    within &= self.price <= max_price
+                masks["price"] = np.packbits(within)
+            if min_discount is not None:
+                masks["discount"] = np.packbits(self.discount >= min_discount)
+            if min_rating is not None:
+                masks["rating"] = np.packbits(self.rating >= min_rating)
+
+            counts = {}
+            for facet in FACETS:
+                base = self.live.copy()
+                for other, mask in masks.items():
+                    if other != facet:
+                        base &= mask
+                values, matrix = self._stack(facet)
+                totals = POPCOUNT[(matrix & base).view(np.uint16)].sum(axis=1, dtype=np.int64) if values else []
+                counts[facet] = {value: int(total) for value, total in zip(values, totals) if total}
+
+            selected = self.live.copy()
+            for mask in masks.values():
+                selected &= mask
+            ordinals = np.flatnonzero(np.unpackbits(selected))
+            page = [self.payloads[ordinal] for ordinal in ordinals[offset:offset + limit].tolist()]
+
+        counts["price"] = {band_label(band): total for band, total in counts["price"].items()}
+        return {"total": len(ordinals), "products": page, "facets": counts}
+
+
+index = FacetIndex()
+
+
+def load(db):
+    # Read the version first, so a bump landing in between is reloaded.
+    version = db.execute(VERSION).scalar()
+    index.load(db.execute(ALL_PRODUCTS).mappings(), version)
+
+
+def ensure_loaded(db):
+    if index.loaded_at is None or index.stale:
+        load(db)
+
+
+def invalidate(db):
+    """Make every worker reload its index once db's transaction, a bulk catalog write, commits."""
+    db.execute(BUMP_VERSION)
+    index.mark_stale()
+
+
+def update(db, product_ids):
+    """Re-read product_ids after a local catalog write and rewrite their bits."""
+    if index.loaded_at is None or not product_ids:
+        return
+    product_ids = list(set(product_ids))
+    if not index.apply(product_ids, db.execute(SOME_PRODUCTS, {"ids": product_ids}).mappings().all()):
+        index.mark_stale()
+
+
+@scheduler.every(REFRESH_SECONDS)
+def refresh():
+    if index.loaded_at is None:
+        return
+    with session_scope() as db:
+        if db.execute(VERSION).scalar() != index.version:
+            load(db)
+
+
+@scheduler.every(RELOAD_SECONDS)
+def reload_periodically():
+    if index.loaded_at is None:
+        return
+    with session_scope() as db:
+        load(db)
+
+
+def benchmark(n, queries=200, seed=0):
+    """Average seconds per filtered query (with facet counts) over n synthetic products."""
+    rng = np.random.default_rng(seed)
+    rows = [{"product_id": product_id, "brand_id": int(brand), "category_ids": [int(category)],
+             "price": float(price), "discount": int(discount), "rating": int(rating),
+             "product_name": f"product {product_id}", "details": None, "variant": None}
+            for product_id, brand, category, price, discount, rating in zip(
+                range(1, n + 1), rng.integers(1, 200, n), rng.integers(1, 50, n), rng.uniform(10, 5000, n),
+                rng.integers(0, 70, n), rng.integers(1, 6, n))]
+    benchmark_index = FacetIndex()
+    benchmark_index.load(rows)
+    started = time.perf_counter()
+    for brand, category, min_price in zip(rng.integers(1, 200, queries).tolist(), rng.integers(1, 50, queries).tolist(),
+                                          rng.uniform(0, 1000, queries).tolist()):
+        benchmark_index.search(brand_ids=[brand, brand + 1], category_ids=[category], min_price=min_price, min_rating=3)
+    return (time.perf_counter() - started) / queries
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the faceted product filter index.")
+    parser.add_argument("--benchmark", type=int, metavar="N", required=True,
+                        help="time filtered queries over N synthetic products")
+    args = parser.parse_args(argv)
+    print(f"filtered query with facet counts over {args.benchmark} products in "
+          f"{benchmark(args.benchmark) * 1000:.3f}ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
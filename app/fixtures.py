@@ -0,0 +1,167 @@
+"""Bulk fixture loader.
+
+    python -m app.fixtures fixtures/demo.yaml
+    python -m app.fixtures --truncate fixtures/            # reset an environment
+    python -m app.fixtures --parallel 4 big_catalog/       # load independent tables concurrently
+
+YAML and JSON files map table names to lists of rows. A CSV file holds the rows of the
+table named after the file (products.csv -> products). Tables are loaded parent-first with
+multi-row INSERTs inside one transaction, then the serial sequences are moved past the
+highest loaded id. With --parallel, tables that do not depend on each other are loaded on
+separate connections, so each dependency level commits on its own.
+"""
+import argparse
+import csv
+import datetime
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import yaml
+from sqlalchemy import Boolean, Date, DateTime, Float, Integer, JSON, text
+
+from . import models
+from .database import engine, sync_schema
+
+CHUNK_SIZE = 1000
+
+
+def read_fixture(path):
+    """Return {table_name: [row, ...]} for one fixture file."""
+    ext = os.path.splitext(path)[1].lower()
+    with open(path, newline="") as f:
+        if ext in (".yaml", ".yml"):
+            return yaml.safe_load(f) or {}
+        if ext == ".json":
+            return json.load(f)
+        if ext == ".csv":
+            return {os.path.splitext(os.path.basename(path))[0]: list(csv.DictReader(f))}
+    raise ValueError(f"Unsupported fixture format: {path}")
+
+
+def collect(paths):
+    tables = {}
+    for path in paths:
+        files = sorted(os.path.join(path, name) for name in os.listdir(path)) if os.path.isdir(path) else [path]
+        for file in files:
+            for table, rows in read_fixture(file).items():
+                tables.setdefault(table, []).extend(rows)
+    return tables
+
+
+def coerce(column, value):
+    """CSV cells arrive as strings; YAML/JSON values are already typed and pass through."""
+    if not isinstance(value, str):
+        return value
+    if value == "":
+        return None
+    if isinstance(column.type, JSON):
+        return json.loads(value)
+    if isinstance(column.type, Boolean):
+        return value.strip().lower() in ("1", "true", "t", "yes", "y")
+    if isinstance(column.type, Integer):
+        return int(value)
+    if isinstance(column.type, Float):
+        return float(value)
+    if isinstance(column.type, DateTime):
+        return datetime.datetime.fromisoformat(value)
+    if isinstance(column.type, Date):
+        return datetime.date.fromisoformat(value)
+    return value
+
+
+def prepare_rows(table, rows):
+    unknown = {key for row in rows for key in row} - set(table.columns.keys())
+    if unknown:
+        raise ValueError(f"{table.name}: unknown columns {sorted(unknown)}")
+    return [{key: coerce(table.columns[key], value) for key, value in row.items()} for row in rows]
+
+
+def load_table(conn, table, rows):
+    # Rows are grouped by column set so every chunk is one multi-row INSERT ... VALUES.
+    by_columns = {}
+    for row in rows:
+        by_columns.setdefault(tuple(sorted(row)), []).append(row)
+    for group in by_columns.values():
+        for start in range(0, len(group), CHUNK_SIZE):
+            conn.execute(table.insert().values(group[start:start + CHUNK_SIZE]))
+
+
+def reset_sequences(conn, table):
+    for column in table.primary_key.columns:
+        if isinstance(column.type, Integer) and column.autoincrement in (True, "auto"):
+            conn.execute(text(
+                f"SELECT setval(pg_get_serial_sequence(:table, :column), "
+                f"COALESCE((SELECT MAX({column.name}) FROM {table.name}), 0) + 1, false)"
+            ), {"table": table.name, "column": column.name})
+
+
+def dependency_levels(tables):
+    """Group the tables so that every table comes after the tables it references."""
+    levels, placed = [], set()
+    remaining = [table for table in models.Base.metadata.sorted_tables if table.name in tables]
+    while remaining:
+        level = [table for table in remaining
+                 if all(fk.column.table.name in placed or fk.column.table.name not in tables or fk.column.table is table
+                        for fk in table.foreign_keys)]
+        levels.append(level)
+        placed.update(table.name for table in level)
+        remaining = [table for table in remaining if table not in level]
+    return levels
+
+
+def truncate(conn, tables):
+    names = ", ".join(f'"{name}"' for name in tables)
+    conn.execute(text(f"TRUNCATE {names} RESTART IDENTITY CASCADE"))
+
+
+def load(paths, truncate_first=False, parallel=1):
+    fixtures = collect(paths)
+    unknown = set(fixtures) - set(models.Base.metadata.tables)
+    if unknown:
+        raise ValueError(f"Unknown tables: {sorted(unknown)}")
+    rows = {name: prepare_rows(models.Base.metadata.tables[name], data) for name, data in fixtures.items()}
+    levels = dependency_levels(rows)
+
+    if parallel <= 1:
+        with engine.begin() as conn:
+            if truncate_first:
+                truncate(conn, rows)
+            for level in levels:
+                for table in level:
+                    load_table(conn, table, rows[table.name])
+                    reset_sequences(conn, table)
+        return {name: len(data) for name, data in rows.items()}
+
+    def load_one(table):
+        with engine.begin() as conn:
+            load_table(conn, table, rows[table.name])
+            reset_sequences(conn, table)
+
+    if truncate_first:
+        with engine.begin() as conn:
+            truncate(conn, rows)
+    with ThreadPoolExecutor(max_workers=parallel) as pool:
+        for level in levels:
+            list(pool.map(load_one, level))
+    return {name: len(data) for name, data in rows.items()}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk-load YAML/JSON/CSV fixtures into the database.")
+    parser.add_argument("paths", nargs="+", help="fixture files or directories")
+    parser.add_argument("--truncate", action="store_true", help="empty the fixture tables before loading")
+    parser.add_argument("--parallel", type=int, default=1,
+                        help="load independent tables on this many connections (one transaction per table)")
+    args = parser.parse_args(argv)
+
+    sync_schema(engine)
+    counts = load(args.paths, truncate_first=args.truncate, parallel=args.parallel)
+    for name, count in counts.items():
+        print(f"{name}: {count} rows")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,181 @@
+"""Fulfilment planning: which shop delivers a cart, how far and for what fee.
+
+Any available shop of the cart's company can fulfil it (stock is per variant, not per
+shop). A cart is planned by computing the haversine distance from its delivery position
+to every candidate shop at once, pricing each distance with the delivery bands of
+app.serviceability, and taking the cheapest shop (the nearest among equally cheap ones).
+Shops beyond the last band cannot deliver. plan_batch() does this for a whole array of
+carts of one company with a carts x shops distance matrix, so re-planning thousands of
+carts is a few NumPy operations.
+
+Checkout calls plan() for the order's address and records the chosen shop on the booking.
+replan() refreshes the stored plan (carts.shop_id, delivery_km, delivery_fee) of every
+non-empty cart against its customer's latest address; /checkoutScreen quotes that fee when
+no address is given. It runs every REPLAN_SECONDS, as a "fulfilment.replan" job, or by hand:
+
+    python -m app.fulfilment
+    python -m app.fulfilment --benchmark 10000    # time planning 10000 carts against 200 shops
+"""
+import argparse
+import sys
+import time
+
+import numpy as np
+from sqlalchemy import text
+
+from . import geo, jobs, scheduler, serviceability
+from .database import engine, session_scope
+
+REPLAN_SECONDS = 600
+REPLAN_BATCH = 2000
+REPLAN_LOCK_KEY = 72_046
+DISTANCE_CELLS = 4_000_000  # cart x shop distances computed at once
+
+PLANNABLE_CARTS = text("""
+    SELECT c.cart_id, co.company_name, pc.latitude, pc.longitude
+    FROM carts c
+    JOIN companies co ON co.company_id = c.company_id
+    CROSS JOIN LATERAL (
+        SELECT a.pincode FROM address a
+        WHERE a.user_contact = c.customer_contact
+        ORDER BY a.address_id DESC
+        LIMIT 1
+    ) a
+    JOIN pincodes pc ON pc.pincode = a.pincode
+    WHERE EXISTS (SELECT 1 FROM cart_items ci WHERE ci.cart_id = c.cart_id)
+    ORDER BY co.company_name
+""")
+
+WRITE_PLANS = text("""
+    UPDATE carts c
+    SET shop_id = u.shop_id, delivery_km = u.delivery_km, delivery_fee = u.delivery_fee, planned_at = now()
+    FROM unnest(CAST(:ids AS integer[]), CAST(:shop_ids AS bigint[]), CAST(:kms AS double precision[]),
+                CAST(:fees AS double precision[])) AS u(cart_id, shop_id, delivery_km, delivery_fee)
+    WHERE c.cart_id = u.cart_id
+""")
+
+
+def band_fees(distances, bands=None):
+    """Delivery fee for each distance (any shape); np.inf beyond the last band."""
+    bands = bands or serviceability.BANDS
+    limits = np.array([band[0] for band in bands], dtype=float)
+    fees = np.append(np.array([band[1] for band in bands], dtype=float), np.inf)
+    return fees[np.searchsorted(limits, distances)]
+
+
+def choose(distances, bands=None):
+    """Per row of a carts x shops distance matrix: (shop position or -1, distance, fee)."""
+    fees = band_fees(distances, bands)
+    cheapest = fees.min(axis=1, keepdims=True)
+    position = np.argmin(np.where(fees == cheapest, distances, np.inf), axis=1)
+    rows = np.arange(len(distances))
+    distance, fee = distances[rows, position], fees[rows, position]
+    servable = np.isfinite(fee)
+    return np.where(servable, position, -1), np.where(servable, distance, np.nan), np.where(servable, fee, np.nan)
+
+
+def plan_positions(latitudes, longitudes, shop_latitudes, shop_longitudes, bands=None):
+    """choose() for carts at (latitudes, longitudes) against one set of shops, in chunks."""
+    n = len(latitudes)
+    position, distance, fee = np.full(n, -1), np.full(n, np.nan), np.full(n, np.nan)
+    if not len(shop_latitudes):
+        return position, distance, fee
+    chunk = max(1, DISTANCE_CELLS // len(shop_latitudes))
+    for start in range(0, n, chunk):
+        stop = start + chunk
+        distances = geo.haversine_km(latitudes[start:stop, None], longitudes[start:stop, None],
+                                     shop_latitudes[None, :], shop_longitudes[None, :])
+        position[start:stop], distance[start:stop], fee[start:stop] = choose(distances, bands)
+    return position, distance, fee
+
+
+def plan_batch(company_name, latitudes, longitudes):
+    """Plans for many carts of one company: (shop_ids with -1 for unservable, distances, fees)."""
+    shops, grid = geo.shops.company(company_name)
+    position, distance, fee = plan_positions(np.asarray(latitudes, dtype=float), np.asarray(longitudes, dtype=float),
+                                             grid.latitudes, grid.longitudes)
+    shop_ids = np.array([shop["shop_id"] for shop in shops] + [-1], dtype=np.int64)
+    return shop_ids[position], distance, fee
+
+
+def plan(db, company_name, latitude, longitude):
+    """The cheapest shop to deliver to one position, as {"shop_id", "shop_name", "distance_km", "fee"}, or None."""
+    geo.shops.ensure_loaded(db)
+    shops, grid = geo.shops.company(company_name)
+    position, distance, fee = plan_positions(np.array([latitude], dtype=float), np.array([longitude], dtype=float),
+                                             grid.latitudes, grid.longitudes)
+    if position[0] < 0:
+        return None
+    shop = shops[position[0]]
+    return {"shop_id": shop["shop_id"], "shop_name": shop["shop_name"],
+            "distance_km": round(float(distance[0]), 3), "fee": float(fee[0])}
+
+
+def write_plans(cart_ids, shop_ids, distances, fees):
+    planned = shop_ids >= 0
+    with session_scope() as db:
+        db.execute(WRITE_PLANS, {
+            "ids": list(cart_ids),
+            "shop_ids": [int(shop_id) if ok else None for shop_id, ok in zip(shop_ids.tolist(), planned.tolist())],
+            "kms": [round(km, 3) if ok else None for km, ok in zip(distances.tolist(), planned.tolist())],
+            "fees": [fee if ok else None for fee, ok in zip(fees.tolist(), planned.tolist())],
+        })
+
+
+@jobs.handler("fulfilment.replan")
+def replan():
+    """Re-plan every non-empty cart; returns {"carts": n, "unservable": n, "seconds": s}."""
+    started = time.perf_counter()
+    with session_scope() as db:
+        # Held until this session ends, while the carts are streamed and written on other connections.
+        if not db.execute(text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": REPLAN_LOCK_KEY}).scalar():
+            return {"carts": 0, "unservable": 0, "seconds": 0.0, "skipped": True}
+        geo.shops.load(db)
+        carts = unservable = 0
+        with engine.connect() as conn:
+            result = conn.execution_options(stream_results=True, yield_per=REPLAN_BATCH).execute(PLANNABLE_CARTS)
+            for rows in result.partitions():
+                by_company = {}
+                for row in rows:
+                    by_company.setdefault(row.company_name, []).append(row)
+                for company_name, company_rows in by_company.items():
+                    shop_ids, distances, fees = plan_batch(company_name, [row.latitude for row in company_rows],
+                                                           [row.longitude for row in company_rows])
+                    write_plans([row.cart_id for row in company_rows], shop_ids, distances, fees)
+                    carts += len(company_rows)
+                    unservable += int((shop_ids < 0).sum())
+    return {"carts": carts, "unservable": unservable, "seconds": round(time.perf_counter() - started, 3)}
+
+
+@scheduler.every(REPLAN_SECONDS)
+def replan_periodically():
+    replan()
+
+
+def benchmark(carts, shops=200, seed=0):
+    """Seconds to plan `carts` carts against `shops` shops spread over one metro area."""
+    rng = np.random.default_rng(seed)
+    shop_latitudes, shop_longitudes = rng.uniform(18.4, 18.7, shops), rng.uniform(73.7, 74.0, shops)
+    latitudes, longitudes = rng.uniform(18.3, 18.8, carts), rng.uniform(73.6, 74.1, carts)
+    started = time.perf_counter()
+    plan_positions(latitudes, longitudes, shop_latitudes, shop_longitudes)
+    return time.perf_counter() - started
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Re-plan fulfilment for every non-empty cart.")
+    parser.add_argument("--benchmark", type=int, metavar="N", help="time planning N synthetic carts")
+    parser.add_argument("--shops", type=int, default=200, help="candidate shops in the benchmark")
+    args = parser.parse_args(argv)
+
+    if args.benchmark:
+        seconds = benchmark(args.benchmark, args.shops)
+        print(f"{args.benchmark} carts x {args.shops} shops planned in {seconds * 1000:.1f}ms "
+              f"({args.benchmark / seconds:,.0f} carts/s)")
+        return 0
+    print(replan())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,258 @@
+"""Shop locations and nearest-shop search.
+
+shops.shop_coordinates is free text ("lat: 18.52, long: 73.85", "18.52,73.85", ...). The
+numeric shops.latitude/longitude columns are filled from it by backfill(), which runs with
+every refresh, as a "geo.backfill" job, or by hand; text that does not parse to a valid
+position leaves the columns NULL and the shop out of nearby searches.
+
+Available shops with a position are held in a GridIndex: points bucketed into
+CELL_DEGREES square cells. A k-nearest query computes haversine distances only for the cells
+in rings around the query's cell, and stops once the next ring cannot hold anything closer
+than the k-th shop found, so it never scans the table or the whole index.
+
+The index is loaded on first use; every REFRESH_SECONDS each worker compares the shops
+table's (count, max updated_at) with what it loaded and rebuilds on a difference.
+
+    python -m app.geo                      # backfill coordinates now
+    python -m app.geo --benchmark 100000   # time nearest-shop queries on synthetic shops
+"""
+import argparse
+import math
+import re
+import sys
+import threading
+import time
+
+import numpy as np
+from sqlalchemy import text
+
+from . import jobs, scheduler
+from .database import session_scope
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+CELL_DEGREES = 0.1  # about 11 km of latitude
+REFRESH_SECONDS = 30
+
+LABELLED = re.compile(r"\b(lat|latitude|lng|lon|long|longitude)\b\s*[:=]?\s*([-+]?\d+(?:\.\d+)?)", re.IGNORECASE)
+NUMBER = re.compile(r"[-+]?\d+(?:\.\d+)?")
+
+UNPARSED = text("SELECT shop_id, shop_coordinates FROM shops "
+                "WHERE latitude IS NULL AND shop_coordinates IS NOT NULL")
+
+WRITE_COORDINATES = text("""
+    UPDATE shops s
+    SET latitude = u.latitude, longitude = u.longitude, updated_at = now()
+    FROM unnest(CAST(:ids AS bigint[]), CAST(:lats AS double precision[]), CAST(:lons AS double precision[]))
+        AS u(shop_id, latitude, longitude)
+    WHERE s.shop_id = u.shop_id
+""")
+
+AVAILABLE_SHOPS = text("""
+    SELECT shop_id, shop_name, shop_image, shop_address, shop_service, company_name, latitude, longitude
+    FROM shops
+    WHERE is_available AND latitude IS NOT NULL AND longitude IS NOT NULL
+    ORDER BY shop_id
+""")
+
+VERSION = text("SELECT COUNT(*), MAX(updated_at) FROM shops")
+
+
+def parse_coordinates(value):
+    """(latitude, longitude) from free text, or None when it does not hold a valid position."""
+    if not value:
+        return None
+    labelled = {name.lower()[:3]: float(number) for name, number in LABELLED.findall(value)}
+    if "lat" in labelled and ("lon" in labelled or "lng" in labelled):
+        latitude, longitude = labelled["lat"], labelled.get("lon", labelled.get("lng"))
+    else:
+        numbers = NUMBER.findall(value)
+        if len(numbers) != 2:
+            return None
+        latitude, longitude = float(numbers[0]), float(numbers[1])
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        return None
+    return latitude, longitude
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance in km; any argument may be a NumPy array."""
+    lat1, lon1, lat2, lon2 = (np.radians(value) for value in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def backfill(db):
+    """Fill latitude/longitude from shop_coordinates; returns (parsed, unparseable)."""
+    ids, lats, lons, unparseable = [], [], [], 0
+    for shop_id, coordinates in db.execute(UNPARSED):
+        position = parse_coordinates(coordinates)
+        if position is None:
+            unparseable += 1
+            continue
+        ids.append(shop_id)
+        lats.append(position[0])
+        lons.append(position[1])
+    if ids:
+        db.execute(WRITE_COORDINATES, {"ids": ids, "lats": lats, "lons": lons})
+    return len(ids), unparseable
+
+
+class GridIndex:
+    """Points bucketed into cell_degrees x cell_degrees cells for k-nearest queries."""
+
+    def __init__(self, latitudes, longitudes, cell_degrees=CELL_DEGREES):
+        self.latitudes = np.asarray(latitudes, dtype=float)
+        self.longitudes = np.asarray(longitudes, dtype=float)
+        self.cell_degrees = cell_degrees
+        rows = np.floor(self.latitudes / cell_degrees).astype(np.int64)
+        cols = np.floor(self.longitudes / cell_degrees).astype(np.int64)
+        cells = {}
+        for position, key in enumerate(zip(rows.tolist(), cols.tolist())):
+            cells.setdefault(key, []).append(position)
+        self.cells = {key: np.array(positions, dtype=np.int64) for key, positions in cells.items()}
+        if len(rows):
+            self.bounds = (int(rows.min()), int(rows.max()), int(cols.min()), int(cols.max()))
+
+    def __len__(self):
+        return len(self.latitudes)
+
+    def _ring(self, row, col, ring):
+        if ring == 0:
+            return [(row, col)]
+        keys = [(row - ring, c) for c in range(col - ring, col + ring + 1)]
+        keys += [(row + ring, c) for c in range(col - ring, col + ring + 1)]
+        keys += [(r, col - ring) for r in range(row - ring + 1, row + ring)]
+        keys += [(r, col + ring) for r in range(row - ring + 1, row + ring)]
+        return keys
+
+    def _lower_bound_km(self, latitude, ring):
+        """Nothing outside rings 0..ring can be closer than this to a point in the centre cell."""
+        band = min(90.0, abs(latitude) + (ring + 1) * self.cell_degrees)
+        return ring * self.cell_degrees * KM_PER_DEGREE * math.cos(math.radians(band))
+
+    def nearest(self, latitude, longitude, k, max_km=None):
+        """Positions and distances (km) of the k points closest to (latitude, longitude), nearest first."""
+        if k <= 0 or not len(self):
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        row = math.floor(latitude / self.cell_degrees)
+        col = math.floor(longitude / self.cell_degrees)
+        min_row, max_row, min_col, max_col = self.bounds
+        last_ring = max(row - min_row, max_row - row, col - min_col, max_col - col, 0)
+
+        positions, distances = np.empty(0, dtype=np.int64), np.empty(0)
+        for ring in range(last_ring + 1):
+            if 8 * ring > len(self.cells):
+                # Ring walks now cost more than visiting the remaining occupied cells directly.
+                found = [cell for (r, c), cell in self.cells.items() if max(abs(r - row), abs(c - col)) >= ring]
+                done = True
+            else:
+                found = [self.cells[key] for key in self._ring(row, col, ring) if key in self.cells]
+                done = False
+            if found:
+                candidates = np.concatenate(found)
+                positions = np.concatenate([positions, candidates])
+                distances = np.concatenate([distances, haversine_km(
+                    latitude, longitude, self.latitudes[candidates], self.longitudes[candidates])])
+                if len(positions) > k:
+                    keep = np.argpartition(distances, k - 1)[:k]
+                    positions, distances = positions[keep], distances[keep]
+            bound = self._lower_bound_km(latitude, ring)
+            if done or (max_km is not None and bound > max_km) or (len(positions) == k and bound >= distances.max()):
+                break
+
+        if max_km is not None:
+            within = distances <= max_km
+            positions, distances = positions[within], distances[within]
+        order = np.argsort(distances, kind="stable")
+        return positions[order], distances[order]
+
+
+class ShopIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        self.loaded = False
+        self.version = None
+        self.shops = []
+        self.grid = GridIndex([], [])
+        self.by_company = {}
+
+    def load(self, db):
+        version = tuple(db.execute(VERSION).one())
+        shops = [dict(row) for row in db.execute(AVAILABLE_SHOPS).mappings()]
+        grid = GridIndex([shop["latitude"] for shop in shops], [shop["longitude"] for shop in shops])
+        members = {}
+        for shop in shops:
+            members.setdefault(shop["company_name"], []).append(shop)
+        by_company = {company: (company_shops, GridIndex([shop["latitude"] for shop in company_shops],
+                                                         [shop["longitude"] for shop in company_shops]))
+                      for company, company_shops in members.items()}
+        with self._lock:
+            self.shops, self.grid, self.by_company = shops, grid, by_company
+            self.version, self.loaded = version, True
+
+    def ensure_loaded(self, db):
+        if not self.loaded:
+            self.load(db)
+
+    def company(self, company_name=None):
+        """(shops, grid) of one company's available located shops, or of all of them."""
+        with self._lock:
+            if company_name is None:
+                return self.shops, self.grid
+            return self.by_company.get(company_name, ([], GridIndex([], [])))
+
+    def nearby(self, latitude, longitude, k, company_name=None, max_km=None):
+        """The k nearest available shops, each with distance_km, nearest first."""
+        shops, grid = self.company(company_name)
+        positions, distances = grid.nearest(latitude, longitude, k, max_km)
+        return [dict(shops[position], distance_km=round(float(distance), 3))
+                for position, distance in zip(positions.tolist(), distances.tolist())]
+
+
+shops = ShopIndex()
+
+
+@jobs.handler("geo.backfill")
+def backfill_coordinates():
+    with session_scope() as db:
+        return backfill(db)
+
+
+@scheduler.every(REFRESH_SECONDS)
+def refresh():
+    with session_scope() as db:
+        backfill(db)
+        if shops.loaded and tuple(db.execute(VERSION).one()) != shops.version:
+            shops.load(db)
+
+
+def benchmark(n, queries=1000, k=10, seed=0):
+    """Average seconds per k-nearest query over n synthetic shops spread across India."""
+    rng = np.random.default_rng(seed)
+    grid = GridIndex(rng.uniform(8, 35, n), rng.uniform(68, 97, n))
+    points = zip(rng.uniform(8, 35, queries).tolist(), rng.uniform(68, 97, queries).tolist())
+    started = time.perf_counter()
+    for latitude, longitude in points:
+        grid.nearest(latitude, longitude, k)
+    return (time.perf_counter() - started) / queries
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Parse shop_coordinates into shops.latitude/longitude.")
+    parser.add_argument("--benchmark", type=int, metavar="N", help="time nearest-shop queries over N synthetic shops")
+    args = parser.parse_args(argv)
+
+    if args.benchmark:
+        print(f"k=10 nearest of {args.benchmark} shops in {benchmark(args.benchmark) * 1000:.3f}ms per query")
+        return 0
+    parsed, unparseable = backfill_coordinates()
+    print(f"{parsed} shops located, {unparseable} with unparseable shop_coordinates")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,144 @@
+"""Sharded stock counters for flash sales.
+
+While a variant is on flash sale its stock lives in N variant_stock_shards rows instead of
+product_variants.count. A purchase decrements one randomly picked shard that has enough
+stock and is not locked by another checkout (FOR UPDATE SKIP LOCKED), so up to N checkouts
+of the same variant proceed in parallel instead of queueing on one row. Only when every
+suitable shard is busy, or the quantity has to be collected from several shards, does a
+checkout wait on the shards (locked in shard order).
+
+product_variants.count is refreshed from the shards periodically, and a few seconds after
+flash-sale checkouts through a coalesced "inventory.reconcile" job, so listings stay close;
+it gets the exact remainder back when the sale ends. Nothing else may write the count of a
+variant on sale, since the reconcile would overwrite it: writers lock the variant rows and
+then ask on_sale() which of them to leave alone. start_flash_sale locks the row as well, so
+no sale can start after that check, and the check, being a statement of its own, sees a sale
+that committed while the writer waited for the lock.
+"""
+import datetime
+
+from sqlalchemy import text
+
+from . import jobs, product_summary, scheduler
+from .database import session_scope
+
+DEFAULT_SHARDS = 16
+
+TAKE_FROM_FREE_SHARD = text("""
+    UPDATE variant_stock_shards s
+    SET count = s.count - :quantity
+    FROM (
+        SELECT shard_no FROM variant_stock_shards
+        WHERE variant_id = :variant_id AND count >= :quantity
+        ORDER BY random()
+        LIMIT 1
+        FOR UPDATE SKIP LOCKED
+    ) pick
+    WHERE s.variant_id = :variant_id AND s.shard_no = pick.shard_no
+    RETURNING s.shard_no
+""")
+
+LOCK_ALL_SHARDS = text("""
+    SELECT shard_no, count FROM variant_stock_shards
+    WHERE variant_id = :variant_id AND count > 0
+    ORDER BY shard_no
+    FOR UPDATE
+""")
+
+TAKE_FROM_SHARD = text("""
+    UPDATE variant_stock_shards SET count = count - :quantity
+    WHERE variant_id = :variant_id AND shard_no = :shard_no
+""")
+
+RECONCILE = text("""
+    UPDATE product_variants v
+    SET count = s.total
+    FROM (SELECT variant_id, SUM(count) AS total FROM variant_stock_shards GROUP BY variant_id) s
+    WHERE v.variant_id = s.variant_id AND v.count <> s.total
+    RETURNING v.product_id
+""")
+
+
+ON_SALE = text("SELECT variant_id FROM flash_sales WHERE variant_id = ANY(:variant_ids) ORDER BY variant_id")
+
+
+class OutOfStock(Exception):
+    def __init__(self, variant_id, requested, available):
+        super().__init__(f"variant {variant_id}: requested {requested}, available {available}")
+        self.variant_id = variant_id
+        self.requested = requested
+        self.available = available
+
+
+def on_sale(db, variant_ids):
+    """The variant_ids on flash sale. Call with the variants' rows locked."""
+    if not variant_ids:
+        return []
+    return db.execute(ON_SALE, {"variant_ids": list(variant_ids)}).scalars().all()
+
+
+def take(db, variant_id, quantity):
+    """Decrement quantity from the variant's shards inside the caller's transaction."""
+    if db.execute(TAKE_FROM_FREE_SHARD, {"variant_id": variant_id, "quantity": quantity}).first():
+        return
+
+    shards = db.execute(LOCK_ALL_SHARDS, {"variant_id": variant_id}).all()
+    available = sum(shard.count for shard in shards)
+    if available < quantity:
+        raise OutOfStock(variant_id, quantity, available)
+    remaining = quantity
+    for shard in shards:
+        used = min(shard.count, remaining)
+        db.execute(TAKE_FROM_SHARD, {"variant_id": variant_id, "shard_no": shard.shard_no, "quantity": used})
+        remaining -= used
+        if not remaining:
+            break
+
+
+def start_flash_sale(db, variant_id, shards=DEFAULT_SHARDS, ends_at=None):
+    """Move the variant's stock into `shards` counters. Returns False if it was already on sale."""
+    stock = db.execute(text("SELECT count FROM product_variants WHERE variant_id = :variant_id FOR UPDATE"),
+                       {"variant_id": variant_id}).scalar()
+    if stock is None:
+        raise LookupError(f"variant {variant_id} not found")
+    created = db.execute(text("""
+        INSERT INTO flash_sales (variant_id, shards, ends_at) VALUES (:variant_id, :shards, :ends_at)
+        ON CONFLICT DO NOTHING RETURNING variant_id
+    """), {"variant_id": variant_id, "shards": shards, "ends_at": ends_at}).first()
+    if not created:
+        return False
+    db.execute(text("""
+        INSERT INTO variant_stock_shards (variant_id, shard_no, count)
+        SELECT :variant_id, n, :stock / :shards + CASE WHEN n < :stock % :shards THEN 1 ELSE 0 END
+        FROM generate_series(0, :shards - 1) AS n
+    """), {"variant_id": variant_id, "stock": max(stock, 0), "shards": shards})
+    return True
+
+
+def end_flash_sale(db, variant_id):
+    """Fold the shards back into product_variants.count. Returns False if no sale was running."""
+    ended = db.execute(text("""
+        WITH shards AS (
+            DELETE FROM variant_stock_shards WHERE variant_id = :variant_id RETURNING count
+        ), sale AS (
+            DELETE FROM flash_sales WHERE variant_id = :variant_id RETURNING variant_id
+        )
+        UPDATE product_variants SET count = (SELECT COALESCE(SUM(count), 0) FROM shards)
+        WHERE variant_id = :variant_id AND EXISTS (SELECT 1 FROM sale)
+        RETURNING product_id
+    """), {"variant_id": variant_id}).first()
+    if ended is None:
+        return False
+    product_summary.refresh(db, [ended.product_id])
+    return True
+
+
+@jobs.handler("inventory.reconcile")
+@scheduler.every(10)
+def reconcile():
+    with session_scope() as db:
+        product_summary.refresh(db, db.execute(RECONCILE).scalars().all())
+        expired = db.execute(text("SELECT variant_id FROM flash_sales WHERE ends_at < :now"),
+                             {"now": datetime.datetime.now(datetime.timezone.utc)}).scalars().all()
+        for variant_id in expired:
+            end_flash_sale(db, variant_id)
@@ -0,0 +1,128 @@
+"""Invoice rendering.
+
+The Jinja2 environment is built and templates/invoice.html compiled once at import, so a
+render is a single call into already compiled Python code. Invoice data comes from one
+query that joins the booking with its customer, address and company, and uses the
+bookings.products snapshot taken at checkout as the line items. The company is the booking's
+own company_id; only bookings older than that column fall back to their cart's company.
+
+Invoices are rendered off the request path:
+  * checkout queues an "invoices.render" job that writes the order's invoice to INVOICE_DIR;
+  * GET /invoice/{order_id} streams one invoice as it renders;
+  * month-end runs write a date range from a server-side cursor:
+
+    python -m app.invoices 2023-08-01 2023-08-31 --out invoices/2023-08 [--company-id 1]
+"""
+import argparse
+import datetime
+import os
+import re
+import sys
+import time
+
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+from sqlalchemy import text
+
+from . import jobs
+from .database import engine, session_scope
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(__file__), "templates")
+INVOICE_DIR = os.environ.get("ONECART_INVOICE_DIR", "invoices")
+BATCH_SIZE = 500
+
+environment = Environment(
+    loader=FileSystemLoader(TEMPLATE_DIR),
+    autoescape=select_autoescape(["html"]),
+    auto_reload=False,
+    trim_blocks=True,
+    lstrip_blocks=True,
+)
+environment.filters["money"] = lambda value: f"{value or 0:,.2f}"
+invoice_template = environment.get_template("invoice.html")
+
+INVOICE_QUERY = """
+    SELECT b.order_id, b.order_number, b.order_date, b.invoice_number, b.invoice_amount, b.product_total,
+           b.delivery_fees, b.coupon_discount, b.products, b.user_contact, cu.customer_name,
+           a.name, a.address_name, a.city, a.state, a.pincode, a.phone_no,
+           co.company_id, co.company_name
+    FROM bookings b
+    JOIN customers cu ON cu.customer_contact = b.user_contact
+    JOIN address a ON a.address_id = b.address_id
+    LEFT JOIN carts c ON c.cart_id = b.cart_id AND b.company_id IS NULL
+    LEFT JOIN companies co ON co.company_id = COALESCE(b.company_id, c.company_id)
+"""
+
+ONE_INVOICE = text(INVOICE_QUERY + " WHERE b.order_id = :order_id")
+
+INVOICE_RANGE = text(INVOICE_QUERY + """
+    WHERE b.order_date BETWEEN :start AND :end
+      AND (CAST(:company_id AS bigint) IS NULL OR co.company_id = :company_id)
+    ORDER BY b.order_date, b.order_id
+""")
+
+
+def render(invoice):
+    return invoice_template.render(invoice=invoice)
+
+
+def stream(invoice):
+    """Yield the rendered invoice in chunks as the template produces them."""
+    return invoice_template.generate(invoice=invoice)
+
+
+def get_invoice(db, order_id):
+    return db.execute(ONE_INVOICE, {"order_id": order_id}).mappings().first()
+
+
+def file_name(invoice):
+    return re.sub(r"[^A-Za-z0-9._-]", "-", invoice["invoice_number"]) + ".html"
+
+
+def write(invoice, out_dir):
+    path = os.path.join(out_dir, file_name(invoice))
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(render(invoice))
+    return path
+
+
+@jobs.handler("invoices.render")
+def render_order(order_id, out_dir=None):
+    with session_scope() as db:
+        invoice = get_invoice(db, order_id)
+    if invoice is None:
+        return
+    os.makedirs(out_dir or INVOICE_DIR, exist_ok=True)
+    write(invoice, out_dir or INVOICE_DIR)
+
+
+def write_range(start, end, out_dir, company_id=None):
+    """Render every invoice dated start..end into out_dir; returns the number written."""
+    os.makedirs(out_dir, exist_ok=True)
+    written = 0
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=BATCH_SIZE).execute(
+            INVOICE_RANGE, {"start": start, "end": end, "company_id": company_id})
+        for invoice in result.mappings():
+            write(invoice, out_dir)
+            written += 1
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render the invoices of a date range to HTML files.")
+    parser.add_argument("start", type=datetime.date.fromisoformat)
+    parser.add_argument("end", type=datetime.date.fromisoformat)
+    parser.add_argument("--out", default=INVOICE_DIR)
+    parser.add_argument("--company-id", type=int)
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    written = write_range(args.start, args.end, args.out, args.company_id)
+    elapsed = time.perf_counter() - started
+    print(f"{written} invoices written to {args.out} in {elapsed:.1f}s "
+          f"({written / elapsed * 60 if elapsed else 0:.0f}/min)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,208 @@
+"""Durable background jobs kept in the jobs table.
+
+Request handlers call enqueue(db, kind, payload) inside their own transaction, so a job
+exists exactly when the work that needs it has committed, and the request returns without
+waiting for it. Workers run separately:
+
+    python -m app.jobs --workers 8                   # thread pool
+    python -m app.jobs --workers 4 --mode process    # process pool, for CPU-bound handlers
+
+A worker claims due jobs with FOR UPDATE SKIP LOCKED, so any number of workers on any
+number of nodes can share the queue, and runs them on the pool. A failed job is retried
+with exponential backoff and jitter until max_attempts, then left as 'failed' with its last
+error. Jobs left 'running' by a worker that died are requeued after STALE_AFTER, or left as
+'failed' once they have used up max_attempts, so a job that kills its worker is not reclaimed
+forever.
+
+Handlers are registered with @handler("kind") in the modules listed in HANDLER_MODULES and
+receive the payload as keyword arguments.
+"""
+import argparse
+import importlib
+import json
+import logging
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from sqlalchemy import text
+
+from .database import engine, session_scope
+
+logger = logging.getLogger(__name__)
+
+HANDLER_MODULES = ["app.analytics", "app.fulfilment", "app.geo", "app.inventory", "app.invoices", "app.orders",
+                   "app.popularity", "app.product_summary", "app.recommendations", "app.repricing",
+                   "app.serviceability"]
+BACKOFF_BASE = 5
+BACKOFF_MAX = 3600
+STALE_AFTER = 900
+
+handlers = {}
+
+ENQUEUE = text("""
+    INSERT INTO jobs (kind, payload, max_attempts, run_at)
+    SELECT :kind, CAST(:payload AS json), :max_attempts, now() + make_interval(secs => :delay)
+    WHERE NOT :unique OR NOT EXISTS (
+        SELECT 1 FROM jobs WHERE status = 'queued' AND kind = :kind AND CAST(payload AS text) = :payload
+    )
+""")
+
+CLAIM = text("""
+    UPDATE jobs j
+    SET status = 'running', attempts = j.attempts + 1, started_at = now()
+    FROM (
+        SELECT job_id FROM jobs
+        WHERE status = 'queued' AND run_at <= now()
+        ORDER BY run_at
+        LIMIT :limit
+        FOR UPDATE SKIP LOCKED
+    ) due
+    WHERE j.job_id = due.job_id
+    RETURNING j.job_id, j.kind, j.payload, j.attempts, j.max_attempts
+""")
+
+REQUEUE_STALE = text("""
+    UPDATE jobs
+    SET status = CASE WHEN attempts >= max_attempts THEN 'failed' ELSE 'queued' END,
+        finished_at = CASE WHEN attempts >= max_attempts THEN now() END,
+        last_error = CASE WHEN attempts >= max_attempts THEN 'worker died while running the job' ELSE last_error END,
+        run_at = now()
+    WHERE status = 'running' AND started_at < now() - make_interval(secs => :stale_after)
+""")
+
+METRICS = text("""
+    SELECT kind,
+           COUNT(*) FILTER (WHERE status = 'queued') AS queued,
+           COUNT(*) FILTER (WHERE status = 'queued' AND run_at <= now()) AS due,
+           COUNT(*) FILTER (WHERE status = 'running') AS running,
+           COUNT(*) FILTER (WHERE status = 'failed') AS failed,
+           COUNT(*) FILTER (WHERE status = 'done' AND finished_at > now() - interval '1 hour') AS done_last_hour,
+           EXTRACT(EPOCH FROM now() - MIN(run_at) FILTER (WHERE status = 'queued' AND run_at <= now()))
+               AS oldest_due_seconds,
+           EXTRACT(EPOCH FROM AVG(started_at - run_at)
+               FILTER (WHERE status = 'done' AND finished_at > now() - interval '1 hour')) AS avg_wait_seconds,
+           EXTRACT(EPOCH FROM AVG(finished_at - started_at)
+               FILTER (WHERE status = 'done' AND finished_at > now() - interval '1 hour')) AS avg_run_seconds
+    FROM jobs
+    GROUP BY kind
+    ORDER BY kind
+""")
+
+
+def handler(kind):
+    def register(func):
+        handlers[kind] = func
+        return func
+    return register
+
+
+def enqueue(db, kind, payload=None, delay=0, max_attempts=5, unique=False):
+    """Queue a job in db's transaction; it becomes visible to workers when the caller commits.
+
+    With unique=True nothing is added while an identical job is still queued, so a burst of
+    requests asking for the same follow-up work (delay lets the burst gather) costs one run.
+    """
+    db.execute(ENQUEUE, {"kind": kind, "payload": json.dumps(payload or {}, sort_keys=True), "delay": delay,
+                         "max_attempts": max_attempts, "unique": unique})
+
+
+def metrics(db):
+    return [dict(row) for row in db.execute(METRICS).mappings()]
+
+
+def backoff(attempts):
+    return min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX) * random.uniform(0.5, 1.5)
+
+
+def import_handlers():
+    for module in HANDLER_MODULES:
+        importlib.import_module(module)
+
+
+def execute(kind, payload):
+    """Run one job; module-level so process pools can pickle it."""
+    if kind not in handlers:
+        import_handlers()
+    handlers[kind](**payload)
+
+
+def claim(limit):
+    with session_scope() as db:
+        return db.execute(CLAIM, {"limit": limit}).all()
+
+
+def finish(job, error=None):
+    with session_scope() as db:
+        if error is None:
+            db.execute(text("UPDATE jobs SET status = 'done', finished_at = now(), last_error = NULL "
+                            "WHERE job_id = :job_id"), {"job_id": job.job_id})
+        elif job.attempts >= job.max_attempts:
+            db.execute(text("UPDATE jobs SET status = 'failed', finished_at = now(), last_error = :error "
+                            "WHERE job_id = :job_id"), {"job_id": job.job_id, "error": error})
+        else:
+            db.execute(text("UPDATE jobs SET status = 'queued', last_error = :error, "
+                            "run_at = now() + make_interval(secs => :delay) WHERE job_id = :job_id"),
+                       {"job_id": job.job_id, "error": error, "delay": backoff(job.attempts)})
+
+
+def reset_engine():
+    # Connections inherited from the parent process must not be reused by a forked child.
+    engine.dispose(close=False)
+
+
+def work(workers=4, mode="thread", poll_interval=1.0, once=False):
+    """Claim and run jobs until interrupted (or, with once=True, until nothing is due)."""
+    import_handlers()
+    if mode == "process":
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=reset_engine)
+    else:
+        pool = ThreadPoolExecutor(max_workers=workers)
+    running = {}
+    last_reap = 0.0
+
+    def done(job, future):
+        error = future.exception()
+        if error is not None:
+            logger.error("job %s (%s) failed on attempt %s: %r", job.job_id, job.kind, job.attempts, error)
+        finish(job, None if error is None else repr(error))
+
+    try:
+        while True:
+            if time.monotonic() - last_reap > 60:
+                with session_scope() as db:
+                    db.execute(REQUEUE_STALE, {"stale_after": STALE_AFTER})
+                last_reap = time.monotonic()
+
+            for future in [future for future in running if future.done()]:
+                done(running.pop(future), future)
+
+            jobs = claim(workers - len(running)) if len(running) < workers else []
+            for job in jobs:
+                running[pool.submit(execute, job.kind, job.payload)] = job
+            if once and not jobs and not running:
+                return
+            if not jobs:
+                time.sleep(poll_interval)
+    finally:
+        pool.shutdown(wait=True)
+        for future, job in running.items():
+            done(job, future)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run background jobs from the jobs table.")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--mode", choices=("thread", "process"), default="thread")
+    parser.add_argument("--poll-interval", type=float, default=1.0, help="seconds to wait when no job is due")
+    parser.add_argument("--once", action="store_true", help="exit once the queue has no due jobs")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    work(args.workers, args.mode, args.poll_interval, args.once)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
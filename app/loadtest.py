@@ -0,0 +1,197 @@
+"""Checkout load test against a scratch database.
+
+    DATABASE_URL=postgresql://postgres@localhost/onecart_scratch \\
+        python -m app.loadtest --variant-id 1 --customers 500 --stock 300 --threads 32
+    python -m app.loadtest --variant-id 1 --shards 16    # compare with a sharded flash sale
+
+Creates --customers throwaway customers, each with a cart holding one unit of the hot
+variant, sets that variant's stock to --stock and checks all carts out concurrently. It
+reports throughput and latency and fails if the variant was oversold or if the number of
+successful orders does not match the stock. The throwaway customers (and their carts,
+addresses and bookings) are deleted afterwards and the variant's stock is restored.
+
+With --shards N the same run is repeated with the variant on flash sale, its stock split
+over N counters (app.inventory), and both results are printed.
+
+    python -m app.loadtest --login-race 50 --threads 8
+
+--login-race R instead signs up R new phone numbers, each from --threads concurrent first
+logins, and fails if any login errors or they disagree on the customer.
+"""
+import argparse
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from . import auth, checkout, inventory, schemas
+from .database import SQLALCHEMY_DATABASE_URL, sync_schema
+
+FIRST_CONTACT = 8_000_000_000
+
+
+def setup(session_factory, variant_id, customers, stock, company_id):
+    with session_factory() as db:
+        original_stock, product_id = db.execute(text(
+            "SELECT count, product_id FROM product_variants WHERE variant_id = :variant_id"),
+            {"variant_id": variant_id}).one()
+        contacts = list(range(FIRST_CONTACT, FIRST_CONTACT + customers))
+        db.execute(text("""
+            INSERT INTO customers (customer_id, customer_name, customer_contact, email_id, wallet, prev_pay_mode)
+            SELECT 'loadtest-' || c, 'Load test', c, NULL, 0, 'upi' FROM unnest(CAST(:contacts AS bigint[])) c
+        """), {"contacts": contacts})
+        db.execute(text("""
+            INSERT INTO address (user_contact, address_type, address_name, phone_no, city, state, pincode, name)
+            SELECT c, 'Home', 'Load test', c, 'Pune', 'MH', 411001, 'Load test'
+            FROM unnest(CAST(:contacts AS bigint[])) c
+        """), {"contacts": contacts})
+        db.execute(text("""
+            INSERT INTO carts (company_id, customer_contact)
+            SELECT :company_id, c FROM unnest(CAST(:contacts AS bigint[])) c
+        """), {"contacts": contacts, "company_id": company_id})
+        db.execute(text("""
+            INSERT INTO cart_items (cart_id, product_id, variant_id, count)
+            SELECT cart_id, :product_id, :variant_id, 1 FROM carts WHERE customer_contact = ANY(:contacts)
+        """), {"contacts": contacts, "product_id": product_id, "variant_id": variant_id})
+        addresses = dict(db.execute(text(
+            "SELECT user_contact, address_id FROM address WHERE user_contact = ANY(:contacts)"),
+            {"contacts": contacts}).all())
+        db.execute(text("UPDATE product_variants SET count = :stock WHERE variant_id = :variant_id"),
+                   {"stock": stock, "variant_id": variant_id})
+        db.commit()
+    return original_stock, addresses
+
+
+def teardown(session_factory, variant_id, original_stock):
+    with session_factory() as db:
+        db.execute(text("DELETE FROM flash_sales WHERE variant_id = :variant_id"), {"variant_id": variant_id})
+        db.execute(text("DELETE FROM customers WHERE customer_contact >= :first AND customer_id LIKE 'loadtest-%'"),
+                   {"first": FIRST_CONTACT})
+        db.execute(text("UPDATE product_variants SET count = :stock WHERE variant_id = :variant_id"),
+                   {"stock": original_stock, "variant_id": variant_id})
+        db.commit()
+
+
+def run(session_factory, addresses, threads, place_order=checkout.place_order):
+    def one(contact):
+        started = time.perf_counter()
+        with session_factory() as db:
+            try:
+                place_order(db, contact, addresses[contact])
+                ok = True
+            except checkout.CheckoutError:
+                ok = False
+        return ok, time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        results = list(pool.map(one, addresses))
+    return results, time.perf_counter() - started
+
+
+def report(label, results, elapsed):
+    latencies = sorted(latency for _, latency in results)
+    succeeded = sum(ok for ok, _ in results)
+    print(f"{label}: {len(results)} checkouts in {elapsed:.2f}s ({len(results) / elapsed:.0f}/s), "
+          f"{succeeded} placed, p50 {statistics.median(latencies) * 1000:.1f}ms, "
+          f"p95 {latencies[int(len(latencies) * 0.95) - 1] * 1000:.1f}ms")
+    return succeeded
+
+
+def trial(session_factory, args, shards):
+    label = f"checkout, {shards} shards" if shards else "checkout"
+    original_stock, addresses = setup(session_factory, args.variant_id, args.customers, args.stock, args.company_id)
+    try:
+        if shards:
+            with session_factory() as db:
+                inventory.start_flash_sale(db, args.variant_id, shards)
+                db.commit()
+        results, elapsed = run(session_factory, addresses, args.threads)
+        succeeded = report(label, results, elapsed)
+        with session_factory() as db:
+            if shards:
+                inventory.end_flash_sale(db, args.variant_id)
+                db.commit()
+            left = db.execute(text("SELECT count FROM product_variants WHERE variant_id = :variant_id"),
+                              {"variant_id": args.variant_id}).scalar_one()
+    finally:
+        teardown(session_factory, args.variant_id, original_stock)
+
+    expected = min(args.customers, args.stock)
+    if left < 0 or succeeded != expected or left != args.stock - succeeded:
+        print(f"FAIL: {succeeded} orders placed (expected {expected}), {left} left in stock")
+        return False
+    print(f"OK: {succeeded} orders placed, {left} left in stock")
+    return True
+
+
+def login_race(session_factory, rounds, threads, company_name):
+    """Concurrent first logins of the same new phone number, `rounds` times."""
+    errors, mismatched = [], 0
+    contacts = list(range(FIRST_CONTACT, FIRST_CONTACT + rounds))
+    try:
+        for contact in contacts:
+            user = schemas.UserData(customer_id=f"loadtest-{contact}", customer_name="Load test",
+                                    customer_contact=contact, email_id=f"loadtest{contact}@example.com", wallet=0,
+                                    prev_pay_mode="upi")
+            barrier = threading.Barrier(threads)
+
+            def one(_):
+                with session_factory() as db:
+                    barrier.wait()
+                    try:
+                        return auth.authenticate_user(db, company_name, user)[1]["customer_contact"]
+                    except Exception as e:
+                        errors.append(repr(e))
+
+            auth.forget_user(contact)
+            with ThreadPoolExecutor(max_workers=threads) as pool:
+                mismatched += len(set(pool.map(one, range(threads))) - {contact, None})
+    finally:
+        with session_factory() as db:
+            db.execute(text("DELETE FROM user_companies WHERE user_contact = ANY(:contacts)"), {"contacts": contacts})
+            db.execute(text("DELETE FROM customers WHERE customer_contact = ANY(:contacts)"), {"contacts": contacts})
+            db.commit()
+
+    if errors or mismatched:
+        print(f"FAIL: {len(errors)} of {rounds * threads} first logins failed, {mismatched} returned another "
+              f"customer; first error: {errors[0] if errors else None}")
+        return False
+    print(f"OK: {rounds} phone numbers x {threads} concurrent first logins, no errors")
+    return True
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Concurrent checkouts of one hot variant.")
+    parser.add_argument("--variant-id", type=int)
+    parser.add_argument("--company-id", type=int, default=1)
+    parser.add_argument("--customers", type=int, default=500)
+    parser.add_argument("--stock", type=int, default=300)
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--shards", type=int, default=0,
+                        help="also run with the variant on flash sale over this many stock shards")
+    parser.add_argument("--login-race", type=int, metavar="R", default=0,
+                        help="race --threads first logins of R new phone numbers instead")
+    parser.add_argument("--company-name", default="OneCart", help="company the --login-race customers join")
+    args = parser.parse_args(argv)
+    if not args.login_race and args.variant_id is None:
+        parser.error("--variant-id is required unless --login-race is given")
+
+    engine = create_engine(SQLALCHEMY_DATABASE_URL, pool_size=args.threads, max_overflow=0)
+    sync_schema(engine)
+    session_factory = sessionmaker(bind=engine, autoflush=False)
+
+    if args.login_race:
+        return 0 if login_race(session_factory, args.login_race, args.threads, args.company_name) else 1
+    failed = not trial(session_factory, args, shards=0)
+    if args.shards:
+        failed |= not trial(session_factory, args, shards=args.shards)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,20 +1,23 @@
 from typing import List
-from contextlib import contextmanager
+from datetime import date
 import bcrypt
-from fastapi import FastAPI, Response, Depends, UploadFile, File, Request, HTTPException, Body
+from fastapi import FastAPI, Response, Depends, UploadFile, File, Request, HTTPException, Body, BackgroundTasks, Query
+from sqlalchemy import delete, func, insert, select, update
 from sqlalchemy.orm import Session, joinedload
 from sqlalchemy.exc import IntegrityError
-from starlette.responses import FileResponse
+from starlette.responses import FileResponse, StreamingResponse
 import logging
-from . import models, schemas
+from . import models, schemas, auth, analytics, catalog_export, catalog_import, checkout, coupons, deals, facets, geo, inventory, invoices, jobs, orders, popularity, product_summary, recommendations, scheduler, serviceability
 from .models import Image
-from .database import engine, get_db
+from .crud import update_returning
+from .database import get_db
 from fastapi.middleware.cors import CORSMiddleware
 import os
-
-models.Base.metadata.create_all(bind=engine)
+import shutil
+import tempfile
 
 app = FastAPI()
+scheduler.start(app)
 origins = ["*"]
 app.add_middleware(
     CORSMiddleware,
@@ -99,46 +102,17 @@ async def upload_image(request: Request, files: List[UploadFile] = File(...), db
 def create_user(loginSignupAuth: schemas.UserData, response: Response,
                 db: Session = Depends(get_db), companyName=str):
     try:
-        user_data = db.query(models.User).get(
-            loginSignupAuth.customer_contact)
-
-        if not user_data:
-            # try:
-                new_user_data = models.User(
-                    **loginSignupAuth.model_dump())
-                new_user_added = models.UserCompany(  #composite table
-                    company_name=companyName,
-                    user_contact=loginSignupAuth.customer_contact)
-                db.add(new_user_data)
-                db.add(new_user_added)
-                db.commit()
-                db.refresh(new_user_data)
-                return {"status": 200, "message": "New user successfully created!", "data": new_user_data}
-            # except IntegrityError:
-            #     response.status_code = 200
-            #     return {"status": 204, "message": "User is not registered please Sing up", "data": {}}
-
-        user_exists = db.query(models.UserCompany).filter(models.UserCompany.company_name == companyName).filter(
-            models.UserCompany.user_contact == loginSignupAuth.customer_contact).first()
-        print(user_exists)
-        if not user_exists:
-            try:
-                new_user_company = models.UserCompany(
-                    company_name=companyName,
-                    user_contact=loginSignupAuth.customer_contact)
-                db.add(new_user_company)
-                db.commit()
-                db.refresh(new_user_company)
-                return {"status": 200, "message": "New user successfully Logged in!", "data": user_data}
-            except IntegrityError:
-                response.status_code = 200
-                return {"status": "204", "message": "User is not registered for this company please Sing up",
-                        "data": {}}
-
-        return {"status": 200, "message": "New user successfully Logged in for this company!", "data": user_data}
+        message, user_data = auth.authenticate_user(db, companyName, loginSignupAuth)
+        token = auth.issue_token(loginSignupAuth.customer_contact, companyName, "customer")
+        return {"status": 200, "message": message, "data": user_data, "token": token}
 
     except IntegrityError as e:
         print(repr(e))
+        db.rollback()
+        if getattr(e.orig, "pgcode", None) == "23503":
+            response.status_code = 200
+            return {"status": "204", "message": "User is not registered for this company please Sing up",
+                    "data": {}}
         response.status_code = 404
         return {"status": 404, "message": "Error", "data": {}}
 
@@ -147,16 +121,15 @@ def create_user(loginSignupAuth: schemas.UserData, response: Response,
 def edit_user(userDetail: schemas.EditUserData, response: Response, db: Session = Depends(get_db),
               userId=int):
     try:
-        edit_user_details = db.query(models.User).filter(models.User.customer_contact == userId)
-
-        user_exist = edit_user_details.first()
-        if not user_exist:
+        edited_user = update_returning(db, models.User, userDetail.model_dump(),
+                                       models.User.customer_contact == userId)
+        if not edited_user:
             response.status_code = 200
             return {"status": 204, "message": "User doesn't exists", "data": {}}
 
-        edit_user_details.update(userDetail.model_dump(), synchronize_session=False)
         db.commit()
-        return {"status": 200, "message": "user edited!", "data": edit_user_details.first()}
+        auth.forget_user(int(userId))
+        return {"status": 200, "message": "user edited!", "data": edited_user}
     except IntegrityError as e:
         print(repr(e))
         response.status_code = 404
@@ -199,17 +172,14 @@ def get_address(response: Response, db: Session = Depends(get_db), userId=int):
 @app.put('/editAddress')
 def edit_address(editAddress: schemas.EditAddress, response: Response, db: Session = Depends(get_db), addressId=int):
     try:
-        edit_user_address = db.query(models.Addresses).filter(
-            models.Addresses.address_id == addressId)
-        address_exist = edit_user_address.first()
-        if not address_exist:
+        edited_address = update_returning(db, models.Addresses, editAddress.model_dump(exclude_unset=True),
+                                          models.Addresses.address_id == addressId)
+        if not edited_address:
             response.status_code = 200
             return {"status": 204, "message": "Address doesn't exists", "data": {}}
 
-        edit_user_address.update(editAddress.model_dump(
-            exclude_unset=True), synchronize_session=False)
         db.commit()
-        return {"status": "200", "message": "address edited!", "data": edit_user_address.first()}
+        return {"status": "200", "message": "address edited!", "data": edited_address}
 
     except IntegrityError as e:
         print(repr(e))
@@ -240,7 +210,7 @@ def add_companies(addCompany: schemas.Companies, response: Response, db: Session
     try:
         salt = bcrypt.gensalt()
         password = bcrypt.hashpw(addCompany.password.encode('utf-8'), salt)
-        new_company = models.Companies(**addCompany.model_dump())
+        new_company = models.Companies(**addCompany.model_dump(exclude={"user_contact"}), white_labelled=False)
         new_company.password = password.decode('utf-8')
         db.add(new_company)
         db.commit()
@@ -259,9 +229,12 @@ def company_login(loginCompany: schemas.CompanyLogin, db: Session = Depends(get_
         correct_password = bcrypt.checkpw(loginCompany.password.encode('utf-8'),
                                           company_exists.password.encode('utf-8'))
         if correct_password:
-            return {"status": "200", "message": "New company logged in!", "data": company_exists}
+            company_data = {column.name: getattr(company_exists, column.name)
+                            for column in models.Companies.__table__.columns if column.name != "password"}
+            token = auth.issue_token(company_exists.company_contact, company_exists.company_name, "company")
+            return {"status": "200", "message": "New company logged in!", "data": company_data, "token": token}
 
-        return {"status": "204", "message": "Incorrect password!", "data": company_exists}
+        return {"status": "204", "message": "Incorrect password!", "data": {}}
 
     return {"status": "204", "message": "Company not registered, Please sign up!", "data": {}}
 
@@ -284,16 +257,14 @@ def add_categories(addCategory: schemas.Category, response: Response, db: Sessio
 def edit_categories(editCategory: schemas.EditCategory, response: Response, db: Session = Depends(get_db),
                     categoryId=int):
     try:
-        edit_category = db.query(models.Categories).filter(
-            models.Categories.category_id == categoryId)
-        category_exist = edit_category.first()
-        if not category_exist:
+        edited_category = update_returning(db, models.Categories, editCategory.model_dump(exclude_unset=True),
+                                           models.Categories.category_id == categoryId)
+        if not edited_category:
             response.status_code = 200
             return {"status": 204, "message": "User doesn't exists", "data": {}}
 
-        edit_category.update(editCategory.model_dump(exclude_unset=True), synchronize_session=False)
         db.commit()
-        return {"status": 200, "message": "Category edited!", "data": edit_category.first()}
+        return {"status": 200, "message": "Category edited!", "data": edited_category}
 
     except IntegrityError:
         response.status_code = 200
@@ -320,7 +291,7 @@ def add_products(products: List[schemas.Product], response: Response, db: Sessio
         new_products = []
         for product in products:
             existing_product = db.query(models.Products).filter(
-                models.Products.product_name == product.product_name
+                models.Products.product_name == product.product_name, models.Products.is_deleted == False
             ).first()
 
             if existing_product:
@@ -334,6 +305,7 @@ def add_products(products: List[schemas.Product], response: Response, db: Sessio
         db.commit()
         for product in new_products:
             db.refresh(product)
+        facets.update(db, [product.product_id for product in new_products])
 
         return {"status": "200", "message": "New products added successfully!", "data": new_products}
     except IntegrityError as e:
@@ -347,20 +319,27 @@ def add_products(products: List[schemas.Product], response: Response, db: Sessio
 def add_product_variants(product_id: int, variants: List[schemas.ProductVariant], response: Response, db: Session = Depends(get_db)):
     try:
 
-        product = db.query(models.Products).filter(models.Products.product_id == product_id).first()
+        product = db.query(models.Products).filter(models.Products.product_id == product_id,
+                                                   models.Products.is_deleted == False).first()
         if not product:
             raise HTTPException(status_code=404, detail="Product not found")
 
         # Create and add each product variant to the database
         new_variants = []
         for variant in variants:
-            new_product_variant = models.ProductVariant(**variant.model_dump())
+            new_product_variant = models.ProductVariant(**variant.model_dump(), base_discount=variant.discount)
             db.add(new_product_variant)
             new_variants.append(new_product_variant)
 
+        db.flush()
+        product_ids = [variant.product_id for variant in new_variants]
+        product_summary.refresh(db, product_ids)
+        # Discount rules and deals apply to the new variants too.
+        jobs.enqueue(db, "repricing.run", unique=True)
         db.commit()
         for variant in new_variants:
             db.refresh(variant)
+        facets.update(db, product_ids)
 
         return {"status": "200", "message": "New product variants added successfully!", "data": variants}
     except IntegrityError as e:
@@ -373,7 +352,7 @@ def add_product_variants(product_id: int, variants: List[schemas.ProductVariant]
 @app.get("/getProducts")
 def get_all_products(response: Response, db: Session = Depends(get_db)):
     try:
-        fetch_products = db.query(models.Products).all()
+        fetch_products = db.query(models.Products).filter(models.Products.is_deleted == False).all()
         if not fetch_products:
             return {"status": 204, "message": "No products available please add", "data": {}}
 
@@ -382,10 +361,89 @@ def get_all_products(response: Response, db: Session = Depends(get_db)):
         response.status_code = 200
         return {"status": 204, "message": "Error", "data": {}}
 
+@app.get("/exportProducts")
+def export_products(response: Response, format: str = "ndjson",
+                    company: schemas.Identity = Depends(auth.current_company)):
+    if format not in catalog_export.EXPORTERS:
+        response.status_code = 400
+        return {"status": 400, "message": "format must be one of: " + ", ".join(catalog_export.EXPORTERS), "data": {}}
+
+    return StreamingResponse(catalog_export.EXPORTERS[format](), media_type=catalog_export.MEDIA_TYPES[format],
+                             headers={"Content-Disposition": f"attachment; filename=products.{format}"})
+
+
+@app.post("/importCatalog")
+def import_catalog(background_tasks: BackgroundTasks, file: UploadFile = File(...), db: Session = Depends(get_db),
+                   company: schemas.Identity = Depends(auth.current_company)):
+    # Spool the upload to disk so the request returns while the import runs in the background.
+    with tempfile.NamedTemporaryFile(suffix=".csv", delete=False) as spooled:
+        shutil.copyfileobj(file.file, spooled, length=1024 * 1024)
+
+    catalog_upload = models.CatalogImport(filename=file.filename)
+    db.add(catalog_upload)
+    db.commit()
+    db.refresh(catalog_upload)
+    background_tasks.add_task(catalog_import.run_import, catalog_upload.import_id, spooled.name)
+
+    return {"status": 200, "message": "Catalog import started", "data": catalog_upload}
+
+
+@app.get("/importCatalog/{import_id}")
+def get_catalog_import(response: Response, import_id: int, db: Session = Depends(get_db),
+                       company: schemas.Identity = Depends(auth.current_company)):
+    catalog_upload = db.query(models.CatalogImport).filter(models.CatalogImport.import_id == import_id).first()
+    if not catalog_upload:
+        response.status_code = 404
+        return {"status": 404, "message": "Import not found", "data": {}}
+
+    return {"status": 200, "message": "Import status fetched", "data": catalog_upload}
+
+
+MAX_FILTER_PAGE = 100
+
+
+# /products/filter and /products/byPrice are declared before /products/{product_id} so their
+# last segment is not taken for a product id.
+@app.get("/products/filter")
+def filter_products(response: Response, brand_id: List[int] = Query(default=[]),
+                    category_id: List[int] = Query(default=[]), min_price: float | None = None,
+                    max_price: float | None = None, min_discount: int | None = None, min_rating: int | None = None,
+                    offset: int = 0, limit: int = 20, db: Session = Depends(get_db)):
+    if offset < 0 or not 1 <= limit <= MAX_FILTER_PAGE:
+        response.status_code = 400
+        return {"status": 400, "message": f"offset must be >= 0 and limit between 1 and {MAX_FILTER_PAGE}", "data": {}}
+    facets.ensure_loaded(db)
+    found = facets.index.search(brand_id, category_id, min_price, max_price, min_discount, min_rating, offset, limit)
+    if not found["total"]:
+        return {"status": 204, "message": "No products match", "data": found}
+    return {"status": 200, "message": "Products filtered", "data": found}
+
+
+PRICE_ORDERS = ("asc", "desc")
+
+
+def price_page(response, category_id, order, after_cost, after_id, limit, db):
+    if order not in PRICE_ORDERS:
+        response.status_code = 400
+        return {"status": 400, "message": "order must be asc or desc", "data": [], "next": None}
+    page, cursor = product_summary.by_price(db, category_id, order == "desc", after_cost, after_id, limit)
+    if not page:
+        return {"status": 204, "message": "No products available", "data": [], "next": None}
+    return {"status": 200, "message": "Products fetched", "data": page, "next": cursor}
+
+
+@app.get("/products/byPrice")
+def get_products_by_price(response: Response, order: str = "asc", after_cost: float | None = None,
+                          after_id: int | None = None, limit: int = product_summary.PAGE_SIZE,
+                          db: Session = Depends(get_db)):
+    return price_page(response, None, order, after_cost, after_id, limit, db)
+
+
 @app.get("/products/{product_id}")
 def get_product_by_product_id(response: Response, product_id: int, db: Session = Depends(get_db)):
     try:
-        fetch_product = db.query(models.Products).filter(models.Products.product_id == product_id).first()
+        fetch_product = db.query(models.Products).filter(models.Products.product_id == product_id,
+                                                         models.Products.is_deleted == False).first()
         if not fetch_product:
             return {"status": 204, "message": "Product not found", "data": {}}
 
@@ -399,8 +457,10 @@ def get_product_by_product_id(response: Response, product_id: int, db: Session =
 def get_product_variants(response: Response, product_id: int, db: Session = Depends(get_db)):
     try:
         feature = db.query(models.FreatureList).all()
-        recomended_products = []
-        product = db.query(models.Products).filter(models.Products.product_id == product_id).first()
+        recommendations.cache.ensure_loaded(db)
+        recomended_products = recommendations.cache.for_product(product_id)
+        product = db.query(models.Products).filter(models.Products.product_id == product_id,
+                                                   models.Products.is_deleted == False).first()
 
         if product:
             product_data = {
@@ -449,78 +509,96 @@ def get_product_variants(response: Response, product_id: int, db: Session = Depe
 @app.put("/editProduct")
 def edit_product(editProduct: schemas.EditProduct,response: Response,product_id: int,db: Session = Depends(get_db)):
     try:
-        edit_product = db.query(models.Products).filter( models.Products.product_id == product_id )
-        product_exist = edit_product.first()
-        if not product_exist:
+        edited_product = update_returning(db, models.Products, editProduct.model_dump(exclude_unset=True),
+                                          models.Products.product_id == product_id,
+                                          models.Products.is_deleted == False)
+        if not edited_product:
             response.status_code = 404
             return {"status": 404, "message": "Product doesn't exist", "data": {}}
 
-        edit_product.update(editProduct.model_dump(exclude_unset=True), synchronize_session=False)
         db.commit()
-        return {"status": 200, "message": "Product edited!", "data": edit_product.first()}
+        facets.update(db, [product_id])
+        return {"status": 200, "message": "Product edited!", "data": edited_product}
 
     except IntegrityError:
         response.status_code = 400
         return {"status": 400, "message": "Error", "data": {}}
 
-@app.get("/products/categories/{category_id}")
-def get_products_by_category_id(response: Response, category_id: int, db: Session = Depends(get_db)):
-    try:
-
-        product_details = []
-        products_in_category = (
-            db.query(models.Products)
-            .join(models.CategoryProduct, models.Products.product_id == models.CategoryProduct.product_id)
-            .filter(models.CategoryProduct.category_id == category_id)
-            .all()
-        )
-
-        for product in products_in_category:
-            product_details_dict = {
-                "product_id": product.product_id,
-                "product_name": product.product_name,
-                "details": product.details,
-                "variants": [],
-            }
 
-            # Fetch variants for each product
-            variants = (
-                db.query(models.ProductVariant)
-                .filter(models.ProductVariant.product_id == product.product_id)
-                .all()
-            )
-
-            for variant in variants:
-                variant_details = {
-                    "variant_id": variant.variant_id,
-                    "variant_cost": variant.variant_cost,
-                    "count": variant.count,
-                    "brand_name": variant.brand_name,
-                    "discounted_cost": variant.discounted_cost,
-                    "discount": variant.discount,
-                    "quantity": variant.quantity,
-                    "description": variant.description,
-                    "image": variant.image,
-                    "ratings": variant.ratings
-                }
-
-                product_details_dict["variants"].append(variant_details)
+@app.put("/editProducts")
+def edit_products_in_bulk(bulkEdit: schemas.BulkEdit, response: Response, db: Session = Depends(get_db)):
+    try:
+        edited_products, edited_variants = [], []
+        missing_products, missing_variants = [], []
+
+        for product in bulkEdit.products:
+            edited = update_returning(db, models.Products, product.model_dump(exclude_unset=True, exclude={"product_id"}),
+                                      models.Products.product_id == product.product_id,
+                                      models.Products.is_deleted == False)
+            if edited:
+                edited_products.append(edited)
+            else:
+                missing_products.append(product.product_id)
+
+        # The count of a variant on flash sale lives in its stock shards (app.inventory).
+        recounted = sorted({variant.variant_id for variant in bulkEdit.variants if "count" in variant.model_fields_set})
+        db.execute(select(models.ProductVariant.variant_id).where(models.ProductVariant.variant_id.in_(recounted))
+                   .order_by(models.ProductVariant.variant_id).with_for_update())
+        on_sale = inventory.on_sale(db, recounted)
+        if on_sale:
+            db.rollback()
+            response.status_code = 409
+            return {"status": 409, "message": "Stock of variants on flash sale cannot be edited",
+                    "data": {"on_flash_sale": on_sale}}
+
+        for variant in bulkEdit.variants:
+            values = variant.model_dump(exclude_unset=True, exclude={"variant_id"})
+            if "discount" in values:
+                # A typed-in discount is the variant's standing discount; app.repricing keeps it.
+                values["base_discount"] = values["discount"]
+            edited = update_returning(db, models.ProductVariant, values,
+                                      models.ProductVariant.variant_id == variant.variant_id)
+            if edited:
+                edited_variants.append(edited)
+            else:
+                missing_variants.append(variant.variant_id)
 
-            product_details.append(product_details_dict)
+        product_summary.refresh(db, [variant.product_id for variant in edited_variants])
+        if any(field in variant.model_fields_set for variant in bulkEdit.variants
+               for field in ("variant_cost", "discount")):
+            jobs.enqueue(db, "repricing.run", unique=True)
+        db.commit()
+        facets.update(db, [product.product_id for product in edited_products] +
+                      [variant.product_id for variant in edited_variants])
+        return {"status": 200, "message": "Products edited!",
+                "data": {"products": edited_products, "variants": edited_variants,
+                         "not_found": {"products": missing_products, "variants": missing_variants}}}
 
-        return {"status": 200, "message": "Products by category fetched", "products": product_details}
     except IntegrityError as e:
         print(repr(e))
-        response.status_code = 200
-        return {"status": 204, "message": "Error", "data": {}}
+        db.rollback()
+        response.status_code = 400
+        return {"status": 400, "message": "Error", "data": {}}
+
+@app.get("/products/categories/{category_id}")
+def get_products_by_category_id(category_id: int, after_id: int | None = None,
+                                limit: int = product_summary.PAGE_SIZE, db: Session = Depends(get_db)):
+    page, cursor = product_summary.in_category(db, category_id, after_id, limit)
+    return {"status": 200, "message": "Products by category fetched", "products": page, "next": cursor}
 
 
+@app.get("/products/categories/{category_id}/byPrice")
+def get_category_products_by_price(response: Response, category_id: int, order: str = "asc",
+                                   after_cost: float | None = None, after_id: int | None = None,
+                                   limit: int = product_summary.PAGE_SIZE, db: Session = Depends(get_db)):
+    return price_page(response, category_id, order, after_cost, after_id, limit, db)
+
 
 @app.post("/carts")
 async def create_cart(cart: schemas.CartSchema, response: Response, db: Session = Depends(get_db)):
 
     try:
-        new_cart = models.Cart(**cart.model_dump())
+        new_cart = models.Cart(**cart.model_dump(exclude={"coupon_id"}))
         db.add(new_cart)
         db.commit()
         db.refresh(new_cart)
@@ -557,16 +635,22 @@ def delete_multiple_products(product_ids: List[int], response: Response, db: Ses
         raise HTTPException(status_code=400, detail="Please provide a list of product IDs")
 
     try:
-        products = db.query(models.Products).filter(models.Products.product_id.in_(product_ids))
-
-        if not products:
-            raise HTTPException(status_code=404, detail="Products not found")
-
-        for product in products:
-            db.delete(product)
+        # Soft delete in one statement; purge.purge_deleted_products removes the rows later in small batches.
+        deleted_ids = db.execute(
+            update(models.Products)
+            .where(models.Products.product_id.in_(product_ids), models.Products.is_deleted == False)
+            .values(is_deleted=True, deleted_at=func.now())
+            .returning(models.Products.product_id)
+        ).scalars().all()
+        product_summary.refresh(db, deleted_ids)
         db.commit()
+        facets.update(db, deleted_ids)
 
-        return {"status": "200", "message": "Products deleted successfully!"}
+        if not deleted_ids:
+            response.status_code = 404
+            return {"status": "404", "message": "Products not found"}
+
+        return {"status": "200", "message": "Products deleted successfully!", "data": {"product_ids": deleted_ids}}
     except Exception as e:
         response.status_code = 500
         return {"status": "500", "message": "Internal server error"}
@@ -586,7 +670,7 @@ def search_products(response: Response, search_term: str, db: Session = Depends(
         search_brand = db.query(models.Brand).filter(
             (models.Brand.brand_name.ilike(f"%{search_term}%"))).all()
         search_results = db.query(models.Products).filter(
-            (models.Products.product_name.ilike(f"%{search_term}%"))).all()
+            (models.Products.product_name.ilike(f"%{search_term}%")), models.Products.is_deleted == False).all()
 
 
         if not search_results:
@@ -609,7 +693,8 @@ def get_categories_and_banners_and_deals(response: Response, db: Session = Depen
     try:
         fetch_categories = db.query(models.Categories).all()
         fetch_banners = db.query(models.PromotionalBanners).all()
-        deal_products = db.query(models.Products).filter(models.Products.deal == True).all()
+        deals.ensure_loaded(db)
+        deal_products = [deals.public(deal) for deal in deals.index.all_active()]
 
         if not fetch_categories or not fetch_banners or not deal_products:
             return {"status": 204, "message": "No data available", "data": {}}
@@ -628,6 +713,102 @@ def get_categories_and_banners_and_deals(response: Response, db: Session = Depen
         return {"status": 204, "message": "Error", "data": {}}
 
 
+@app.get("/deals")
+def get_active_deals(shop_id: int | None = None, company_name: str | None = None, db: Session = Depends(get_db)):
+    deals.ensure_loaded(db)
+    if shop_id is not None:
+        active = deals.index.for_shop(shop_id)
+    elif company_name is not None:
+        active = deals.index.for_company(company_name)
+    else:
+        active = deals.index.all_active()
+    if not active:
+        return {"status": 204, "message": "No active deals", "data": []}
+    return {"status": 200, "message": "Active deals fetched", "data": [deals.public(deal) for deal in active]}
+
+
+@app.post("/deals")
+def create_deal(deal: schemas.Deals, response: Response, db: Session = Depends(get_db),
+                company: schemas.Identity = Depends(auth.current_company)):
+    if deal.deal_end <= deal.deal_start:
+        response.status_code = 400
+        return {"status": 400, "message": "deal_end must be after deal_start", "data": {}}
+    shop = db.query(models.Shops).filter(models.Shops.shop_id == deal.shop_id,
+                                         models.Shops.company_name == company.company_name).first()
+    if shop is None:
+        response.status_code = 404
+        return {"status": 404, "message": "Shop not found", "data": {}}
+    try:
+        new_deal = models.Deals(**deal.model_dump())
+        db.add(new_deal)
+        jobs.enqueue(db, "repricing.run", unique=True)
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        response.status_code = 404
+        return {"status": 404, "message": "Product not found", "data": {}}
+    return {"status": 200, "message": "Deal created", "data": deals.reindex(db, new_deal.deal_id)}
+
+
+@app.put("/deals/{deal_id}")
+def edit_deal(deal_id: int, editDeal: schemas.DealEdit, response: Response, db: Session = Depends(get_db),
+              company: schemas.Identity = Depends(auth.current_company)):
+    owned = models.Deals.shop_id.in_(
+        select(models.Shops.shop_id).where(models.Shops.company_name == company.company_name))
+    edited = update_returning(db, models.Deals, editDeal.model_dump(exclude_unset=True),
+                              models.Deals.deal_id == deal_id, owned)
+    if edited is None:
+        db.rollback()
+        response.status_code = 404
+        return {"status": 404, "message": "Deal not found", "data": {}}
+    if edited.deal_end <= edited.deal_start:
+        db.rollback()
+        response.status_code = 400
+        return {"status": 400, "message": "deal_end must be after deal_start", "data": {}}
+    jobs.enqueue(db, "repricing.run", unique=True)
+    db.commit()
+    return {"status": 200, "message": "Deal updated", "data": deals.reindex(db, deal_id)}
+
+
+@app.delete("/deals/{deal_id}")
+def delete_deal(deal_id: int, response: Response, db: Session = Depends(get_db),
+                company: schemas.Identity = Depends(auth.current_company)):
+    deleted = db.execute(delete(models.Deals).where(
+        models.Deals.deal_id == deal_id,
+        models.Deals.shop_id.in_(select(models.Shops.shop_id).where(models.Shops.company_name == company.company_name)),
+    ).returning(models.Deals.deal_id)).first()
+    if deleted is None:
+        response.status_code = 404
+        return {"status": 404, "message": "Deal not found", "data": {}}
+    jobs.enqueue(db, "repricing.run", unique=True)
+    db.commit()
+    deals.index.remove(deal_id)
+    return {"status": 200, "message": "Deal deleted", "data": {"deal_id": deal_id}}
+
+
+@app.post("/discountRules")
+def create_discount_rule(rule: schemas.DiscountRule, response: Response, db: Session = Depends(get_db),
+                         admin: schemas.Identity = Depends(auth.current_admin)):
+    if rule.scope not in ("all", "brand", "category", "product") or (rule.scope != "all") != (rule.target_id is not None):
+        response.status_code = 400
+        return {"status": 400, "message": "scope must be all, or brand/category/product with a target_id", "data": {}}
+    if not 0 < rule.percent <= 100:
+        response.status_code = 400
+        return {"status": 400, "message": "percent must be between 0 and 100", "data": {}}
+    new_rule = db.execute(insert(models.DiscountRule).values(**rule.model_dump())
+                          .returning(models.DiscountRule)).scalars().one()
+    jobs.enqueue(db, "repricing.run", unique=True)
+    db.commit()
+    return {"status": 200, "message": "Discount rule created", "data": new_rule}
+
+
+@app.post("/reprice")
+def reprice_variants(db: Session = Depends(get_db), company: schemas.Identity = Depends(auth.current_company)):
+    jobs.enqueue(db, "repricing.run", unique=True)
+    db.commit()
+    return {"status": 202, "message": "Repricing queued", "data": {}}
+
+
 @app.get("/getAllCategoriesProducts")
 async def get_all_products_in_categories(response: Response, db: Session = Depends(get_db)):
     try:
@@ -637,7 +818,8 @@ async def get_all_products_in_categories(response: Response, db: Session = Depen
         for category in product_categories:
             products = db.query(models.Products).join(models.CategoryProduct,
                 models.Products.product_id == models.CategoryProduct.product_id
-            ).filter(models.CategoryProduct.category_id == category.category_id).all()
+            ).filter(models.CategoryProduct.category_id == category.category_id,
+                     models.Products.is_deleted == False).all()
 
             category_details = {
                 "category_id": category.category_id,
@@ -684,12 +866,14 @@ async def get_all_products_in_categories(response: Response, db: Session = Depen
         feature = db.query(models.FreatureList).all()
         product_categories = db.query(models.Categories).all()
 
-        recomended_products = []
+        recommendations.cache.ensure_loaded(db)
+        recomended_products = recommendations.cache.for_product(recommendations.OVERALL)
         category_details_variants = []
         for category in product_categories:
             products = db.query(models.Products).join(models.CategoryProduct,
                 models.Products.product_id == models.CategoryProduct.product_id
-            ).filter(models.CategoryProduct.category_id == category.category_id).all()
+            ).filter(models.CategoryProduct.category_id == category.category_id,
+                     models.Products.is_deleted == False).all()
 
             category_details = {
                 "category_id": category.category_id,
@@ -731,49 +915,19 @@ async def get_all_products_in_categories(response: Response, db: Session = Depen
         return {"status": 500, "message": "Internal Server Error", "data": []}
 
 @app.get("/homescreen")
-def get_categories_and_banners_and_deals(response: Response, db: Session = Depends(get_db)):
+def get_categories_and_banners_and_deals(response: Response, company_id: int | None = None,
+                                         db: Session = Depends(get_db)):
     try:
         fetch_categories = db.query(models.Categories).all()
-        fetch_shop_banner = db.query(models.Shops).all()
-        fetch_deals = db.query(models.Products).limit(3).all()
-
-        shop_deals = []
-        shop_details = []
-        for shop in fetch_shop_banner:
-            shop_images = {
-                "shop_id": shop.shop_id,
-                "shop_name": shop.shop_name,
-                "shop_image": shop.shop_image
-            }
-            shop_details.append(shop_images)
-
-        for deal in fetch_deals:
-            deal_products = {
-                "product_id": deal.product_id,
-                "product_name": deal.product_name,
-                "details": deal.details,
-                "variants": [],
-            }
-
-            product_variant = db.query(models.ProductVariant).filter(
-                models.ProductVariant.product_id == deal.product_id).first()
-            if product_variant:
-                variant_details = {
-                    "variant_id": product_variant.variant_id,
-                    "variant_cost": product_variant.variant_cost,
-                    "count": product_variant.count,
-                    "brand_name": product_variant.brand_name,
-                    "discounted_cost": product_variant.discounted_cost,
-                    "discount": product_variant.discount,
-                    "quantity": product_variant.quantity,
-                    "description": product_variant.description,
-                    "image": product_variant.image,
-                    "ratings": product_variant.ratings
-                }
-
-                deal_products["variants"].append(variant_details)
-
-            shop_deals.append(deal_products)
+        deals.ensure_loaded(db)
+        shop_deals = [deals.public(deal) for deal in deals.index.all_active()[:3]]
+        popularity.cache.ensure_loaded(db)
+        shop_details = popularity.cache.top("shop", company_id)
+        if not shop_details:
+            # Nothing ranked yet (a new install): list the shops as before.
+            fetch_shop_banner = db.query(models.Shops).limit(popularity.TOP_N).all()
+            shop_details = [{"shop_id": shop.shop_id, "shop_name": shop.shop_name, "shop_image": shop.shop_image}
+                            for shop in fetch_shop_banner]
 
         return {
             "status": 200,
@@ -781,6 +935,7 @@ def get_categories_and_banners_and_deals(response: Response, db: Session = Depen
             "data": {
                 "categories": fetch_categories,
                 "popular shops": shop_details,
+                "popular products": popularity.cache.top("product", company_id),
                 "today's deals": shop_deals
             },
         }
@@ -878,6 +1033,101 @@ def add_to_cart(customer_contact: int, cart_Item: dict = Body(...), db: Session
 
 
 
+@app.post("/checkout")
+def checkout_cart(order: schemas.Checkout, response: Response, db: Session = Depends(get_db),
+                  customer: schemas.Identity = Depends(auth.current_customer)):
+    try:
+        booking = checkout.place_order(db, customer.contact, order.address_id, order.cart_id, order.coupon_id)
+        return {"status": 200, "message": "Order placed successfully!", "data": booking}
+    except checkout.CheckoutError as e:
+        response.status_code = e.status
+        return {"status": e.status, "message": e.message, "data": e.data}
+
+
+@app.post("/startFlashSale")
+def start_flash_sale(sale: schemas.FlashSale, response: Response, db: Session = Depends(get_db),
+                     company: schemas.Identity = Depends(auth.current_company)):
+    if not 1 <= sale.shards <= 256:
+        response.status_code = 400
+        return {"status": 400, "message": "shards must be between 1 and 256", "data": {}}
+    try:
+        started = inventory.start_flash_sale(db, sale.variant_id, sale.shards, sale.ends_at)
+    except LookupError:
+        response.status_code = 404
+        return {"status": 404, "message": "Variant not found", "data": {}}
+    if not started:
+        db.rollback()
+        response.status_code = 409
+        return {"status": 409, "message": "Flash sale already running", "data": {}}
+    db.commit()
+    return {"status": 200, "message": "Flash sale started", "data": sale}
+
+
+@app.post("/endFlashSale/{variant_id}")
+def end_flash_sale(variant_id: int, response: Response, db: Session = Depends(get_db),
+                   company: schemas.Identity = Depends(auth.current_company)):
+    if not inventory.end_flash_sale(db, variant_id):
+        response.status_code = 404
+        return {"status": 404, "message": "No flash sale for this variant", "data": {}}
+    db.commit()
+    return {"status": 200, "message": "Flash sale ended", "data": {"variant_id": variant_id}}
+
+
+@app.get("/invoice/{order_id}")
+def get_invoice(order_id: int, response: Response, db: Session = Depends(get_db),
+                identity: schemas.Identity = Depends(auth.current_identity)):
+    invoice = invoices.get_invoice(db, order_id)
+    if invoice is None or (invoice["user_contact"] != identity.contact if identity.role == "customer"
+                           else invoice["company_name"] != identity.company_name):
+        response.status_code = 404
+        return {"status": 404, "message": "Invoice not found", "data": {}}
+    return StreamingResponse(invoices.stream(invoice), media_type="text/html",
+                             headers={"Content-Disposition": f'inline; filename="{invoices.file_name(invoice)}"'})
+
+
+@app.get("/analytics/sales")
+def sales_report(response: Response, start: date, end: date, group_by: str = "day", shop_id: int | None = None,
+                 db: Session = Depends(get_db), company: schemas.Identity = Depends(auth.current_company)):
+    groups = [group for group in group_by.split(",") if group]
+    if not groups or any(group not in analytics.GROUP_COLUMNS for group in groups):
+        response.status_code = 400
+        return {"status": 400, "message": f"group_by must be a comma-separated subset of "
+                                          f"{', '.join(analytics.GROUP_COLUMNS)}", "data": []}
+    data = analytics.sales(db, company.company_name, start, end, groups, shop_id)
+    return {"status": 200, "message": "Sales fetched", "data": data}
+
+
+@app.get("/serviceability/{pincode}")
+def get_serviceability(pincode: int, company_id: int, db: Session = Depends(get_db)):
+    serviceability.service_map.ensure_loaded(db)
+    quote = serviceability.service_map.quote(company_id, pincode)
+    if quote is None:
+        return {"status": 204, "message": "Delivery is not available to this pincode", "data": {}}
+    return {"status": 200, "message": "Delivery quote fetched", "data": quote}
+
+
+MAX_NEARBY_SHOPS = 50
+
+
+@app.get("/shops/nearby")
+def nearby_shops(response: Response, lat: float, lng: float, k: int = 10, company_name: str | None = None,
+                 radius_km: float | None = None, db: Session = Depends(get_db)):
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180) or not 1 <= k <= MAX_NEARBY_SHOPS:
+        response.status_code = 400
+        return {"status": 400, "message": f"lat/lng must be a valid position and k between 1 and {MAX_NEARBY_SHOPS}",
+                "data": []}
+    geo.shops.ensure_loaded(db)
+    nearest = geo.shops.nearby(lat, lng, k, company_name, radius_km)
+    if not nearest:
+        return {"status": 204, "message": "No shops nearby", "data": []}
+    return {"status": 200, "message": "Nearby shops fetched", "data": nearest}
+
+
+@app.get("/jobMetrics")
+def job_metrics(db: Session = Depends(get_db), company: schemas.Identity = Depends(auth.current_company)):
+    return {"status": 200, "message": "Job queue metrics", "data": jobs.metrics(db)}
+
+
 # @app.post('/bookOrder')
 # def add_bookings(bookOrder: schemas.Bookings, response: Response, db: Session = Depends(get_db)):
 #     try:
@@ -914,81 +1164,76 @@ def add_to_cart(customer_contact: int, cart_Item: dict = Body(...), db: Session
 #         response.status_code = 400
 #         return {"status": 400, "message": "Error creating booking order", "data": {}}
 
-# @app.get("/getOrders")
-# def get_Orders(response: Response, db: Session = Depends(get_db)):
-#     try:
-#         orders = db.query(models.Bookings).all()
-#         if not orders:
-#             return {"status": 204, "message": "No Booking Orders available", "data": []}
-#
-#         return {"status": 200, "message": "Booking Orders  fetched", "data": orders}
-#     except IntegrityError as e:
-#         print(repr(e))
-#         response.status_code = 200
-#         return {"status": 204, "message": "Error", "data": []}
-#
-#
-# @app.get("/getOrders/{order_id}")
-# def get_oreders_by_order_id(response: Response, order_id: int, db: Session = Depends(get_db)):
-#     try:
-#         fetch_orders_id = db.query(models.Bookings).filter(models.Bookings.order_id == order_id).all()
-#         if not fetch_orders_id:
-#             return {"status": 204, "message": "No Booking Orders found", "data": {}}
-#
-#         return {"status": 200, "message": "Booking Orders fetched", "data": fetch_orders_id}
-#     except IntegrityError:
-#         response.status_code = 200
-#         return {"status": 204, "message": "Error", "data": {}}
+@app.get("/getOrders")
+def get_orders(response: Response, before_date: date | None = None, before_id: int | None = None,
+               limit: int = orders.PAGE_SIZE, db: Session = Depends(get_db),
+               customer: schemas.Identity = Depends(auth.current_customer)):
+    if (before_date is None) != (before_id is None):
+        response.status_code = 400
+        return {"status": 400, "message": "before_date and before_id must be given together", "data": [],
+                "next": None}
+    page, cursor = orders.history(db, customer.contact, before_date, before_id, limit)
+    if not page:
+        return {"status": 204, "message": "No Booking Orders available", "data": [], "next": None}
+    return {"status": 200, "message": "Booking Orders fetched", "data": page, "next": cursor}
+
+
+@app.get("/getOrders/{order_id}")
+def get_order_by_order_id(response: Response, order_id: int, db: Session = Depends(get_db),
+                          customer: schemas.Identity = Depends(auth.current_customer)):
+    order = orders.order_detail(db, customer.contact, order_id)
+    if order is None:
+        response.status_code = 404
+        return {"status": 404, "message": "No Booking Orders found", "data": {}}
+    return {"status": 200, "message": "Booking Orders fetched", "data": order}
+
+
+@app.get("/checkoutScreen/{cart_id}")
+def get_checkout_screen(response: Response, cart_id: int, address_id: int | None = None, db: Session = Depends(get_db),
+                        customer: schemas.Identity = Depends(auth.current_customer)):
+    screen = checkout.price_cart(db, customer.contact, cart_id, address_id)
+    if screen is None:
+        response.status_code = 404
+        return {"status": 404, "message": "No cart items found", "data": {}}
+    return {"status": 200, "message": "CHECKOUT SCREEN fetched", "data": screen}
+
+
+@app.get("/coupons")
+def get_coupons(company_id: int, db: Session = Depends(get_db)):
+    coupons.cache.ensure_loaded(db)
+    active = coupons.cache.for_company(company_id)
+    if not active:
+        return {"status": 204, "message": "No active coupons", "data": []}
+    return {"status": 200, "message": "Coupons fetched", "data": active}
+
+
+@app.post("/coupons")
+def create_coupon(coupon: schemas.CouponCreate, db: Session = Depends(get_db),
+                  company: schemas.Identity = Depends(auth.current_company)):
+    company_id = select(models.Companies.company_id).where(
+        models.Companies.company_name == company.company_name).scalar_subquery()
+    new_coupon = db.execute(insert(models.Coupon).values(**coupon.model_dump(), company_id=company_id)
+                            .returning(models.Coupon)).scalars().one()
+    db.commit()
+    coupons.cache.load(db)
+    return {"status": 200, "message": "Coupon created", "data": new_coupon}
+
+
+@app.put("/coupons/{coupon_id}")
+def edit_coupon(coupon_id: int, editCoupon: schemas.CouponEdit, response: Response, db: Session = Depends(get_db),
+                company: schemas.Identity = Depends(auth.current_company)):
+    owned = models.Coupon.company_id == select(models.Companies.company_id).where(
+        models.Companies.company_name == company.company_name).scalar_subquery()
+    edited = update_returning(db, models.Coupon, editCoupon.model_dump(exclude_unset=True),
+                              models.Coupon.coupon_id == coupon_id, owned)
+    if edited is None:
+        db.rollback()
+        response.status_code = 404
+        return {"status": 404, "message": "Coupon not found", "data": {}}
+    db.commit()
+    coupons.cache.load(db)
+    return {"status": 200, "message": "Coupon updated", "data": edited}
 
-# @app.get("/checkoutScreen/{cart_id}")
-# def get_cart_item_count_with_price_and_discount_sum(response: Response, cart_id: int, db: Session = Depends(get_db)):
-#
-#     try:
-#         fetch_cart_items = db.query(models.Cart).filter(models.Cart.cart_id == cart_id).all()
-#         if not fetch_cart_items:
-#             return {"status": 404, "message": "No cart items found", "data": {}}
-#
-#         cart_item_count = 0
-#         cart_total = 0
-#         discount_sum = 0
-#         coupon_applied = None
-#         delivery_charges = 40.50
-#         total_bill = 0
-#
-#         if models.Cart.coupon_id:
-#             applied_coupon = db.query(models.Coupon).filter(models.Coupon.coupon_id == models.Cart.coupon_id).first()
-#             if applied_coupon:
-#                 coupon_applied = applied_coupon.coupon_name
-#         #
-#         # for cart_item in fetch_cart_items:
-#         #     product_id = cart_item.product_id
-#         #     variant_id = cart_item.variant_id
-#         #
-#         #     product = db.query(models.Products).filter(models.Products.product_id == product_id).first()
-#         #     variant = db.query(models.ProductVariant).filter(models.ProductVariant.variant_id == variant_id).first()
-#         #
-#         #     if variant:
-#         #         price = variant.variant_price
-#         #         discount_amount = variant.discounted_cost
-#         #     else:
-#         #         price = product.price
-#         #         discount_amount = product.discounted_cost
-#         #
-#         #     discount_sum += variant.discounted_cost * cart_item.item_count
-#         #     discount_sum += product.discounted_cost * cart_item.item_count
-#         #
-#         #     cart_item_count += cart_item.item_count
-#         #     cart_total += price * cart_item.item_count
-#         #
-#         # total_bill = cart_total - discount_sum + delivery_charges
-#         #
-#         # discount_sum = cart_total - discount_sum
-#
-#         return {"status": 200, "message": "CHECKOUT SCREEN fetched", "data": {"cart_item_count": cart_item_count, "cart_total": cart_total, "discount_sum": discount_sum, "coupon_applied": coupon_applied, "delivery_charges": delivery_charges, "total_bill": total_bill}}
-#     except IntegrityError as e:
-#         print(repr(e))
-#         response.status_code = 500
-#         return {"status": 500, "message": "Error", "data": {}}
 
 @app.get("/your_cart/{customer_contact}")
 def get_your_cart(response: Response, customer_contact: int, db: Session = Depends(get_db)):
@@ -1025,11 +1270,14 @@ def get_your_cart(response: Response, customer_contact: int, db: Session = Depen
                 variant_costs[variant_id] += variant_cost
             else:
                 variant_costs[variant_id] = variant_cost
-            # for variant_id, total_cost in variant_costs.items():
-            #     print(f"Variant ID: {variant_id}, Total Cost: {total_cost}")
             total_cost = sum(variant_costs.values())
 
-        return {"status": 200, "message": "Cart items fetched", "data": { "cart_items": cart_items_with_customer_contact, "cart_item_count": len(cart_items), "total_price": total_cost} }
+        # The coupon checkout would apply: the best one for the payable total (counts, discounted costs).
+        screen = checkout.price_cart(db, cart.customer_contact, cart.cart_id)
+        best_coupon = coupons.cache.get(cart.company_id, screen.coupon_id)
+        coupon_discount = screen.coupon_discount
+        return {"status": 200, "message": "Cart items fetched", "data": { "cart_items": cart_items_with_customer_contact, "cart_item_count": len(cart_items), "total_price": total_cost,
+                                                                          "best_coupon": best_coupon, "coupon_discount": coupon_discount} }
     except IntegrityError as e:
         print(repr(e))
         response.status_code = 500
@@ -0,0 +1,42 @@
+"""Schema and data migrations, run once per deploy before the API and job workers start:
+
+    python -m app.migrate
+
+Creates the tables, columns and indexes added to app.models since the database was created
+(database.sync_schema), drops the indexes removed from it (DROPPED_INDEXES), lets variants
+written before base_discount existed adopt their discount (repricing.migrate) and fills
+product_summaries if it is empty (product_summary.backfill). Every step is idempotent, so
+running it again is harmless.
+"""
+import argparse
+import sys
+import time
+
+from sqlalchemy import text
+
+from . import product_summary, repricing
+from .database import engine, sync_schema
+
+# ix_products_live only repeated the primary key for live rows.
+DROPPED_INDEXES = ["ix_products_live"]
+
+
+def migrate():
+    sync_schema(engine)
+    with engine.begin() as conn:
+        for name in DROPPED_INDEXES:
+            conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+    repricing.migrate()
+    product_summary.backfill()
+
+
+def main(argv=None):
+    argparse.ArgumentParser(description="Bring the database schema and derived tables up to date.").parse_args(argv)
+    started = time.perf_counter()
+    migrate()
+    print(f"database migrated in {time.perf_counter() - started:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,5 +1,6 @@
-from sqlalchemy import Column, String, BIGINT, Date, JSON, ForeignKey, Time, Boolean, Float, Integer, DateTime
+from sqlalchemy import Column, String, BIGINT, Date, JSON, ForeignKey, Time, Boolean, Float, Integer, DateTime, Index, Numeric, Sequence
 from sqlalchemy.orm import validates, relationship
+from sqlalchemy.sql import func
 from sqlalchemy.sql.expression import text
 from sqlalchemy.sql.sqltypes import TIMESTAMP
 from .database import Base
@@ -55,6 +56,11 @@ class Shops(Base):
     is_available = Column(Boolean, nullable=False)
     company_name = Column(String, ForeignKey(
         "companies.company_name", ondelete="CASCADE"), nullable=False)
+    # Parsed from shop_coordinates (see app/geo.py); NULL while unparsed or unparseable.
+    latitude = Column(Float, nullable=True)
+    longitude = Column(Float, nullable=True)
+    updated_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=text('now()'),
+                        onupdate=func.now())
 
     company = relationship("Companies")
 
@@ -67,9 +73,17 @@ class Products(Base):
         "brands.brand_id", ondelete="CASCADE"), nullable=False)
     product_name = Column(String, nullable=False)
     details = Column(String, nullable=False)
+    is_deleted = Column(Boolean, nullable=False, server_default=text('false'))
+    deleted_at = Column(TIMESTAMP(timezone=True), nullable=True)
 
     brand = relationship("Brand")
 
+    __table_args__ = (
+        # /addProducts and the catalog import look products up by name; the purge job reads only deleted rows.
+        Index("ix_products_name", "product_name"),
+        Index("ix_products_deleted", "deleted_at", postgresql_where=text("is_deleted")),
+    )
+
 
 class ProductVariant(Base):
     __tablename__ = "product_variants"
@@ -87,6 +101,9 @@ class ProductVariant(Base):
     ratings = Column(Integer, nullable=True)
     product_id = Column(BIGINT, ForeignKey(
         "products.product_id", ondelete="CASCADE"), nullable=False)
+    # Standing discount in percent; app.repricing derives discounted_cost and discount from it,
+    # the discount rules and the active deals.
+    base_discount = Column(Float, nullable=True)
 
     product = relationship("Products")
 
@@ -182,6 +199,7 @@ class CartItem(Base):
     variant_id = Column(BIGINT, ForeignKey(
         "product_variants.variant_id", ondelete="CASCADE"), nullable=False)
     count = Column(BIGINT, nullable=False)
+    created_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=text('now()'))
 
     product = relationship("Products")
     variant = relationship("ProductVariant")
@@ -197,11 +215,17 @@ class Cart(Base):
     customer_contact = Column(BIGINT, ForeignKey("customers.customer_contact", ondelete="CASCADE"), nullable=False)
     # coupon_id = Column(Integer, ForeignKey("coupons.coupon_id", ondelete="CASCADE"), nullable=True)
     products = Column(JSON, nullable=True)
+    # Fulfilment plan for the customer's latest address, kept current by app.fulfilment.
+    shop_id = Column(BIGINT, ForeignKey("shops.shop_id", ondelete="SET NULL"), nullable=True)
+    delivery_km = Column(Float, nullable=True)
+    delivery_fee = Column(Float, nullable=True)
+    planned_at = Column(TIMESTAMP(timezone=True), nullable=True)
     # creation_time = Column(TIMESTAMP(timezone=True), nullable=False, server_default=text("now()"))
 
     company = relationship("Companies")
     user = relationship("User")
-    cart_items = relationship('CartItem', back_populates='cart')
+    # cart_items.cart_id cascades in the database; passive_deletes keeps the ORM from nulling it first.
+    cart_items = relationship('CartItem', back_populates='cart', passive_deletes=True)
 
 
     # coupon = relationship("Coupon")
@@ -249,11 +273,25 @@ class Bookings(Base):
     invoice_number = Column(String, nullable=False, unique=True)
     invoice_amount = Column(Float, nullable=False)
     products = Column(JSON, nullable=False)
+    company_id = Column(BIGINT, ForeignKey(
+        "companies.company_id", ondelete="SET NULL"), nullable=True)
+    shop_id = Column(BIGINT, ForeignKey(
+        "shops.shop_id", ondelete="SET NULL"), nullable=True)
+    coupon_id = Column(Integer, ForeignKey(
+        "coupons.coupon_id", ondelete="SET NULL"), nullable=True)
+    coupon_discount = Column(Float, nullable=False, server_default=text("0"))
 
     customer = relationship("User")
     address = relationship('Addresses')
     cart = relationship("Cart")
 
+    __table_args__ = (
+        # Order history pages are read from this index alone (index-only scan).
+        Index("ix_bookings_customer_history", "user_contact", "order_date", "order_id",
+              postgresql_include=["order_number", "order_amount", "invoice_number"]),
+        Index("ix_bookings_order_date", "order_date"),
+    )
+
     # company = relationship("Companies")
 
     @validates('user_contact', 'address_id','order_date')
@@ -264,6 +302,24 @@ class Bookings(Base):
             return value
 
 
+class OrderItem(Base):
+    """One row per booked variant, written by checkout next to the bookings.products snapshot."""
+    __tablename__ = "order_items"
+    __table_args__ = (
+        Index("ix_order_items_product", "product_id"),
+    )
+
+    order_id = Column(BIGINT, ForeignKey(
+        "bookings.order_id", ondelete="CASCADE"), nullable=False, primary_key=True)
+    variant_id = Column(BIGINT, nullable=False, primary_key=True)
+    product_id = Column(BIGINT, nullable=True)
+    product_name = Column(String, nullable=True)
+    quantity = Column(String, nullable=True)
+    count = Column(Integer, nullable=False)
+    unit_price = Column(Float, nullable=True)
+    line_total = Column(Float, nullable=True)
+
+
 class Coupon(Base):
     __tablename__ = "coupons"
 
@@ -273,6 +329,11 @@ class Coupon(Base):
     discount_amount = Column(Float, nullable=False)
     isActive = Column(Boolean, nullable=False)
     description = Column(String, nullable=False)
+    min_order_amount = Column(Float, nullable=False, server_default=text("0"))
+    # The company whose carts the coupon applies to (NULL on coupons created before this column; they apply to none).
+    company_id = Column(BIGINT, ForeignKey("companies.company_id", ondelete="CASCADE"), nullable=True)
+    updated_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=text('now()'),
+                        onupdate=func.now())
 
 
 class Brand(Base):
@@ -299,8 +360,18 @@ class CategoryProduct(Base):
         "products.product_id", ondelete="CASCADE"), nullable=False, primary_key=True)
     category_id = Column(BIGINT, ForeignKey(
         "categories.category_id", ondelete="CASCADE"), nullable=False, primary_key=True)
+    # Copy of product_summaries.min_cost (NULL while the product is deleted or has no variants),
+    # so a price-sorted category page is one range scan of ix_product_categories_price.
+    min_cost = Column(Float, nullable=True)
     composite_key = composite(CompositeKey, product_id, category_id)
 
+    __table_args__ = (
+        Index("ix_product_categories_price", "category_id", "min_cost", "product_id",
+              postgresql_where=text("min_cost IS NOT NULL")),
+        Index("ix_product_categories_listing", "category_id", "product_id",
+              postgresql_where=text("min_cost IS NOT NULL")),
+    )
+
     customer = relationship("Products")
     company = relationship("Categories")
 
@@ -314,6 +385,9 @@ class CategoryProduct(Base):
 
 class Deals(Base):
     __tablename__ = "deals"
+    __table_args__ = (
+        Index("ix_deals_updated_at", "updated_at"),
+    )
 
     deal_id = Column(Integer, primary_key=True, autoincrement=True)
     shop_id = Column(Integer, ForeignKey(
@@ -326,6 +400,8 @@ class Deals(Base):
     deal_discount = Column(Integer, nullable=False)
     deal_start = Column(DateTime, nullable=False)
     deal_end = Column(DateTime, nullable=False)
+    updated_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=text('now()'),
+                        onupdate=func.now())
 
     product = relationship("Products")
     shop = relationship("Shops")
@@ -364,6 +440,7 @@ class FavItem(Base):
     variant_id = Column(Integer, ForeignKey("product_variants.variant_id", ondelete="CASCADE"), nullable=True)
     product_id = Column(Integer, ForeignKey("products.product_id", ondelete="CASCADE"), nullable=True)
     shop_id = Column(Integer, ForeignKey("shops.shop_id", ondelete="CASCADE"), nullable=True)
+    created_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=text('now()'))
 
 
     # Establish a relationship with the ProductVariant table
@@ -377,4 +454,221 @@ class FavItem(Base):
         if isinstance(value, str) and value == '':
             return None
         else:
-            return value
\ No newline at end of file
+            return value
+
+class CatalogImport(Base):
+    __tablename__ = "catalog_imports"
+
+    import_id = Column(BIGINT, primary_key=True, autoincrement=True)
+    filename = Column(String, nullable=True)
+    status = Column(String, nullable=False, server_default=text("'queued'"))
+    processed_rows = Column(BIGINT, nullable=False, server_default=text("0"))
+    valid_rows = Column(BIGINT, nullable=False, server_default=text("0"))
+    error_rows = Column(BIGINT, nullable=False, server_default=text("0"))
+    errors = Column(JSON, nullable=False, server_default=text("'[]'"))
+    message = Column(String, nullable=True)
+    created_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=text('now()'))
+    finished_at = Column(TIMESTAMP(timezone=True), nullable=True)
+
+
+class CatalogImportRow(Base):
+    """Staging rows COPYed from an uploaded catalog before they are merged into the catalog tables."""
+    __tablename__ = "catalog_import_rows"
+    __table_args__ = {"prefixes": ["UNLOGGED"]}
+
+    import_id = Column(BIGINT, ForeignKey(
+        "catalog_imports.import_id", ondelete="CASCADE"), nullable=False, primary_key=True)
+    line_no = Column(BIGINT, nullable=False, primary_key=True)
+    product_name = Column(String, nullable=False)
+    details = Column(String, nullable=False)
+    brand_name = Column(String, nullable=False)
+    brand_image = Column(String, nullable=False)
+    categories = Column(JSON, nullable=False)
+    variant_cost = Column(Float, nullable=False)
+    count = Column(Integer, nullable=False)
+    discounted_cost = Column(Float, nullable=True)
+    discount = Column(BIGINT, nullable=True)
+    quantity = Column(String, nullable=False)
+    description = Column(String, nullable=False)
+    image = Column(JSON, nullable=False)
+    ratings = Column(Integer, nullable=True)
+
+
+class FlashSale(Base):
+    __tablename__ = "flash_sales"
+
+    variant_id = Column(BIGINT, ForeignKey(
+        "product_variants.variant_id", ondelete="CASCADE"), primary_key=True)
+    shards = Column(Integer, nullable=False)
+    started_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=text('now()'))
+    ends_at = Column(TIMESTAMP(timezone=True), nullable=True)
+
+    variant = relationship("ProductVariant")
+
+
+class VariantStockShard(Base):
+    __tablename__ = "variant_stock_shards"
+
+    variant_id = Column(BIGINT, ForeignKey(
+        "flash_sales.variant_id", ondelete="CASCADE"), primary_key=True)
+    shard_no = Column(Integer, primary_key=True)
+    count = Column(Integer, nullable=False)
+
+
+
+class Job(Base):
+    """Background work queued by app.jobs; workers claim queued rows whose run_at has passed."""
+    __tablename__ = "jobs"
+    __table_args__ = (
+        Index("ix_jobs_queued", "run_at", postgresql_where=text("status = 'queued'")),
+    )
+
+    job_id = Column(BIGINT, primary_key=True, autoincrement=True)
+    kind = Column(String, nullable=False)
+    payload = Column(JSON, nullable=False, server_default=text("'{}'"))
+    status = Column(String, nullable=False, server_default=text("'queued'"))
+    attempts = Column(Integer, nullable=False, server_default=text("0"))
+    max_attempts = Column(Integer, nullable=False, server_default=text("5"))
+    last_error = Column(String, nullable=True)
+    created_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=text('now()'))
+    run_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=text('now()'))
+    started_at = Column(TIMESTAMP(timezone=True), nullable=True)
+    finished_at = Column(TIMESTAMP(timezone=True), nullable=True)
+
+
+class DailySales(Base):
+    """Revenue and units per day, company, shop and product, maintained by app.analytics."""
+    __tablename__ = "daily_sales"
+
+    company_id = Column(BIGINT, primary_key=True)
+    day = Column(Date, primary_key=True)
+    shop_id = Column(BIGINT, primary_key=True)  # 0 when the booking has no shop
+    product_id = Column(BIGINT, primary_key=True)
+    orders = Column(Integer, nullable=False)
+    units = Column(BIGINT, nullable=False)
+    revenue = Column(Float, nullable=False)
+    coupon_discount = Column(Float, nullable=False, server_default=text("0"))
+
+
+class RollupWatermark(Base):
+    __tablename__ = "rollup_watermarks"
+
+    name = Column(String, primary_key=True)
+    last_order_id = Column(BIGINT, nullable=False, server_default=text("0"))
+    updated_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=text('now()'))
+
+
+class DiscountRule(Base):
+    """A percentage discount on every variant of a brand, category or product (or on all of them)."""
+    __tablename__ = "discount_rules"
+
+    rule_id = Column(Integer, primary_key=True, autoincrement=True)
+    scope = Column(String, nullable=False)  # all, brand, category or product
+    target_id = Column(BIGINT, nullable=True)
+    percent = Column(Float, nullable=False)
+    starts_at = Column(DateTime, nullable=True)
+    ends_at = Column(DateTime, nullable=True)
+    is_active = Column(Boolean, nullable=False, server_default=text('true'))
+    updated_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=text('now()'),
+                        onupdate=func.now())
+
+
+class RepricingRun(Base):
+    """The last completed app.repricing run (one row), so every worker can tell whether another one is due."""
+    __tablename__ = "repricing_runs"
+
+    run_id = Column(Integer, primary_key=True, autoincrement=False)  # always 1
+    ran_at = Column(DateTime, nullable=False)  # the time prices were computed for
+    last_edit = Column(TIMESTAMP(timezone=True), nullable=True)  # latest deal/rule updated_at it saw
+
+
+class CacheVersion(Base):
+    """A counter bumped by bulk writes that a per-process cache must reload after (see app.facets.invalidate)."""
+    __tablename__ = "cache_versions"
+
+    name = Column(String, primary_key=True)
+    version = Column(BIGINT, nullable=False, server_default=text("0"))
+    updated_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=text('now()'))
+
+
+class Pincode(Base):
+    """A delivery pincode and the position its serviceability is measured from."""
+    __tablename__ = "pincodes"
+
+    pincode = Column(BIGINT, primary_key=True, autoincrement=False)
+    city = Column(String, nullable=True)
+    state = Column(String, nullable=True)
+    latitude = Column(Float, nullable=False)
+    longitude = Column(Float, nullable=False)
+
+
+class Serviceability(Base):
+    """Which of a company's shops serve a pincode, and the delivery fee and ETA there (built by app.serviceability)."""
+    __tablename__ = "serviceability"
+
+    company_id = Column(BIGINT, ForeignKey("companies.company_id", ondelete="CASCADE"), primary_key=True)
+    pincode = Column(BIGINT, primary_key=True)
+    shop_ids = Column(JSON, nullable=False)  # nearest first
+    distance_km = Column(Float, nullable=False)  # to the nearest shop
+    band = Column(Integer, nullable=False)
+    fee = Column(Float, nullable=False)
+    eta_minutes = Column(Integer, nullable=False)
+    built_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=text('now()'))
+
+
+class ServiceabilityBuild(Base):
+    """The shops and pincodes the serviceability table was last built from (one row), see app.serviceability."""
+    __tablename__ = "serviceability_builds"
+
+    build_id = Column(Integer, primary_key=True, autoincrement=False)  # always 1
+    built_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=text('now()'))
+    shop_count = Column(BIGINT, nullable=False)
+    shops_updated_at = Column(TIMESTAMP(timezone=True), nullable=True)
+    pincode_count = Column(BIGINT, nullable=False)
+    pincode_checksum = Column(Numeric, nullable=True)  # sum of latitude + longitude
+
+
+class ProductRecommendation(Base):
+    """A product's rank-th most co-purchased product (built by app.recommendations)."""
+    __tablename__ = "product_recommendations"
+
+    product_id = Column(BIGINT, primary_key=True)  # 0 for the most co-purchased products overall
+    rank = Column(Integer, primary_key=True)
+    recommended_id = Column(BIGINT, nullable=False)
+    score = Column(Float, nullable=False)
+    built_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=text('now()'))
+
+
+class PopularItem(Base):
+    """A company's rank-th most popular shop or product by time-decayed score (built by app.popularity)."""
+    __tablename__ = "popular_items"
+
+    company_id = Column(BIGINT, primary_key=True)  # 0 across all companies
+    kind = Column(String, primary_key=True)  # shop or product
+    rank = Column(Integer, primary_key=True)
+    item_id = Column(BIGINT, nullable=False)
+    score = Column(Float, nullable=False)
+    built_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=text('now()'))
+
+
+class ProductSummary(Base):
+    """Aggregates of a live product's variants, maintained by app.product_summary on variant writes."""
+    __tablename__ = "product_summaries"
+
+    product_id = Column(BIGINT, ForeignKey("products.product_id", ondelete="CASCADE"), primary_key=True)
+    min_cost = Column(Float, nullable=False)  # lowest price paid, COALESCE(discounted_cost, variant_cost)
+    max_cost = Column(Float, nullable=False)
+    best_discount = Column(BIGINT, nullable=False)
+    total_stock = Column(BIGINT, nullable=False)
+    default_variant_id = Column(BIGINT, nullable=False)  # cheapest in-stock variant, else cheapest
+    primary_image = Column(String, nullable=True)
+    updated_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=text('now()'))
+
+    __table_args__ = (
+        Index("ix_product_summaries_price", "min_cost", "product_id"),
+    )
+
+# Order and invoice numbers are handed out in blocks by app.numbering; each nextval reserves
+# numbers [value * block_size, (value + 1) * block_size).
+order_number_blocks = Sequence("order_number_blocks", metadata=Base.metadata)
+invoice_number_blocks = Sequence("invoice_number_blocks", metadata=Base.metadata)
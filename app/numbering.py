@@ -0,0 +1,70 @@
+"""Order and invoice numbers.
+
+Numbers are allocated hi/lo style: a process reserves a block of BLOCK_SIZE consecutive
+numbers with one nextval() on a Postgres sequence and hands them out from memory, so only
+one order in BLOCK_SIZE pays for a sequence call. Sequences are never rolled back and every
+worker (and every forked uvicorn process, see the pid check) reserves its own block, so
+numbers are unique across workers and nodes without uniqueness-violation retries. Numbers
+increase within a worker but interleave across workers, and a restart leaves a gap.
+
+Formats are per company and come from ONECART_NUMBER_FORMATS, a JSON object keyed by
+company_id with "order" and/or "invoice" str.format templates, e.g.
+
+    {"1": {"order": "OC{date:%y%m%d}{n:07d}", "invoice": "OC/INV/{date:%Y}/{n:07d}"}}
+
+{n} is the allocated number and {date} the order date: the database's CURRENT_DATE, which
+checkout reads in its transaction and stamps bookings.order_date with, so the two always agree.
+"""
+import json
+import os
+import threading
+
+from sqlalchemy import select
+
+from . import models
+
+BLOCK_SIZE = 100
+
+DEFAULT_FORMATS = {"order": "OD{date:%Y%m%d}{n:08d}", "invoice": "INV{date:%Y%m%d}{n:08d}"}
+FORMATS = {str(company_id): formats
+           for company_id, formats in json.loads(os.environ.get("ONECART_NUMBER_FORMATS") or "{}").items()}
+
+
+class BlockAllocator:
+    def __init__(self, sequence, block_size=BLOCK_SIZE):
+        self.sequence = sequence
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._pid = None
+        self._next = self._end = 0
+
+    def allocate(self, db):
+        """Return the next number, reserving a new block through db when the current one is used up."""
+        with self._lock:
+            if self._next >= self._end or self._pid != os.getpid():
+                hi = db.execute(select(self.sequence.next_value())).scalar_one()
+                self._pid = os.getpid()
+                self._next, self._end = hi * self.block_size, (hi + 1) * self.block_size
+            number = self._next
+            self._next += 1
+            return number
+
+
+allocators = {
+    "order": BlockAllocator(models.order_number_blocks),
+    "invoice": BlockAllocator(models.invoice_number_blocks),
+}
+
+
+def format_number(kind, company_id, number, date):
+    template = FORMATS.get(str(company_id), {}).get(kind, DEFAULT_FORMATS[kind])
+    return template.format(n=number, date=date)
+
+
+def next_number(db, kind, company_id, date):
+    return format_number(kind, company_id, allocators[kind].allocate(db), date)
+
+
+def new_order_numbers(db, company_id, order_date):
+    """(order_number, invoice_number) for a new booking of company_id placed on order_date."""
+    return next_number(db, "order", company_id, order_date), next_number(db, "invoice", company_id, order_date)
@@ -0,0 +1,110 @@
+"""Order history and the normalized order_items table.
+
+Checkout writes order_items in the same statement as the booking, by expanding the
+bookings.products snapshot it has just built (ITEMS_FROM_SNAPSHOT). Bookings placed before
+order_items existed are filled in by the "orders.backfill_items" job:
+
+    python -m app.orders           # queue the backfill for the job workers
+    python -m app.orders --now     # or run it here
+
+Order history is paged with a keyset on (order_date, order_id) rather than OFFSET, so every
+page is one range scan of ix_bookings_customer_history no matter how deep the customer pages.
+"""
+import argparse
+import sys
+
+from sqlalchemy import text
+
+from . import jobs
+from .database import session_scope
+
+BACKFILL_BATCH = 1000
+PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+# Expands the products snapshot of the bookings in `source` (needs order_id and products).
+ITEMS_FROM_SNAPSHOT = """
+    INSERT INTO order_items (order_id, variant_id, product_id, product_name, quantity, count, unit_price, line_total)
+    SELECT source.order_id, i.variant_id, i.product_id, i.product_name, i.quantity, i.count, i.unit_price,
+           i.line_total
+    FROM {source} source
+    CROSS JOIN LATERAL json_to_recordset(CASE WHEN json_typeof(source.products) = 'array'
+                                              THEN source.products ELSE '[]' END)
+        AS i(variant_id bigint, product_id bigint, product_name text, quantity text, count integer,
+             unit_price double precision, line_total double precision)
+    WHERE i.variant_id IS NOT NULL AND i.count IS NOT NULL
+    ON CONFLICT DO NOTHING
+"""
+
+BACKFILL = text(f"""
+    WITH batch AS (
+        SELECT order_id, products FROM bookings WHERE order_id > :after ORDER BY order_id LIMIT :limit
+    ), items AS (
+        {ITEMS_FROM_SNAPSHOT.format(source="batch")}
+    )
+    SELECT MAX(order_id) FROM batch
+""")
+
+HISTORY = text("""
+    SELECT order_id, order_number, order_date, order_amount, invoice_number
+    FROM bookings
+    WHERE user_contact = :customer_contact
+      AND (CAST(:before_date AS date) IS NULL OR (order_date, order_id) < (:before_date, :before_id))
+    ORDER BY order_date DESC, order_id DESC
+    LIMIT :limit
+""")
+
+ORDER_DETAIL = text("""
+    SELECT b.*,
+           (SELECT COALESCE(json_agg(i ORDER BY i.variant_id), '[]')
+            FROM (SELECT variant_id, product_id, product_name, quantity, count, unit_price, line_total
+                  FROM order_items WHERE order_id = b.order_id) i) AS items
+    FROM bookings b
+    WHERE b.order_id = :order_id AND b.user_contact = :customer_contact
+""")
+
+
+def history(db, customer_contact, before_date=None, before_id=None, limit=PAGE_SIZE):
+    """One page of the customer's orders, newest first, and the cursor of the next page (or None).
+
+    The cursor is before_date and before_id together, as returned with the previous page.
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    rows = db.execute(HISTORY, {"customer_contact": customer_contact, "before_date": before_date,
+                                "before_id": before_id, "limit": limit}).mappings().all()
+    cursor = None
+    if len(rows) == limit:
+        cursor = {"before_date": rows[-1]["order_date"], "before_id": rows[-1]["order_id"]}
+    return [dict(row) for row in rows], cursor
+
+
+def order_detail(db, customer_contact, order_id):
+    row = db.execute(ORDER_DETAIL, {"order_id": order_id, "customer_contact": customer_contact}).mappings().first()
+    return dict(row) if row else None
+
+
+@jobs.handler("orders.backfill_items")
+def backfill_items(after=0, batch_size=BACKFILL_BATCH):
+    """Write order_items for every booking after order_id `after`, one transaction per batch."""
+    while True:
+        with session_scope() as db:
+            after = db.execute(BACKFILL, {"after": after, "limit": batch_size}).scalar()
+        if after is None:
+            return
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Backfill order_items from the bookings snapshots.")
+    parser.add_argument("--now", action="store_true", help="run the backfill here instead of queueing it")
+    args = parser.parse_args(argv)
+
+    if args.now:
+        backfill_items()
+    else:
+        with session_scope() as db:
+            jobs.enqueue(db, "orders.backfill_items", unique=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
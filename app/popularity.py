@@ -0,0 +1,184 @@
+"""Popular shops and products, ranked by time-decayed activity.
+
+Every order, cart add and favorite is an event worth ORDER_WEIGHT, CART_WEIGHT or
+FAVORITE_WEIGHT, halved every HALF_LIFE_DAYS of age, so a score reflects how much attention
+a shop or product gets now rather than all time. Orders count for their shop and for each
+product in them; cart adds for the product; favorites for the product and/or shop.
+
+rebuild() scores the events of the last WINDOW_HALF_LIVES half-lives (older ones are worth
+almost nothing) with one grouped query, per company and across all companies (company_id
+0), and keeps the TOP_N of each kind in popular_items. Workers load that table, with the
+shop and product payloads, on first use and reload it when it changes, so /homescreen
+ranks without any aggregate query. It runs every REBUILD_SECONDS, as a "popularity.rebuild"
+job, or by hand:
+
+    python -m app.popularity
+"""
+import argparse
+import datetime
+import sys
+import threading
+import time
+
+from sqlalchemy import text
+
+from . import jobs, scheduler
+from .database import session_scope
+from .product_summary import DEFAULT_VARIANT, listing
+
+OVERALL = 0
+TOP_N = 20
+HALF_LIFE_DAYS = 7
+WINDOW_HALF_LIVES = 8
+ORDER_WEIGHT = 5.0
+FAVORITE_WEIGHT = 3.0
+CART_WEIGHT = 1.0
+REBUILD_SECONDS = 900
+REFRESH_SECONDS = 120
+REBUILD_LOCK_KEY = 72_048
+
+EVENTS = """
+    SELECT COALESCE(b.company_id, c.company_id) AS company_id, 'product' AS kind, i.product_id AS item_id,
+           :order_weight AS weight, CAST(b.order_date AS timestamptz) AS at
+    FROM bookings b
+    JOIN order_items i ON i.order_id = b.order_id
+    LEFT JOIN carts c ON c.cart_id = b.cart_id
+    WHERE b.order_date >= CAST(:since AS date) AND i.product_id IS NOT NULL
+    UNION ALL
+    SELECT COALESCE(b.company_id, c.company_id), 'shop', b.shop_id, :order_weight, CAST(b.order_date AS timestamptz)
+    FROM bookings b
+    LEFT JOIN carts c ON c.cart_id = b.cart_id
+    WHERE b.order_date >= CAST(:since AS date) AND b.shop_id IS NOT NULL
+    UNION ALL
+    SELECT c.company_id, 'product', ci.product_id, :cart_weight, ci.created_at
+    FROM cart_items ci
+    JOIN carts c ON c.cart_id = ci.cart_id
+    WHERE ci.created_at >= CAST(:since AS timestamptz)
+    UNION ALL
+    SELECT co.company_id, 'product', f.product_id, :favorite_weight, f.created_at
+    FROM favitems f
+    LEFT JOIN shops s ON s.shop_id = f.shop_id
+    LEFT JOIN companies co ON co.company_name = s.company_name
+    WHERE f.created_at >= CAST(:since AS timestamptz) AND f.product_id IS NOT NULL
+    UNION ALL
+    SELECT co.company_id, 'shop', f.shop_id, :favorite_weight, f.created_at
+    FROM favitems f
+    JOIN shops s ON s.shop_id = f.shop_id
+    LEFT JOIN companies co ON co.company_name = s.company_name
+    WHERE f.created_at >= CAST(:since AS timestamptz)
+"""
+
+REBUILD = [
+    "DELETE FROM popular_items",
+    f"""
+    INSERT INTO popular_items (company_id, kind, rank, item_id, score)
+    SELECT company_id, kind, rank, item_id, score
+    FROM (
+        SELECT company_id, kind, item_id, score,
+               ROW_NUMBER() OVER (PARTITION BY company_id, kind ORDER BY score DESC, item_id) AS rank
+        FROM (
+            SELECT CASE WHEN GROUPING(e.company_id) = 1 THEN {OVERALL} ELSE e.company_id END AS company_id,
+                   e.kind, e.item_id,
+                   SUM(e.weight * exp(-ln(2) * GREATEST(EXTRACT(EPOCH FROM CAST(:now AS timestamptz) - e.at), 0)
+                                      / 86400 / :half_life_days)) AS score
+            FROM ({EVENTS}) e
+            GROUP BY GROUPING SETS ((e.company_id, e.kind, e.item_id), (e.kind, e.item_id))
+            HAVING GROUPING(e.company_id) = 1 OR e.company_id IS NOT NULL
+        ) scored
+    ) ranked
+    WHERE rank <= :top_n
+    """,
+]
+
+POPULAR = text(f"""
+    SELECT pi.company_id, pi.kind, pi.item_id, pi.built_at, s.shop_name, s.shop_image,
+           p.product_name, p.details, {DEFAULT_VARIANT} AS variant
+    FROM popular_items pi
+    LEFT JOIN shops s ON pi.kind = 'shop' AND s.shop_id = pi.item_id
+    LEFT JOIN products p ON pi.kind = 'product' AND p.product_id = pi.item_id
+    WHERE pi.kind = 'shop' AND s.is_available OR pi.kind = 'product' AND NOT p.is_deleted
+    ORDER BY pi.company_id, pi.kind, pi.rank
+""")
+
+VERSION = text("SELECT COUNT(*), MAX(built_at) FROM popular_items")
+
+
+def rebuild(db, now=None):
+    """Recompute popular_items in db's transaction; returns False if another rebuild holds the lock."""
+    if not db.execute(text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": REBUILD_LOCK_KEY}).scalar():
+        return False
+    now = now or db.execute(text("SELECT now()")).scalar()
+    params = {"now": now, "since": now - datetime.timedelta(days=HALF_LIFE_DAYS * WINDOW_HALF_LIVES),
+              "half_life_days": HALF_LIFE_DAYS, "top_n": TOP_N, "order_weight": ORDER_WEIGHT,
+              "cart_weight": CART_WEIGHT, "favorite_weight": FAVORITE_WEIGHT}
+    for statement in REBUILD:
+        db.execute(text(statement), params)
+    return True
+
+
+class PopularityCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        self.loaded = False
+        self.version = None
+        self.ranked = {}
+
+    def load(self, db):
+        # The same query refresh() compares against: POPULAR skips deleted products, so its row
+        # count is not the table's. Read first, so a rebuild landing in between is reloaded.
+        version = tuple(db.execute(VERSION).one())
+        rows = db.execute(POPULAR).mappings().all()
+        ranked = {}
+        for row in rows:
+            if row["kind"] == "shop":
+                item = {"shop_id": row["item_id"], "shop_name": row["shop_name"], "shop_image": row["shop_image"]}
+            else:
+                item = listing(row["item_id"], row)
+            ranked.setdefault((row["company_id"], row["kind"]), []).append(item)
+        with self._lock:
+            self.ranked, self.version, self.loaded = ranked, version, True
+
+    def ensure_loaded(self, db):
+        if not self.loaded:
+            self.load(db)
+
+    def top(self, kind, company_id=None, limit=TOP_N):
+        """The most popular shops or products of a company (of all companies when company_id is None)."""
+        with self._lock:
+            return self.ranked.get((OVERALL if company_id is None else company_id, kind), [])[:limit]
+
+
+cache = PopularityCache()
+
+
+@jobs.handler("popularity.rebuild")
+@scheduler.every(REBUILD_SECONDS)
+def rebuild_table():
+    with session_scope() as db:
+        return rebuild(db)
+
+
+@scheduler.every(REFRESH_SECONDS)
+def refresh():
+    if not cache.loaded:
+        return
+    with session_scope() as db:
+        if tuple(db.execute(VERSION).one()) != cache.version:
+            cache.load(db)
+
+
+def main(argv=None):
+    argparse.ArgumentParser(description="Recompute the popular shops and products lists.").parse_args(argv)
+    started = time.perf_counter()
+    if not rebuild_table():
+        print("another rebuild is running")
+        return 1
+    print(f"popular_items rebuilt in {time.perf_counter() - started:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
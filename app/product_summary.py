@@ -0,0 +1,226 @@
+"""Per-product summaries and price-sorted product listings.
+
+Prices, discounts and stock live on product_variants, so sorting or filtering products by
+price would aggregate every product's variants per request. product_summaries holds those
+aggregates for each live product with variants: the lowest and highest price paid
+(COALESCE(discounted_cost, variant_cost)), the best discount, the total stock, the default
+variant (the cheapest one in stock, else the cheapest) and its first image. The lowest price
+is also copied onto the product's product_categories rows.
+
+REFRESH recomputes the summaries of a set of products in one statement and is run in the
+same transaction as the variant writes that change them: the catalog write endpoints, the
+catalog import merge and repricing. Checkouts queue a "product_summary.refresh" job for the
+products they sold instead, so concurrent checkouts never queue on a summary row; the flash
+sale reconcile refreshes the products whose stock it folded back. rebuild() refreshes every
+product, skipping rows that did not change, every REBUILD_SECONDS as a safety net, as a
+"product_summary.rebuild" job, or by hand:
+
+    python -m app.product_summary
+
+Listings read only products that have a summary, so python -m app.migrate fills an empty
+table (backfill()) rather than the API serving empty pages until the first scheduled rebuild.
+
+Listings page with a keyset on (min_cost, product_id): all products through
+ix_product_summaries_price and one category's products through ix_product_categories_price,
+so every page is one index range scan however deep the customer pages. A category's plain
+listing pages on product_id through ix_product_categories_listing the same way.
+"""
+import argparse
+import sys
+import time
+
+from sqlalchemy import text
+
+from . import jobs, scheduler
+from .database import session_scope
+
+PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+REBUILD_SECONDS = 3600
+REBUILD_LOCK_KEY = 72_050
+
+# The fields of a variant as every catalog payload shows it (listings, deals, the export).
+VARIANT_COLUMNS = ("variant_id", "variant_cost", "count", "brand_name", "discounted_cost", "discount", "quantity",
+                   "description", "image", "ratings")
+
+# Variant v (an alias of product_variants) as JSON with VARIANT_COLUMNS.
+VARIANT_JSON = "json_build_object({})".format(", ".join(f"'{column}', v.{column}" for column in VARIANT_COLUMNS))
+
+# The listing payload of product p: the default variant of its summary as JSON, shaped like the
+# catalog endpoints' variants. Shared by the listings built from memory (facets, popularity,
+# recommendations).
+DEFAULT_VARIANT = f"""
+    (SELECT {VARIANT_JSON}
+     FROM product_summaries s
+     JOIN product_variants v ON v.variant_id = s.default_variant_id
+     WHERE s.product_id = p.product_id)
+"""
+
+# Recomputes the summaries of the products selected by `products` (a query with a product_id column).
+REFRESH = """
+    WITH touched AS (
+        {products}
+    ), fresh AS (
+        SELECT v.product_id,
+               MIN(COALESCE(v.discounted_cost, v.variant_cost)) AS min_cost,
+               MAX(COALESCE(v.discounted_cost, v.variant_cost)) AS max_cost,
+               MAX(COALESCE(v.discount, 0)) AS best_discount,
+               SUM(GREATEST(v.count, 0)) AS total_stock,
+               (array_agg(v.variant_id ORDER BY v.count > 0 DESC, COALESCE(v.discounted_cost, v.variant_cost),
+                          v.variant_id))[1] AS default_variant_id,
+               (array_agg(CASE WHEN json_typeof(v.image) = 'array' THEN v.image ->> 0 END
+                          ORDER BY v.count > 0 DESC, COALESCE(v.discounted_cost, v.variant_cost),
+                          v.variant_id))[1] AS primary_image
+        FROM product_variants v
+        JOIN products p ON p.product_id = v.product_id AND NOT p.is_deleted
+        WHERE v.product_id IN (SELECT product_id FROM touched)
+        GROUP BY v.product_id
+    ), removed AS (
+        DELETE FROM product_summaries s
+        WHERE s.product_id IN (SELECT product_id FROM touched)
+          AND s.product_id NOT IN (SELECT product_id FROM fresh)
+    ), sort_keys AS (
+        UPDATE product_categories pc
+        SET min_cost = k.min_cost
+        FROM (SELECT t.product_id, f.min_cost FROM touched t LEFT JOIN fresh f ON f.product_id = t.product_id) k
+        WHERE pc.product_id = k.product_id AND pc.min_cost IS DISTINCT FROM k.min_cost
+    )
+    INSERT INTO product_summaries (product_id, min_cost, max_cost, best_discount, total_stock,
+                                   default_variant_id, primary_image)
+    SELECT product_id, min_cost, max_cost, best_discount, total_stock, default_variant_id, primary_image
+    FROM fresh
+    ON CONFLICT (product_id) DO UPDATE
+    SET min_cost = excluded.min_cost, max_cost = excluded.max_cost, best_discount = excluded.best_discount,
+        total_stock = excluded.total_stock, default_variant_id = excluded.default_variant_id,
+        primary_image = excluded.primary_image, updated_at = now()
+    WHERE (product_summaries.min_cost, product_summaries.max_cost, product_summaries.best_discount,
+           product_summaries.total_stock, product_summaries.default_variant_id, product_summaries.primary_image)
+          IS DISTINCT FROM (excluded.min_cost, excluded.max_cost, excluded.best_discount,
+                            excluded.total_stock, excluded.default_variant_id, excluded.primary_image)
+"""
+
+REFRESH_PRODUCTS = text(REFRESH.format(products="SELECT unnest(CAST(:product_ids AS bigint[])) AS product_id"))
+REFRESH_ALL = text(REFRESH.format(products="SELECT product_id FROM products"))
+
+# The listing payload of a product row joined with product_summaries s: the summary and its default variant.
+LISTING = f"""
+    p.product_id, p.product_name, p.details, s.min_cost, s.max_cost, s.best_discount, s.total_stock,
+    s.primary_image,
+    (SELECT json_build_array({VARIANT_JSON})
+     FROM product_variants v WHERE v.variant_id = s.default_variant_id) AS variants
+"""
+
+# {after} and {order} are filled with the keyset comparison and direction of the requested order.
+ALL_BY_PRICE = """
+    SELECT {listing}
+    FROM product_summaries s
+    JOIN products p ON p.product_id = s.product_id
+    WHERE CAST(:after_cost AS double precision) IS NULL
+       OR (s.min_cost, s.product_id) {after} (:after_cost, :after_id)
+    ORDER BY s.min_cost {order}, s.product_id {order}
+    LIMIT :limit
+"""
+
+CATEGORY_BY_PRICE = """
+    SELECT {listing}
+    FROM product_categories pc
+    JOIN product_summaries s ON s.product_id = pc.product_id
+    JOIN products p ON p.product_id = pc.product_id
+    WHERE pc.category_id = :category_id AND pc.min_cost IS NOT NULL
+      AND (CAST(:after_cost AS double precision) IS NULL
+           OR (pc.min_cost, pc.product_id) {after} (:after_cost, :after_id))
+    ORDER BY pc.min_cost {order}, pc.product_id {order}
+    LIMIT :limit
+"""
+
+CATEGORY = text(f"""
+    SELECT {LISTING}
+    FROM product_categories pc
+    JOIN product_summaries s ON s.product_id = pc.product_id
+    JOIN products p ON p.product_id = pc.product_id
+    WHERE pc.category_id = :category_id AND pc.min_cost IS NOT NULL AND pc.product_id > :after_id
+    ORDER BY pc.product_id
+    LIMIT :limit
+""")
+
+PAGES = {
+    (query_name, descending): text(query.format(listing=LISTING, after="<" if descending else ">",
+                                                order="DESC" if descending else "ASC"))
+    for query_name, query in (("all", ALL_BY_PRICE), ("category", CATEGORY_BY_PRICE))
+    for descending in (False, True)
+}
+
+
+def listing(product_id, row):
+    """A product as the catalog endpoints list it, from a row with product_name, details and variant."""
+    return {"product_id": product_id, "product_name": row["product_name"], "details": row["details"],
+            "variants": [row["variant"]] if row["variant"] else []}
+
+
+def refresh(db, product_ids):
+    """Recompute the summaries of product_ids in db's transaction."""
+    if product_ids:
+        db.execute(REFRESH_PRODUCTS, {"product_ids": sorted(set(product_ids))})
+
+
+def by_price(db, category_id=None, descending=False, after_cost=None, after_id=None, limit=PAGE_SIZE):
+    """One page of live products (of one category) by lowest price, and the cursor of the next page (or None)."""
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    query = PAGES[("all" if category_id is None else "category", descending)]
+    rows = db.execute(query, {"category_id": category_id, "after_cost": after_cost, "after_id": after_id or 0,
+                              "limit": limit}).mappings().all()
+    cursor = None
+    if len(rows) == limit:
+        cursor = {"after_cost": rows[-1]["min_cost"], "after_id": rows[-1]["product_id"]}
+    return [dict(row) for row in rows], cursor
+
+
+def in_category(db, category_id, after_id=None, limit=PAGE_SIZE):
+    """One page of a category's live products by product_id, and the cursor of the next page (or None)."""
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    rows = db.execute(CATEGORY, {"category_id": category_id, "after_id": after_id or 0,
+                                 "limit": limit}).mappings().all()
+    cursor = {"after_id": rows[-1]["product_id"]} if len(rows) == limit else None
+    return [dict(row) for row in rows], cursor
+
+
+@jobs.handler("product_summary.refresh")
+def refresh_products(product_ids):
+    with session_scope() as db:
+        refresh(db, product_ids)
+
+
+@jobs.handler("product_summary.rebuild")
+@scheduler.every(REBUILD_SECONDS)
+def rebuild():
+    """Refresh every product; returns False if another worker's rebuild holds the lock."""
+    with session_scope() as db:
+        if not db.execute(text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": REBUILD_LOCK_KEY}).scalar():
+            return False
+        db.execute(REFRESH_ALL)
+    return True
+
+
+def backfill():
+    """Fill product_summaries if it is empty, e.g. on a database created before it existed."""
+    with session_scope() as db:
+        if db.execute(text("SELECT EXISTS (SELECT 1 FROM product_summaries)")).scalar():
+            return
+        # Workers starting together wait for the first one, then find the table filled.
+        db.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": REBUILD_LOCK_KEY})
+        if not db.execute(text("SELECT EXISTS (SELECT 1 FROM product_summaries)")).scalar():
+            db.execute(REFRESH_ALL)
+
+
+def main(argv=None):
+    argparse.ArgumentParser(description="Recompute every product summary.").parse_args(argv)
+    started = time.perf_counter()
+    if not rebuild():
+        print("another rebuild is running")
+        return 1
+    print(f"product summaries rebuilt in {time.perf_counter() - started:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,42 @@
+"""Hard-deletes soft-deleted products in small batches.
+
+/deleteMultipleProduct only flags rows. Here they are removed a batch at a time, each
+batch in its own short transaction, so the cascade into product_variants, cart_items,
+favitems and deals never holds locks on a large slice of those tables.
+"""
+import datetime
+
+from sqlalchemy import text
+
+from . import scheduler
+from .database import session_scope
+
+PURGE_BATCH_SIZE = 200
+PURGE_GRACE_PERIOD = datetime.timedelta(minutes=10)
+
+
+def purge_deleted_products(batch_size=PURGE_BATCH_SIZE, grace_period=PURGE_GRACE_PERIOD, max_batches=None):
+    purged = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        with session_scope() as db:
+            deleted = db.execute(text("""
+                DELETE FROM products
+                WHERE product_id IN (
+                    SELECT product_id FROM products
+                    WHERE is_deleted AND deleted_at < now() - :grace_period
+                    ORDER BY deleted_at
+                    LIMIT :batch_size
+                    FOR UPDATE SKIP LOCKED
+                )
+            """), {"grace_period": grace_period, "batch_size": batch_size}).rowcount
+        purged += deleted
+        batches += 1
+        if deleted < batch_size:
+            break
+    return purged
+
+
+@scheduler.every(300)
+def purge_periodically():
+    purge_deleted_products()
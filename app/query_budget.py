@@ -0,0 +1,254 @@
+"""Query-budget check for every GET and POST route of the API.
+
+Creates a throwaway Postgres database, seeds a small catalog, calls each route
+once and compares the number of SQL statements and fetched rows with the limits
+recorded in app/query_budgets.json.
+
+    QUERY_BUDGET_SERVER_URL=postgresql://postgres@localhost/postgres python -m app.query_budget
+    python -m app.query_budget --update     # re-record the budgets after a deliberate change
+"""
+import argparse
+import datetime
+import json
+import os
+import sys
+
+import bcrypt
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import make_url
+
+BUDGETS_FILE = os.path.join(os.path.dirname(__file__), "query_budgets.json")
+SERVER_URL = os.environ.get("QUERY_BUDGET_SERVER_URL", "postgresql://postgres@localhost/postgres")
+
+
+class QueryCounter:
+    def __init__(self):
+        self.statements = 0
+        self.rows = 0
+        self.active = False
+
+    def reset(self):
+        self.statements = 0
+        self.rows = 0
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if not self.active:
+            return
+        self.statements += 1
+        if cursor.description is not None:
+            self.rows += max(cursor.rowcount, 0)
+
+
+def create_throwaway_database():
+    server = create_engine(SERVER_URL, isolation_level="AUTOCOMMIT")
+    name = f"onecart_budget_{os.getpid()}"
+    with server.connect() as conn:
+        conn.execute(text(f'DROP DATABASE IF EXISTS "{name}"'))
+        conn.execute(text(f'CREATE DATABASE "{name}"'))
+    server.dispose()
+    return name, make_url(SERVER_URL).set(database=name).render_as_string(hide_password=False)
+
+
+def drop_throwaway_database(name):
+    server = create_engine(SERVER_URL, isolation_level="AUTOCOMMIT")
+    with server.connect() as conn:
+        conn.execute(text(f'DROP DATABASE IF EXISTS "{name}" WITH (FORCE)'))
+    server.dispose()
+
+
+def reset_database(engine, metadata):
+    tables = ", ".join(f'"{table.name}"' for table in metadata.sorted_tables)
+    with engine.begin() as conn:
+        conn.execute(text(f"TRUNCATE {tables} RESTART IDENTITY CASCADE"))
+
+
+def seed(db, models):
+    """Small but representative catalog: enough rows per parent to expose N+1 loops."""
+    password = bcrypt.hashpw(b"secret", bcrypt.gensalt(rounds=4)).decode()
+    db.add(models.Companies(company_id=1, company_name="OneCart", password=password, email="budget@onecart.test",
+                            company_contact=9000000000, company_address="1 Main St", white_labelled=False))
+    db.add_all([models.Brand(brand_name=f"Brand {i}", brand_image=f"brand{i}.png") for i in (1, 2)])
+    db.add_all([models.Categories(category_name=f"Category {i}", category_image=f"cat{i}.png") for i in (1, 2, 3)])
+    db.flush()
+
+    products = [models.Products(brand_id=1 + i % 2, product_name=f"Product {i}", details=f"Details {i}")
+                for i in range(1, 7)]
+    db.add_all(products)
+    db.flush()
+    for product, category_id in zip(products, (1, 1, 1, 2, 2, 3)):
+        db.add(models.CategoryProduct(product_id=product.product_id, category_id=category_id))
+        for size in ("small", "large"):
+            db.add(models.ProductVariant(variant_cost=100, brand_name="Brand", count=50, discounted_cost=90,
+                                         discount=10, base_discount=10, quantity=size, description=size, image=["v.png"],
+                                         ratings=4, product_id=product.product_id))
+    db.add_all([
+        models.Shops(shop_name=f"Shop {i}", shop_contact=9100000000 + i, shop_coordinates=f"lat: 18.5{i}, long: 73.8",
+                     latitude=18.5 + i / 100, longitude=73.8, is_available=True, company_name="OneCart")
+        for i in (1, 2)
+    ])
+    db.add(models.User(customer_id="c1", customer_name="Budget", customer_contact=9999900001,
+                       email_id="customer@onecart.test", wallet=0, prev_pay_mode="upi"))
+    db.flush()
+    db.add(models.UserCompany(company_name="OneCart", user_contact=9999900001))
+    db.add(models.Addresses(user_contact=9999900001, address_type="Home", address_name="Home", phone_no=9999900001,
+                            city="Pune", state="MH", pincode=411001, name="Budget"))
+    db.add(models.Cart(company_id=1, customer_contact=9999900001))
+    db.add(models.PromotionalBanners(banner_image=["b.png"], description="Sale", discount="10%", isActive=True,
+                                     tAc="none"))
+    db.add(models.FreatureList(shop_id=1, feature_image=["f.png"]))
+    db.add(models.Coupon(coupon_name="FLAT50", coupon_image="c.png", discount_amount=50, isActive=True,
+                         description="Flat 50", company_id=1))
+    now = datetime.datetime.now()
+    db.add(models.Deals(shop_id=1, product_id=1, deal_name="Deal", deal_type="percent", deal_description="Deal",
+                        deal_discount=10, deal_start=now - datetime.timedelta(days=1),
+                        deal_end=now + datetime.timedelta(days=1)))
+    db.flush()
+    db.add_all([models.CartItem(cart_id=1, product_id=1, variant_id=1, count=1),
+                models.CartItem(cart_id=1, product_id=2, variant_id=3, count=2)])
+    db.add(models.FavItem(user_id=9999900001, product_id=1, variant_id=1, shop_id=1))
+    db.add(models.CatalogImport(filename="seed.csv", status="done"))
+    db.add(models.Bookings(cart_id=1, user_contact=9999900001, address_id=1, order_number="OD1",
+                           order_date=datetime.date.today(), product_total=270, order_amount=310.5,
+                           delivery_fees=40.5, invoice_number="INV1", invoice_amount=310.5,
+                           products=[{"product_id": 1, "variant_id": 1, "product_name": "Product 1",
+                                      "quantity": "small", "count": 3, "variant_cost": 100, "unit_price": 90,
+                                      "line_total": 270}]))
+    # A flash sale on a variant that no cart holds.
+    db.add(models.FlashSale(variant_id=12, shards=2))
+    db.flush()
+    db.add_all([models.VariantStockShard(variant_id=12, shard_no=shard_no, count=25) for shard_no in (0, 1)])
+    db.add(models.Pincode(pincode=411001, city="Pune", state="MH", latitude=18.52, longitude=73.85))
+    db.flush()
+    from . import analytics, orders, product_summary, serviceability
+    db.execute(orders.BACKFILL, {"after": 0, "limit": orders.BACKFILL_BATCH})
+    analytics.refresh_days(db, [datetime.date.today()])
+    serviceability.rebuild(db)
+    db.execute(product_summary.REFRESH_ALL)
+    db.commit()
+    from . import popularity, recommendations
+    recommendations.rebuild(db)
+    popularity.rebuild(db)
+    db.commit()
+    from .auth import issue_token
+    return {
+        "customer_token": issue_token(9999900001, "OneCart", "customer"),
+        "company_token": issue_token(9000000000, "OneCart", "company"),
+        "product_id": 1, "variant_id": 1, "category_id": 1, "cart_id": 1, "address_id": 1, "company_id": 1,
+        "customer_contact": 9999900001, "filename": "basic.png", "import_id": 1, "order_id": 1, "pincode": 411001,
+        "flash_variant_id": 12,
+    }
+
+
+def fill(value, ids):
+    if isinstance(value, str):
+        if value.startswith("{") and value.endswith("}") and value[1:-1] in ids:
+            return ids[value[1:-1]]
+        return value.format(**ids)
+    if isinstance(value, list):
+        return [fill(item, ids) for item in value]
+    if isinstance(value, dict):
+        return {key: fill(item, ids) for key, item in value.items()}
+    return value
+
+
+def call(client, key, spec, ids):
+    method, path = key.split(" ", 1)
+    # "ids" points a path parameter at another seeded id, e.g. {"variant_id": "flash_variant_id"}.
+    ids = {**ids, **{name: ids[other] for name, other in spec.get("ids", {}).items()}}
+    request = fill(spec.get("request", {}), ids)
+    kwargs = {"params": request.get("params"), "headers": request.get("headers")}
+    if "json" in request:
+        kwargs["json"] = request["json"]
+    if "files" in request:
+        kwargs["files"] = [(field, (name, b"budget", "image/png")) for field, name in request["files"]]
+    response = client.request(method, path.format(**ids), **kwargs)
+    for _, name in request.get("files", []):
+        uploaded = os.path.join("app", "images", name)
+        if os.path.exists(uploaded):
+            os.remove(uploaded)
+    return response
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--update", action="store_true", help="record measured counts as the new budgets")
+    args = parser.parse_args(argv)
+
+    with open(BUDGETS_FILE) as f:
+        budgets = json.load(f)
+
+    db_name, db_url = create_throwaway_database()
+    os.environ["DATABASE_URL"] = db_url
+    os.environ.setdefault("ONECART_DEV", "1")
+    os.environ.setdefault("ONECART_ADMIN_COMPANIES", "OneCart")
+    try:
+        from fastapi.routing import APIRoute
+        from fastapi.testclient import TestClient
+        from . import coupons, deals, facets, geo, models, popularity, recommendations, serviceability
+        from .database import SessionLocal, engine
+        from .main import app
+        from .migrate import migrate
+
+        migrate()
+        counter = QueryCounter()
+        event.listen(engine, "after_cursor_execute", counter.after_cursor_execute)
+        client = TestClient(app, raise_server_exceptions=False)
+
+        routes = {f"{method} {route.path}" for route in app.routes if isinstance(route, APIRoute)
+                  for method in route.methods if method in ("GET", "POST")}
+        failures = [f"{key}: no budget recorded" for key in sorted(routes - budgets.keys()) if not args.update]
+        failures += [f"{key}: budget for a route that no longer exists" for key in sorted(budgets.keys() - routes)]
+
+        for key in sorted(routes & budgets.keys()):
+            reset_database(engine, models.Base.metadata)
+            db = SessionLocal()
+            try:
+                ids = seed(db, models)
+            finally:
+                db.close()
+            # In-process indexes would otherwise still hold the previous route's seed data.
+            deals.index.clear()
+            coupons.cache.clear()
+            geo.shops.clear()
+            serviceability.service_map.clear()
+            recommendations.cache.clear()
+            popularity.cache.clear()
+            facets.index.clear()
+
+            counter.reset()
+            counter.active = True
+            try:
+                response = call(client, key, budgets[key], ids)
+            finally:
+                counter.active = False
+            if budgets[key].get("streamed"):
+                # A server-side cursor reports rowcount -1; each streamed NDJSON line is one fetched row.
+                counter.rows += len(response.content.splitlines())
+
+            budget = budgets[key]["budget"]
+            print(f"{key:55} {response.status_code} statements={counter.statements}/{budget['statements']} "
+                  f"rows={counter.rows}/{budget['rows']}")
+            if args.update:
+                budgets[key]["budget"] = {"statements": counter.statements, "rows": counter.rows}
+            elif counter.statements > budget["statements"] or counter.rows > budget["rows"]:
+                failures.append(f"{key}: {counter.statements} statements / {counter.rows} rows exceeds "
+                                f"{budget['statements']} / {budget['rows']}")
+            if response.status_code >= 500:
+                # A budget measured on a failing request says nothing about the route.
+                failures.append(f"{key}: request failed with {response.status_code}")
+
+        engine.dispose()
+    finally:
+        drop_throwaway_database(db_name)
+
+    if args.update:
+        with open(BUDGETS_FILE, "w") as f:
+            json.dump(budgets, f, indent=2, sort_keys=True)
+            f.write("\n")
+    for failure in failures:
+        print("FAIL", failure)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
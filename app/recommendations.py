@@ -0,0 +1,247 @@
+"""Co-purchase recommendations ("customers also bought").
+
+Every order (its order_items) and every cart (its cart_items) is a basket of products.
+rebuild() loads all (basket, product) pairs into NumPy arrays and builds the sparse
+product x product co-occurrence matrix in COO form: baskets are sorted, the pairs of a
+basket are produced by comparing the product arrays with themselves shifted by 1..
+MAX_BASKET - 1 places, and equal (row, col) keys are summed with one bincount. Orders
+count ORDER_WEIGHT per basket, carts CART_WEIGHT. A pair's score is its co-occurrence
+divided by the geometric mean of the two products' basket counts (cosine similarity), so
+best sellers do not crowd out every list.
+
+The TOP_K best-scoring products of each product are written to product_recommendations,
+along with the TOP_K products that appear in the most baskets under product_id OVERALL.
+Workers load that table (with the recommended products' names and default variant) on first
+use and reload it when it changes, so /getProductVariants and /getAllCategoriesVariants
+fill their recommendations from memory.
+
+The table is rebuilt nightly (once its built_at is REBUILD_AFTER old), as a
+"recommendations.rebuild" job, or by hand:
+
+    python -m app.recommendations
+    python -m app.recommendations --benchmark 1000000   # time the build for 1M synthetic orders
+"""
+import argparse
+import datetime
+import sys
+import threading
+import time
+
+import numpy as np
+from sqlalchemy import text
+
+from . import jobs, scheduler
+from .database import engine, session_scope
+from .product_summary import DEFAULT_VARIANT, listing
+
+OVERALL = 0
+TOP_K = 10
+MAX_BASKET = 50  # products per basket considered; larger baskets are mostly noise
+ORDER_WEIGHT = 1.0
+CART_WEIGHT = 0.5
+READ_BATCH = 50_000
+WRITE_BATCH = 10_000
+REBUILD_AFTER = datetime.timedelta(hours=24)
+REBUILD_CHECK_SECONDS = 3600
+REFRESH_SECONDS = 300
+REBUILD_LOCK_KEY = 72_047
+
+ORDER_BASKETS = text("SELECT DISTINCT order_id, product_id FROM order_items WHERE product_id IS NOT NULL")
+CART_BASKETS = text("SELECT DISTINCT cart_id, product_id FROM cart_items")
+
+WRITE_RECOMMENDATIONS = text("""
+    INSERT INTO product_recommendations (product_id, rank, recommended_id, score)
+    SELECT * FROM unnest(CAST(:product_ids AS bigint[]), CAST(:ranks AS integer[]),
+                         CAST(:recommended_ids AS bigint[]), CAST(:scores AS double precision[]))
+""")
+
+RECOMMENDATIONS = text(f"""
+    SELECT r.product_id, r.recommended_id, r.built_at, p.product_name, p.details, {DEFAULT_VARIANT} AS variant
+    FROM product_recommendations r
+    JOIN products p ON p.product_id = r.recommended_id AND NOT p.is_deleted
+    ORDER BY r.product_id, r.rank
+""")
+
+VERSION = text("SELECT COUNT(*), MAX(built_at) FROM product_recommendations")
+
+
+def co_occurrence(baskets, products, weights):
+    """Sparse co-occurrence of products within baskets.
+
+    Returns (product_ids, rows, cols, values, frequency): product_ids maps dense indexes back
+    to ids, (rows, cols, values) is the symmetric matrix in COO form without its diagonal,
+    and frequency the weighted number of baskets each product is in.
+    """
+    order = np.lexsort((products, baskets))
+    baskets, products, weights = baskets[order], products[order], weights[order]
+    first = np.ones(len(baskets), dtype=bool)
+    first[1:] = (baskets[1:] != baskets[:-1]) | (products[1:] != products[:-1])
+    baskets, products, weights = baskets[first], products[first], weights[first]
+
+    starts = np.flatnonzero(np.r_[True, baskets[1:] != baskets[:-1]]) if len(baskets) else np.empty(0, dtype=np.int64)
+    sizes = np.diff(np.r_[starts, len(baskets)])
+    within = np.arange(len(baskets)) - np.repeat(starts, sizes) < MAX_BASKET
+    baskets, products, weights = baskets[within], products[within], weights[within]
+
+    product_ids, index = np.unique(products, return_inverse=True)
+    frequency = np.bincount(index, weights=weights, minlength=len(product_ids))
+    rows, cols, values = [], [], []
+    for offset in range(1, min(MAX_BASKET, int(sizes.max(initial=0)))):
+        same = baskets[offset:] == baskets[:-offset]
+        a, b, w = index[:-offset][same], index[offset:][same], weights[offset:][same]
+        rows += [a, b]
+        cols += [b, a]
+        values += [w, w]
+    if not rows:
+        empty = np.empty(0, dtype=np.int64)
+        return product_ids, empty, empty, np.empty(0), frequency
+    keys = np.concatenate(rows).astype(np.int64) * len(product_ids) + np.concatenate(cols)
+    keys, inverse = np.unique(keys, return_inverse=True)
+    summed = np.bincount(inverse, weights=np.concatenate(values))
+    return product_ids, keys // len(product_ids), keys % len(product_ids), summed, frequency
+
+
+def top_k(product_ids, rows, cols, values, frequency, k=TOP_K):
+    """(product_ids, ranks, recommended_ids, scores) of the k best neighbours per product, plus OVERALL."""
+    scores = values / np.sqrt(frequency[rows] * frequency[cols])
+    order = np.lexsort((product_ids[cols], -scores, rows))
+    rows, cols, scores = rows[order], cols[order], scores[order]
+    starts = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]]) if len(rows) else np.empty(0, dtype=np.int64)
+    ranks = np.arange(len(rows)) - np.repeat(starts, np.diff(np.r_[starts, len(rows)]))
+    keep = ranks < k
+
+    popular = np.lexsort((product_ids, -frequency))[:k]
+    return (np.r_[product_ids[rows[keep]], np.full(len(popular), OVERALL)],
+            np.r_[ranks[keep], np.arange(len(popular))],
+            np.r_[product_ids[cols[keep]], product_ids[popular]],
+            np.r_[np.round(scores[keep], 6), np.round(frequency[popular], 6)])
+
+
+def read_baskets(conn, query, weight):
+    baskets, products = [], []
+    result = conn.execution_options(stream_results=True, yield_per=READ_BATCH).execute(query)
+    for rows in result.partitions():
+        batch = np.array(rows, dtype=np.int64).reshape(-1, 2)
+        baskets.append(batch[:, 0])
+        products.append(batch[:, 1])
+    baskets = np.concatenate(baskets) if baskets else np.empty(0, dtype=np.int64)
+    products = np.concatenate(products) if products else np.empty(0, dtype=np.int64)
+    return baskets, products, np.full(len(baskets), weight)
+
+
+def rebuild(db):
+    """Recompute product_recommendations in db's transaction; returns the number of rows written."""
+    if not db.execute(text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": REBUILD_LOCK_KEY}).scalar():
+        return None
+    with engine.connect() as conn:
+        orders = read_baskets(conn, ORDER_BASKETS, ORDER_WEIGHT)
+        carts = read_baskets(conn, CART_BASKETS, CART_WEIGHT)
+    # Carts get negative basket ids so they never merge with an order of the same id.
+    baskets = np.concatenate([orders[0], -carts[0] - 1])
+    products = np.concatenate([orders[1], carts[1]])
+    weights = np.concatenate([orders[2], carts[2]])
+
+    product_ids, ranks, recommended_ids, scores = top_k(*co_occurrence(baskets, products, weights))
+    db.execute(text("DELETE FROM product_recommendations"))
+    for start in range(0, len(product_ids), WRITE_BATCH):
+        stop = start + WRITE_BATCH
+        db.execute(WRITE_RECOMMENDATIONS, {
+            "product_ids": product_ids[start:stop].tolist(), "ranks": ranks[start:stop].tolist(),
+            "recommended_ids": recommended_ids[start:stop].tolist(), "scores": scores[start:stop].tolist()})
+    return len(product_ids)
+
+
+class RecommendationCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        self.loaded = False
+        self.version = None
+        self.products = {}
+        self.by_product = {}
+
+    def load(self, db):
+        # The same query refresh() compares against: RECOMMENDATIONS skips deleted products, so its row
+        # count is not the table's. Read first, so a rebuild landing in between is reloaded.
+        version = tuple(db.execute(VERSION).one())
+        rows = db.execute(RECOMMENDATIONS).mappings().all()
+        products, by_product = {}, {}
+        for row in rows:
+            if row["recommended_id"] not in products:
+                products[row["recommended_id"]] = listing(row["recommended_id"], row)
+            by_product.setdefault(row["product_id"], []).append(row["recommended_id"])
+        by_product = {product_id: np.array(ids, dtype=np.int64) for product_id, ids in by_product.items()}
+        with self._lock:
+            self.products, self.by_product = products, by_product
+            self.version, self.loaded = version, True
+
+    def ensure_loaded(self, db):
+        if not self.loaded:
+            self.load(db)
+
+    def for_product(self, product_id, limit=TOP_K):
+        """Payloads of the products most bought together with product_id (OVERALL: most bought)."""
+        with self._lock:
+            ids = self.by_product.get(product_id, ())
+            return [self.products[recommended_id] for recommended_id in ids[:limit].tolist()] if len(ids) else []
+
+
+cache = RecommendationCache()
+
+
+@jobs.handler("recommendations.rebuild")
+def rebuild_table():
+    with session_scope() as db:
+        return rebuild(db)
+
+
+@scheduler.every(REBUILD_CHECK_SECONDS)
+def rebuild_when_due():
+    with session_scope() as db:
+        built_at = db.execute(text("SELECT MAX(built_at) FROM product_recommendations")).scalar()
+        now = db.execute(text("SELECT now()")).scalar()
+    if built_at is None or now - built_at >= REBUILD_AFTER:
+        rebuild_table()
+
+
+@scheduler.every(REFRESH_SECONDS)
+def refresh():
+    if not cache.loaded:
+        return
+    with session_scope() as db:
+        if tuple(db.execute(VERSION).one()) != cache.version:
+            cache.load(db)
+
+
+def benchmark(orders, products=50_000, seed=0):
+    """Seconds to build top-k tables from `orders` synthetic orders of 1-8 Zipf-distributed products."""
+    rng = np.random.default_rng(seed)
+    sizes = rng.integers(1, 9, orders)
+    baskets = np.repeat(np.arange(orders), sizes)
+    items = np.minimum(rng.zipf(1.3, len(baskets)), products)
+    started = time.perf_counter()
+    top_k(*co_occurrence(baskets, items, np.full(len(baskets), ORDER_WEIGHT)))
+    return time.perf_counter() - started
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rebuild the co-purchase recommendation table.")
+    parser.add_argument("--benchmark", type=int, metavar="N", help="time the build for N synthetic orders")
+    args = parser.parse_args(argv)
+
+    if args.benchmark:
+        print(f"top-{TOP_K} recommendations for {args.benchmark} orders built in {benchmark(args.benchmark):.1f}s")
+        return 0
+    started = time.perf_counter()
+    written = rebuild_table()
+    if written is None:
+        print("another rebuild is running")
+        return 1
+    print(f"{written} recommendations written in {time.perf_counter() - started:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,246 @@
+"""Bulk repricing of product variants.
+
+discounted_cost and discount are derived, never typed in: every variant gets the best of
+
+  * its standing base_discount (percent),
+  * the active discount_rules that cover it (all / brand / category / product, percent),
+  * the active deals on its product (deal_type "flat" or "amount" takes deal_discount off
+    the price, anything else is a percentage). Prices are not per shop in this schema, so
+    a deal running in any shop applies to the product.
+
+Offers do not stack; the lowest resulting price wins. All live variants are loaded into
+NumPy arrays, the prices are computed in a handful of vectorized operations, and only
+rows whose price or discount changed are written back with batched UPDATE ... FROM unnest().
+Each batch (in variant_id order, like checkout's locks) is committed with its product
+summaries on its own, so checkouts and catalog edits wait for one batch at most, never for
+the whole pass. A batch only writes variants whose variant_cost and base_discount are still
+the ones the prices were computed from; a variant edited after the read keeps its new values
+and is priced by the run its edit queued.
+
+A discount typed in through the API or a catalog import is stored as the variant's
+base_discount as well. Variants written before base_discount existed adopt their discount
+once, through migrate() (run by python -m app.migrate).
+
+Repricing runs when a deal or rule boundary has passed or deals/rules changed since the run
+recorded in repricing_runs (checked every minute by every worker, against that one row), as a
+"repricing.run" job (queued by deal, rule and variant price writes, catalog imports and
+POST /reprice), or by hand:
+
+    python -m app.repricing
+    python -m app.repricing --benchmark 100000    # time the computation on synthetic data
+"""
+import argparse
+import datetime
+import sys
+import time
+
+import numpy as np
+from sqlalchemy import text
+
+from . import facets, jobs, product_summary, scheduler
+from .database import session_scope
+
+WRITE_BATCH = 5000
+REPRICE_LOCK_KEY = 72_042
+FLAT_DEAL_TYPES = ("flat", "amount")
+
+# Variants created before base_discount existed keep their hand-set discount as their standing discount.
+ADOPT_BASE_DISCOUNTS = text("UPDATE product_variants SET base_discount = COALESCE(discount, 0) "
+                            "WHERE base_discount IS NULL")
+
+VARIANTS = text("""
+    SELECT v.variant_id, v.product_id, p.brand_id, v.variant_cost, COALESCE(v.base_discount, 0),
+           COALESCE(v.discounted_cost, -1), COALESCE(v.discount, -1)
+    FROM product_variants v
+    JOIN products p ON p.product_id = v.product_id
+    WHERE NOT p.is_deleted
+    ORDER BY v.variant_id
+""")
+
+ACTIVE_RULES = text("""
+    SELECT scope, target_id, percent FROM discount_rules
+    WHERE is_active AND (starts_at IS NULL OR starts_at <= :now) AND (ends_at IS NULL OR ends_at > :now)
+""")
+
+CATEGORY_PRODUCTS = text("SELECT category_id, product_id FROM product_categories WHERE category_id = ANY(:ids)")
+
+ACTIVE_DEALS = text("SELECT product_id, deal_type, deal_discount FROM deals WHERE deal_start <= :now AND deal_end > :now")
+
+# Skips variants whose cost or standing discount changed after VARIANTS read them.
+WRITE_PRICES = text("""
+    UPDATE product_variants v
+    SET discounted_cost = u.price, discount = u.discount
+    FROM unnest(CAST(:ids AS bigint[]), CAST(:prices AS double precision[]), CAST(:discounts AS bigint[]),
+                CAST(:costs AS double precision[]), CAST(:bases AS double precision[]))
+        AS u(variant_id, price, discount, cost, base)
+    WHERE v.variant_id = u.variant_id AND v.variant_cost = u.cost AND COALESCE(v.base_discount, 0) = u.base
+""")
+
+LAST_EDIT = text("SELECT GREATEST((SELECT MAX(updated_at) FROM deals), (SELECT MAX(updated_at) FROM discount_rules))")
+
+RECORD_RUN = text("""
+    INSERT INTO repricing_runs (run_id, ran_at, last_edit) VALUES (1, :now, :last_edit)
+    ON CONFLICT (run_id) DO UPDATE SET ran_at = excluded.ran_at, last_edit = excluded.last_edit
+""")
+
+# Whether a scheduled run is due: there is no recorded run, a deal or rule started or ended
+# since it, or one was edited (updated_at moved past the last edit it priced).
+CHANGES = text("""
+    SELECT r.ran_at IS NULL
+           OR e.last_edit IS DISTINCT FROM r.last_edit
+           OR EXISTS (SELECT 1 FROM deals
+                      WHERE deal_start > r.ran_at AND deal_start <= :now OR deal_end > r.ran_at AND deal_end <= :now)
+           OR EXISTS (SELECT 1 FROM discount_rules
+                      WHERE starts_at > r.ran_at AND starts_at <= :now OR ends_at > r.ran_at AND ends_at <= :now)
+           AS due
+    FROM (SELECT GREATEST((SELECT MAX(updated_at) FROM deals), (SELECT MAX(updated_at) FROM discount_rules))
+              AS last_edit) e
+    LEFT JOIN repricing_runs r ON r.run_id = 1
+""")
+
+
+def compute(cost, base_pct, rule_pct, deal_pct, deal_flat):
+    """Vectorized best price and whole-percent discount for every variant."""
+    pct = np.clip(np.maximum(np.maximum(base_pct, rule_pct), deal_pct), 0, 100)
+    price = np.minimum(cost * (1 - pct / 100), cost - deal_flat)
+    price = np.round(np.clip(price, 0, cost), 2)
+    discount = np.zeros(len(cost), dtype=np.int64)
+    priced = cost > 0
+    discount[priced] = np.rint((cost[priced] - price[priced]) / cost[priced] * 100)
+    return price, discount
+
+
+def rule_discounts(db, product_ids, brand_ids, rules):
+    rule_pct = np.zeros(len(product_ids))
+    category_ids = [rule.target_id for rule in rules if rule.scope == "category"]
+    members = {}
+    if category_ids:
+        for category_id, product_id in db.execute(CATEGORY_PRODUCTS, {"ids": category_ids}):
+            members.setdefault(category_id, []).append(product_id)
+    for rule in rules:
+        if rule.scope == "all":
+            mask = slice(None)
+        elif rule.scope == "brand":
+            mask = brand_ids == rule.target_id
+        elif rule.scope == "product":
+            mask = product_ids == rule.target_id
+        elif rule.scope == "category":
+            mask = np.isin(product_ids, members.get(rule.target_id, []))
+        else:
+            continue
+        rule_pct[mask] = np.maximum(rule_pct[mask], rule.percent)
+    return rule_pct
+
+
+def deal_discounts(db, product_ids, now):
+    deal_pct = np.zeros(len(product_ids))
+    deal_flat = np.zeros(len(product_ids))
+    deals = db.execute(ACTIVE_DEALS, {"now": now}).all()
+    if not deals:
+        return deal_pct, deal_flat
+    products, index = np.unique(product_ids, return_inverse=True)
+    by_product_pct = np.zeros(len(products))
+    by_product_flat = np.zeros(len(products))
+    deal_products = np.array([deal.product_id for deal in deals], dtype=np.int64)
+    position = np.searchsorted(products, deal_products)
+    known = (position < len(products)) & (products[np.minimum(position, len(products) - 1)] == deal_products)
+    flat = np.array([deal.deal_type.lower() in FLAT_DEAL_TYPES for deal in deals])
+    amount = np.array([deal.deal_discount for deal in deals], dtype=float)
+    np.maximum.at(by_product_pct, position[known & ~flat], amount[known & ~flat])
+    np.maximum.at(by_product_flat, position[known & flat], amount[known & flat])
+    return by_product_pct[index], by_product_flat[index]
+
+
+def migrate():
+    with session_scope() as db:
+        db.execute(ADOPT_BASE_DISCOUNTS)
+
+
+def reprice(now=None):
+    """Reprice every live variant; returns {"variants": n, "changed": n, "seconds": s}."""
+    started = time.perf_counter()
+    now = now or datetime.datetime.now()
+    # db only holds the advisory lock and reads; the writes are committed batch by batch.
+    with session_scope() as db:
+        if not db.execute(text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": REPRICE_LOCK_KEY}).scalar():
+            return {"variants": 0, "changed": 0, "seconds": 0.0, "skipped": True}
+        # Read before the deals and rules, so an edit made during the run makes the next one due.
+        last_edit = db.execute(LAST_EDIT).scalar()
+        rows = db.execute(VARIANTS).all()
+        if rows:
+            data = np.array(rows, dtype=float)
+            variant_ids = data[:, 0].astype(np.int64)
+            product_ids = data[:, 1].astype(np.int64)
+            brand_ids = data[:, 2].astype(np.int64)
+            cost, base_pct, old_price, old_discount = data[:, 3], data[:, 4], data[:, 5], data[:, 6]
+
+            rule_pct = rule_discounts(db, product_ids, brand_ids, db.execute(ACTIVE_RULES, {"now": now}).all())
+            deal_pct, deal_flat = deal_discounts(db, product_ids, now)
+            price, discount = compute(cost, base_pct, rule_pct, deal_pct, deal_flat)
+
+            changed = np.flatnonzero((np.abs(price - old_price) >= 0.005) | (discount != old_discount))
+            for start in range(0, len(changed), WRITE_BATCH):
+                batch = changed[start:start + WRITE_BATCH]
+                with session_scope() as writer:
+                    writer.execute(WRITE_PRICES, {"ids": variant_ids[batch].tolist(),
+                                                  "prices": price[batch].tolist(),
+                                                  "discounts": discount[batch].tolist(),
+                                                  "costs": cost[batch].tolist(),
+                                                  "bases": base_pct[batch].tolist()})
+                    product_summary.refresh(writer, product_ids[batch].tolist())
+        else:
+            changed = []
+        if len(changed):
+            facets.invalidate(db)
+        db.execute(RECORD_RUN, {"now": now, "last_edit": last_edit})
+    return {"variants": len(rows), "changed": len(changed), "seconds": round(time.perf_counter() - started, 3)}
+
+
+@jobs.handler("repricing.run")
+def run():
+    """Job entry point. A run skipped for the lock is retried: the run holding it may have read
+    the variants before the write that queued this job."""
+    result = reprice()
+    if result.get("skipped"):
+        raise RuntimeError("another repricing run holds the lock")
+    return result
+
+
+@scheduler.every(60)
+def reprice_when_due():
+    now = datetime.datetime.now()
+    with session_scope() as db:
+        due = db.execute(CHANGES, {"now": now}).scalar()
+    if due:
+        reprice(now)
+
+
+def benchmark(n, seed=0):
+    rng = np.random.default_rng(seed)
+    cost = rng.uniform(10, 2000, n).round(2)
+    base_pct = rng.choice([0, 5, 10], n)
+    product_ids = rng.integers(0, n // 3 + 1, n)
+    brand_ids = rng.integers(0, 200, n)
+    rules = [type("Rule", (), {"scope": "brand", "target_id": b, "percent": 12.5}) for b in range(0, 200, 7)]
+    started = time.perf_counter()
+    rule_pct = rule_discounts(None, product_ids, brand_ids, rules)
+    deal_pct = np.where(product_ids % 50 == 0, 20.0, 0.0)
+    deal_flat = np.where(product_ids % 77 == 0, 30.0, 0.0)
+    compute(cost, base_pct, rule_pct, deal_pct, deal_flat)
+    return time.perf_counter() - started
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Recompute discounted_cost and discount for all variants.")
+    parser.add_argument("--benchmark", type=int, metavar="N", help="time the computation for N synthetic variants")
+    args = parser.parse_args(argv)
+
+    if args.benchmark:
+        print(f"{args.benchmark} variants priced in {benchmark(args.benchmark) * 1000:.1f}ms")
+        return 0
+    print(reprice())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
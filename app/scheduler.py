@@ -0,0 +1,57 @@
+"""In-process periodic tasks.
+
+Modules register blocking functions with @every(seconds); start(app) imports the modules
+listed in TASK_MODULES and runs each of their tasks on the threadpool at that interval for
+as long as the app is up. Every uvicorn worker runs
+its own copy, so tasks must be safe to run concurrently (the database work they do claims
+rows with SKIP LOCKED or is idempotent). Set ONECART_PERIODIC_TASKS=0 to switch them off,
+e.g. on API-only nodes.
+"""
+import asyncio
+import importlib
+import logging
+import os
+
+from starlette.concurrency import run_in_threadpool
+
+TASK_MODULES = ["app.analytics", "app.coupons", "app.deals", "app.facets", "app.fulfilment", "app.geo",
+                "app.inventory", "app.popularity", "app.product_summary", "app.purge", "app.recommendations",
+                "app.repricing", "app.serviceability"]
+
+tasks = []
+
+
+def every(seconds):
+    def register(func):
+        tasks.append((seconds, func))
+        return func
+    return register
+
+
+async def run_periodically(seconds, func):
+    while True:
+        await asyncio.sleep(seconds)
+        try:
+            await run_in_threadpool(func)
+        except Exception:
+            logging.exception(f"Periodic task {func.__module__}.{func.__name__} failed")
+
+
+def import_tasks():
+    for module in TASK_MODULES:
+        importlib.import_module(module)
+
+
+def start(app):
+    if os.environ.get("ONECART_PERIODIC_TASKS", "1") == "0":
+        return
+    import_tasks()
+
+    @app.on_event("startup")
+    async def start_periodic_tasks():
+        app.state.periodic_tasks = [asyncio.create_task(run_periodically(seconds, func)) for seconds, func in tasks]
+
+    @app.on_event("shutdown")
+    async def stop_periodic_tasks():
+        for task in app.state.periodic_tasks:
+            task.cancel()
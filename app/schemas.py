@@ -88,6 +88,39 @@ class EditProduct(Product):
     pass
 
 
+class ProductEdit(BaseModel):
+    product_id: int
+    brand_id: int | None = None
+    product_name: str | None = None
+    details: str | None = None
+
+
+class VariantEdit(BaseModel):
+    variant_id: int
+    variant_cost: float | None = None
+    count: int | None = None
+    brand_name: str | None = None
+    discounted_cost: float | None = None
+    discount: int | None = None
+    quantity: str | None = None
+    description: str | None = None
+    image: List[str] | None = None
+    ratings: int | None = None
+
+
+class BulkEdit(BaseModel):
+    products: List[ProductEdit] = []
+    variants: List[VariantEdit] = []
+
+
+class CatalogImportRow(ProductVariant):
+    product_id: int | None = None
+    product_name: str
+    details: str
+    brand_image: str = ""
+    categories: List[str] = []
+
+
 class UserData(BaseModel):
     customer_id: str
     customer_name: str | None = None
@@ -180,6 +213,12 @@ class CompanyLogin(BaseModel):
     password: str
 
 
+class Identity(BaseModel):
+    contact: int | None = None
+    company_name: str
+    role: str
+
+
 class Banners(BaseModel):
     banner_id: int
     description: str
@@ -219,6 +258,18 @@ class BookingsCreate(Bookings):
     pass
 
 
+class Checkout(BaseModel):
+    address_id: int
+    cart_id: int | None = None
+    coupon_id: int | None = None
+
+
+class FlashSale(BaseModel):
+    variant_id: int
+    shards: int = 16
+    ends_at: datetime | None = None
+
+
 class Coupons(BaseModel):
     coupon_id: int
     coupon_image: str
@@ -228,12 +279,34 @@ class Coupons(BaseModel):
     description: str
 
 
+class CouponCreate(BaseModel):
+    coupon_name: str
+    coupon_image: str
+    discount_amount: float
+    min_order_amount: float = 0
+    isActive: bool = True
+    description: str
+
+
+class CouponEdit(BaseModel):
+    coupon_name: Optional[str] = None
+    coupon_image: Optional[str] = None
+    discount_amount: Optional[float] = None
+    min_order_amount: Optional[float] = None
+    isActive: Optional[bool] = None
+    description: Optional[str] = None
+
+
 class CheckoutScreen(BaseModel):
-    bill_details: int
+    cart_item_count: int
     cart_total: float
-    discount: float
-    coupon_applied: str
-    delivery_charges: float = 45.50
+    discount_sum: float
+    coupon_applied: Optional[str] = None
+    coupon_id: Optional[int] = None
+    coupon_discount: float = 0
+    delivery_charges: float = 40.50
+    serviceable: bool = True
+    delivery_eta_minutes: Optional[int] = None
     total_bill: float
 
 
@@ -249,8 +322,26 @@ class Deals(BaseModel):
     deal_type: str
     deal_description: str
     deal_discount: int
-    deal_start: str
-    deal_end: str
+    deal_start: datetime
+    deal_end: datetime
+
+
+class DiscountRule(BaseModel):
+    scope: str
+    target_id: int | None = None
+    percent: float
+    starts_at: datetime | None = None
+    ends_at: datetime | None = None
+    is_active: bool = True
+
+
+class DealEdit(BaseModel):
+    deal_name: Optional[str] = None
+    deal_type: Optional[str] = None
+    deal_description: Optional[str] = None
+    deal_discount: Optional[int] = None
+    deal_start: Optional[datetime] = None
+    deal_end: Optional[datetime] = None
 
 # class ShopASSociation(BaseModel):
 #
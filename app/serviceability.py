@@ -0,0 +1,245 @@
+"""Pincode serviceability and delivery fees.
+
+The serviceability table holds, per company and pincode, the company's shops that can
+deliver there (nearest first), the distance to the nearest one and the delivery band it
+falls in, with that band's fee and ETA. It is built in bulk by rebuild(): pincode positions
+come from the pincodes table, shop positions from app.geo, and distances for a whole chunk
+of pincodes against all of a company's shops are one vectorized haversine. A pincode whose
+nearest shop is beyond the last band is not serviceable and gets no row.
+
+Bands come from ONECART_DELIVERY_BANDS, a JSON list of [max_km, fee, eta_minutes] in
+increasing max_km, e.g. [[3, 20, 30], [7, 40.5, 45], [12, 60, 75]].
+
+Each worker holds the table as sorted NumPy arrays per company (ServiceMap), so a fee quote
+is one searchsorted with no geometry and no query. Companies without any serviceability rows
+yet are quoted DEFAULT_FEE everywhere, so checkout keeps working until a first build.
+
+The table is rebuilt when shops or pincodes changed since the build recorded in
+serviceability_builds (checked every REBUILD_CHECK_SECONDS by every worker, against that one
+row, so a build by one worker is not repeated by the others), as a "serviceability.rebuild"
+job, or by hand:
+
+    python -m app.serviceability
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+from sqlalchemy import text
+
+from . import geo, jobs, scheduler
+from .database import session_scope
+
+DEFAULT_FEE = 40.50
+DEFAULT_BANDS = [[3, 20.0, 30], [7, 40.5, 45], [12, 60.0, 75]]
+BANDS = json.loads(os.environ.get("ONECART_DELIVERY_BANDS") or "null") or DEFAULT_BANDS
+MAX_SERVING_SHOPS = 5
+DISTANCE_CELLS = 4_000_000  # pincode x shop distances computed at once
+REFRESH_SECONDS = 60
+REBUILD_CHECK_SECONDS = 300
+REBUILD_LOCK_KEY = 72_045
+
+PINCODES = text("SELECT pincode, latitude, longitude FROM pincodes ORDER BY pincode")
+
+COMPANY_SHOPS = text("""
+    SELECT co.company_id, s.shop_id, s.latitude, s.longitude
+    FROM shops s
+    JOIN companies co ON co.company_name = s.company_name
+    WHERE s.is_available AND s.latitude IS NOT NULL AND s.longitude IS NOT NULL
+    ORDER BY co.company_id, s.shop_id
+""")
+
+WRITE_ROWS = text("""
+    INSERT INTO serviceability (company_id, pincode, shop_ids, distance_km, band, fee, eta_minutes)
+    SELECT * FROM json_to_recordset(CAST(:rows AS json)) AS r(
+        company_id bigint, pincode bigint, shop_ids json, distance_km double precision, band integer,
+        fee double precision, eta_minutes integer)
+""")
+
+SERVICEABILITY = text("""
+    SELECT company_id, pincode, shop_ids, distance_km, band, fee, eta_minutes, built_at
+    FROM serviceability
+    ORDER BY company_id, pincode
+""")
+
+VERSION = text("SELECT COUNT(*), MAX(built_at) FROM serviceability")
+
+# What a build is computed from: shops (count, last update) and pincodes (count, exact sum of positions).
+SOURCE = """
+    SELECT (SELECT COUNT(*) FROM shops) AS shop_count, (SELECT MAX(updated_at) FROM shops) AS shops_updated_at,
+           (SELECT COUNT(*) FROM pincodes) AS pincode_count,
+           (SELECT SUM(CAST(latitude AS numeric) + CAST(longitude AS numeric)) FROM pincodes) AS pincode_checksum
+"""
+
+SOURCE_VERSION = text(SOURCE)
+
+RECORD_BUILD = text("""
+    INSERT INTO serviceability_builds (build_id, built_at, shop_count, shops_updated_at, pincode_count,
+                                       pincode_checksum)
+    VALUES (1, now(), :shop_count, :shops_updated_at, :pincode_count, :pincode_checksum)
+    ON CONFLICT (build_id) DO UPDATE
+    SET built_at = excluded.built_at, shop_count = excluded.shop_count, shops_updated_at = excluded.shops_updated_at,
+        pincode_count = excluded.pincode_count, pincode_checksum = excluded.pincode_checksum
+""")
+
+DUE = text(f"""
+    SELECT (s.shop_count, s.shops_updated_at, s.pincode_count, s.pincode_checksum)
+           IS DISTINCT FROM (b.shop_count, b.shops_updated_at, b.pincode_count, b.pincode_checksum)
+    FROM ({SOURCE}) s
+    LEFT JOIN serviceability_builds b ON b.build_id = 1
+""")
+
+
+def serving(pincode_lat, pincode_lon, shop_ids, shop_lat, shop_lon, bands=BANDS):
+    """Per pincode: (shop_ids nearest first, distance to the nearest, band index); band == len(bands) if unserved."""
+    limits = np.array([band[0] for band in bands], dtype=float)
+    keep = min(MAX_SERVING_SHOPS, len(shop_ids))
+    chunk = max(1, DISTANCE_CELLS // max(1, len(shop_ids)))
+    served, nearest, band = [], np.empty(len(pincode_lat)), np.empty(len(pincode_lat), dtype=np.int64)
+    for start in range(0, len(pincode_lat), chunk):
+        stop = start + chunk
+        distances = geo.haversine_km(pincode_lat[start:stop, None], pincode_lon[start:stop, None],
+                                     shop_lat[None, :], shop_lon[None, :])
+        if keep < len(shop_ids):
+            closest = np.argpartition(distances, keep - 1, axis=1)[:, :keep]
+        else:
+            closest = np.broadcast_to(np.arange(len(shop_ids)), distances.shape)
+        closest_km = np.take_along_axis(distances, closest, axis=1)
+        order = np.argsort(closest_km, axis=1, kind="stable")
+        closest = np.take_along_axis(closest, order, axis=1)
+        closest_km = np.take_along_axis(closest_km, order, axis=1)
+        nearest[start:stop] = closest_km[:, 0]
+        band[start:stop] = np.searchsorted(limits, closest_km[:, 0])
+        within = closest_km <= limits[-1]
+        served += [shop_ids[row[mask]].tolist() for row, mask in zip(closest, within)]
+    return served, nearest, band
+
+
+def rebuild(db):
+    """Recompute the serviceability table; returns the number of serviceable (company, pincode) pairs."""
+    if not db.execute(text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": REBUILD_LOCK_KEY}).scalar():
+        return None
+    # Read first, so shops or pincodes changed during the build make the next one due.
+    source = db.execute(SOURCE_VERSION).mappings().one()
+    pincodes = db.execute(PINCODES).all()
+    by_company = {}
+    for company_id, shop_id, latitude, longitude in db.execute(COMPANY_SHOPS):
+        by_company.setdefault(company_id, []).append((shop_id, latitude, longitude))
+
+    db.execute(text("DELETE FROM serviceability"))
+    written = 0
+    if pincodes:
+        codes = np.array([row.pincode for row in pincodes], dtype=np.int64)
+        pincode_lat = np.array([row.latitude for row in pincodes], dtype=float)
+        pincode_lon = np.array([row.longitude for row in pincodes], dtype=float)
+        for company_id, shops in by_company.items():
+            shop_ids = np.array([shop[0] for shop in shops], dtype=np.int64)
+            shop_lat = np.array([shop[1] for shop in shops], dtype=float)
+            shop_lon = np.array([shop[2] for shop in shops], dtype=float)
+            served, nearest, band = serving(pincode_lat, pincode_lon, shop_ids, shop_lat, shop_lon)
+            rows = [{"company_id": company_id, "pincode": int(codes[i]), "shop_ids": served[i],
+                     "distance_km": round(float(nearest[i]), 3), "band": int(band[i]),
+                     "fee": BANDS[band[i]][1], "eta_minutes": BANDS[band[i]][2]}
+                    for i in np.flatnonzero(band < len(BANDS)).tolist()]
+            for start in range(0, len(rows), 5000):
+                db.execute(WRITE_ROWS, {"rows": json.dumps(rows[start:start + 5000])})
+            written += len(rows)
+    db.execute(RECORD_BUILD, dict(source))
+    return written
+
+
+class ServiceMap:
+    """The serviceability table as sorted arrays per company."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        self.loaded = False
+        self.version = None
+        self.companies = {}
+
+    def load(self, db):
+        rows = db.execute(SERVICEABILITY).all()
+        grouped = {}
+        for row in rows:
+            grouped.setdefault(row.company_id, []).append(row)
+        companies = {}
+        for company_id, company_rows in grouped.items():
+            counts = np.array([len(row.shop_ids) for row in company_rows], dtype=np.int64)
+            companies[company_id] = {
+                "pincodes": np.array([row.pincode for row in company_rows], dtype=np.int64),
+                "fee": np.array([row.fee for row in company_rows], dtype=float),
+                "eta": np.array([row.eta_minutes for row in company_rows], dtype=np.int32),
+                "band": np.array([row.band for row in company_rows], dtype=np.int16),
+                "distance": np.array([row.distance_km for row in company_rows], dtype=float),
+                "offsets": np.concatenate([[0], np.cumsum(counts)]),
+                "shops": np.array([shop_id for row in company_rows for shop_id in row.shop_ids], dtype=np.int64),
+            }
+        version = (len(rows), max((row.built_at for row in rows), default=None))
+        with self._lock:
+            self.companies, self.version, self.loaded = companies, version, True
+
+    def ensure_loaded(self, db):
+        if not self.loaded:
+            self.load(db)
+
+    def quote(self, company_id, pincode):
+        """{"fee", "eta_minutes", "band", "distance_km", "shop_ids"} for a delivery, or None if not serviceable."""
+        with self._lock:
+            company = self.companies.get(company_id)
+        if company is None:
+            return {"fee": DEFAULT_FEE, "eta_minutes": None, "band": None, "distance_km": None, "shop_ids": []}
+        position = int(np.searchsorted(company["pincodes"], pincode))
+        if position == len(company["pincodes"]) or company["pincodes"][position] != pincode:
+            return None
+        start, stop = company["offsets"][position], company["offsets"][position + 1]
+        return {"fee": float(company["fee"][position]), "eta_minutes": int(company["eta"][position]),
+                "band": int(company["band"][position]), "distance_km": float(company["distance"][position]),
+                "shop_ids": company["shops"][start:stop].tolist()}
+
+
+service_map = ServiceMap()
+
+
+@jobs.handler("serviceability.rebuild")
+def rebuild_table():
+    with session_scope() as db:
+        return rebuild(db)
+
+
+@scheduler.every(REBUILD_CHECK_SECONDS)
+def rebuild_when_due():
+    with session_scope() as db:
+        if not db.execute(DUE).scalar():
+            return
+    rebuild_table()
+
+
+@scheduler.every(REFRESH_SECONDS)
+def refresh():
+    if not service_map.loaded:
+        return
+    with session_scope() as db:
+        if tuple(db.execute(VERSION).one()) != service_map.version:
+            service_map.load(db)
+
+
+def main(argv=None):
+    argparse.ArgumentParser(description="Rebuild the pincode serviceability table.").parse_args(argv)
+    started = time.perf_counter()
+    written = rebuild_table()
+    if written is None:
+        print("another rebuild is running")
+        return 1
+    print(f"{written} serviceable (company, pincode) pairs written in {time.perf_counter() - started:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,5 @@
+import os
+
+# The app modules connect lazily, but refuse to import without these; no test touches a database.
+os.environ.setdefault("DATABASE_URL", "postgresql://onecart@localhost/onecart_test")
+os.environ.setdefault("ONECART_DEV", "1")
@@ -0,0 +1,34 @@
+"""Stand-ins for a Session in tests of the in-memory pieces."""
+
+
+class Result:
+    def __init__(self, rows):
+        self.rows = list(rows)
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def mappings(self):
+        return self
+
+    def all(self):
+        return self.rows
+
+    def one(self):
+        (row,) = self.rows
+        return row
+
+    def scalar_one(self):
+        return self.one()[0]
+
+
+class DB:
+    """Answers each execute() with the next of `results` and records the statements and parameters."""
+
+    def __init__(self, *results):
+        self.results = list(results)
+        self.executed = []
+
+    def execute(self, statement, params=None):
+        self.executed.append((statement, params))
+        return Result(self.results.pop(0))
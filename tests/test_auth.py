@@ -0,0 +1,50 @@
+import hashlib
+import time
+
+import pytest
+from itsdangerous import TimestampSigner, URLSafeTimedSerializer
+
+from app import auth
+
+
+@pytest.fixture(autouse=True)
+def no_cached_tokens():
+    auth.verified_tokens.clear()
+    yield
+    auth.verified_tokens.clear()
+
+
+def test_a_token_verifies_to_its_identity():
+    identity = auth.verify_token(auth.issue_token(9999900001, "OneCart", "customer"))
+    assert (identity.contact, identity.company_name, identity.role) == (9999900001, "OneCart", "customer")
+
+
+def test_a_tampered_token_is_rejected():
+    token = auth.issue_token(9999900001, "OneCart", "customer")
+    payload, signature = token.rsplit(".", 1)
+    assert auth.verify_token(payload + "." + signature[::-1]) is None
+    assert auth.verify_token("not a token") is None
+
+
+def test_a_token_signed_with_another_secret_is_rejected():
+    other = URLSafeTimedSerializer("another secret", salt="onecart-session",
+                                   signer_kwargs={"digest_method": hashlib.sha256})
+    assert auth.verify_token(other.dumps({"contact": 1, "company_name": "OneCart", "role": "company"})) is None
+
+
+def test_an_expired_token_is_rejected(monkeypatch):
+    issued_at = int(time.time()) - auth.TOKEN_MAX_AGE - 60
+    monkeypatch.setattr(TimestampSigner, "get_timestamp", lambda self: issued_at)
+    token = auth.issue_token(9999900001, "OneCart", "customer")
+    monkeypatch.undo()
+    assert auth.verify_token(token) is None
+
+
+def test_a_verified_token_is_cached_no_longer_than_it_is_valid(monkeypatch):
+    issued_at = int(time.time()) - auth.TOKEN_MAX_AGE + 2
+    monkeypatch.setattr(TimestampSigner, "get_timestamp", lambda self: issued_at)
+    token = auth.issue_token(9999900001, "OneCart", "customer")
+    monkeypatch.undo()
+    assert auth.verify_token(token) is not None
+    expires, _ = auth.verified_tokens._data[token]
+    assert expires - time.monotonic() <= 2
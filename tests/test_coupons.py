@@ -0,0 +1,63 @@
+import pytest
+
+from app.coupons import CouponCache
+
+from .fakes import DB
+
+
+def coupon(coupon_id, company_id, min_order_amount, discount_amount):
+    return {"coupon_id": coupon_id, "company_id": company_id, "coupon_name": f"C{coupon_id}", "coupon_image": None,
+            "description": None, "min_order_amount": min_order_amount, "discount_amount": discount_amount}
+
+
+COUPONS = [
+    coupon(1, 1, 0, 20),
+    coupon(2, 1, 500, 100),
+    coupon(3, 1, 1000, 80),  # a higher minimum with a smaller discount never wins
+    coupon(4, 1, 2000, 300),
+    coupon(5, 2, 0, 50),
+    coupon(6, None, 0, 1000),  # created before coupons had a company
+]
+
+
+@pytest.fixture
+def cache():
+    rows = sorted(COUPONS, key=lambda c: (c["company_id"] or 0, c["min_order_amount"], -c["discount_amount"]))
+    cache = CouponCache()
+    cache.load(DB([(len(rows), None)], rows))
+    return cache
+
+
+@pytest.mark.parametrize("total, coupon_id, discount", [
+    (10, 1, 10.0),  # capped at the total
+    (499.99, 1, 20.0),
+    (500, 2, 100.0),  # a minimum is reached when the total equals it
+    (1500, 2, 100.0),
+    (1999.99, 2, 100.0),
+    (2000, 4, 300.0),
+])
+def test_best_for_takes_the_largest_discount_among_reached_minimums(cache, total, coupon_id, discount):
+    best, amount = cache.best_for(1, total)
+    assert best["coupon_id"] == coupon_id
+    assert amount == discount
+
+
+def test_best_for_is_scoped_to_the_company(cache):
+    best, amount = cache.best_for(2, 5000)
+    assert (best["coupon_id"], amount) == (5, 50.0)
+    assert cache.best_for(3, 5000) == (None, 0.0)
+
+
+def test_best_for_an_empty_cart(cache):
+    assert cache.best_for(1, 0) == (None, 0.0)
+
+
+def test_get_only_returns_the_company_own_coupons(cache):
+    assert cache.get(1, 2)["coupon_id"] == 2
+    assert cache.get(2, 2) is None
+    assert cache.get(1, 6) is None
+
+
+def test_for_company(cache):
+    assert sorted(c["coupon_id"] for c in cache.for_company(1)) == [1, 2, 3, 4]
+    assert [c["coupon_id"] for c in cache.for_company(2)] == [5]
@@ -0,0 +1,107 @@
+import numpy as np
+import pytest
+
+from app.facets import FacetIndex, band_label, price_band
+
+
+def synthetic_rows(n, seed=0):
+    rng = np.random.default_rng(seed)
+    rows = []
+    for product_id in range(1, n + 1):
+        rows.append({
+            "product_id": product_id, "brand_id": int(rng.integers(1, 6)),
+            "category_ids": sorted({int(c) for c in rng.integers(1, 8, rng.integers(0, 3))}),
+            "price": None if product_id % 17 == 0 else round(float(rng.uniform(10, 3000)), 2),
+            "discount": int(rng.integers(0, 70)), "rating": None if product_id % 11 == 0 else int(rng.integers(1, 6)),
+            "product_name": f"product {product_id}", "details": None, "variant": None,
+        })
+    return rows
+
+
+def matches(row, brand_ids=(), category_ids=(), min_price=None, max_price=None, min_discount=None, min_rating=None,
+            skip=None):
+    checks = {
+        "brand": not brand_ids or row["brand_id"] in brand_ids,
+        "category": not category_ids or bool(set(row["category_ids"]) & set(category_ids)),
+        "price": (min_price is None and max_price is None) or (
+            row["price"] is not None and (min_price is None or row["price"] >= min_price)
+            and (max_price is None or row["price"] <= max_price)),
+        "discount": min_discount is None or row["discount"] >= min_discount,
+        "rating": min_rating is None or (row["rating"] is not None and row["rating"] >= min_rating),
+    }
+    return all(ok for facet, ok in checks.items() if facet != skip)
+
+
+ROWS = synthetic_rows(700)
+
+FILTERS = [
+    {},
+    {"brand_ids": [2]},
+    {"brand_ids": [1, 3], "category_ids": [4]},
+    {"category_ids": [2, 5], "min_price": 100, "max_price": 900},
+    {"min_discount": 25, "min_rating": 3},
+    {"brand_ids": [5], "category_ids": [1], "min_price": 2500, "min_discount": 50, "min_rating": 4},
+]
+
+
+@pytest.fixture(scope="module")
+def index():
+    index = FacetIndex()
+    index.load(ROWS)
+    return index
+
+
+@pytest.mark.parametrize("filters", FILTERS)
+def test_search_matches_a_scan(index, filters):
+    found = index.search(**filters, limit=len(ROWS))
+    expected = [row["product_id"] for row in ROWS if matches(row, **filters)]
+    assert found["total"] == len(expected)
+    assert [product["product_id"] for product in found["products"]] == expected
+
+
+@pytest.mark.parametrize("filters", FILTERS)
+def test_facet_counts_ignore_their_own_filter(index, filters):
+    counts = index.search(**filters)["facets"]
+    brands, categories, discounts = {}, {}, {}
+    for row in ROWS:
+        if matches(row, **filters, skip="brand"):
+            brands[row["brand_id"]] = brands.get(row["brand_id"], 0) + 1
+        if matches(row, **filters, skip="category"):
+            for category_id in row["category_ids"]:
+                categories[category_id] = categories.get(category_id, 0) + 1
+        if matches(row, **filters, skip="discount"):
+            for threshold in (10, 25, 50):
+                if row["discount"] >= threshold:
+                    discounts[threshold] = discounts.get(threshold, 0) + 1
+    assert counts["brand"] == brands
+    assert counts["category"] == categories
+    assert counts["discount"] == discounts
+
+
+def test_price_bands_count_every_priced_product(index):
+    counts = index.search()["facets"]["price"]
+    expected = {}
+    for row in ROWS:
+        if row["price"] is not None:
+            label = band_label(price_band(row["price"]))
+            expected[label] = expected.get(label, 0) + 1
+    assert counts == expected
+
+
+def test_paging(index):
+    everything = [p["product_id"] for p in index.search(brand_ids=[1], limit=len(ROWS))["products"]]
+    page = index.search(brand_ids=[1], offset=5, limit=7)
+    assert [p["product_id"] for p in page["products"]] == everything[5:12]
+    assert page["total"] == len(everything)
+
+
+def test_apply_rewrites_changed_and_deleted_products():
+    rows = synthetic_rows(50)
+    index = FacetIndex()
+    index.load(rows)
+    moved = dict(rows[0], brand_id=9)
+    added = dict(rows[1], product_id=51, brand_id=9)
+    assert index.apply([1, 2, 51], [moved, added])  # product 2 has no fresh row: deleted
+    assert [p["product_id"] for p in index.search(brand_ids=[9])["products"]] == [1, 51]
+    assert all(p["product_id"] != 2 for p in index.search(limit=100)["products"])
+    assert index.search(limit=100)["total"] == 50
@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+from app.geo import GridIndex, haversine_km, parse_coordinates
+
+
+def brute_force(latitudes, longitudes, latitude, longitude, k, max_km=None):
+    distances = haversine_km(latitude, longitude, latitudes, longitudes)
+    order = np.argsort(distances, kind="stable")
+    if max_km is not None:
+        order = order[distances[order] <= max_km]
+    return distances[order[:k]]
+
+
+@pytest.mark.parametrize("n, cell_degrees", [(1, 0.1), (40, 0.1), (2000, 0.1), (2000, 1.0), (500, 0.05)])
+def test_nearest_matches_brute_force(n, cell_degrees):
+    rng = np.random.default_rng(n)
+    latitudes, longitudes = rng.uniform(17.5, 19.5, n), rng.uniform(72.5, 74.5, n)
+    grid = GridIndex(latitudes, longitudes, cell_degrees)
+    for latitude, longitude in zip(rng.uniform(17, 20, 25), rng.uniform(72, 75, 25)):
+        for k in (1, 5, 12):
+            positions, distances = grid.nearest(latitude, longitude, k)
+            expected = brute_force(latitudes, longitudes, latitude, longitude, k)
+            np.testing.assert_allclose(distances, expected)
+            np.testing.assert_allclose(haversine_km(latitude, longitude, latitudes[positions], longitudes[positions]),
+                                       distances)
+
+
+def test_nearest_within_max_km():
+    rng = np.random.default_rng(7)
+    latitudes, longitudes = rng.uniform(18, 19, 300), rng.uniform(73, 74, 300)
+    grid = GridIndex(latitudes, longitudes)
+    _, distances = grid.nearest(18.5, 73.5, 50, max_km=8)
+    np.testing.assert_allclose(distances, brute_force(latitudes, longitudes, 18.5, 73.5, 50, max_km=8))
+    assert (distances <= 8).all()
+
+
+def test_nearest_far_from_every_point():
+    grid = GridIndex([18.52, 28.61], [73.85, 77.21])
+    positions, distances = grid.nearest(12.97, 77.59, 2)
+    assert positions.tolist() == [0, 1]
+    assert distances[0] == pytest.approx(haversine_km(12.97, 77.59, 18.52, 73.85))
+
+
+def test_nearest_on_an_empty_index():
+    positions, distances = GridIndex([], []).nearest(18.5, 73.8, 3)
+    assert len(positions) == len(distances) == 0
+
+
+def test_haversine_km():
+    assert haversine_km(18.5204, 73.8567, 19.0760, 72.8777) == pytest.approx(120, abs=2)  # Pune to Mumbai
+    assert haversine_km(0, 0, 0, 0) == 0
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("lat: 18.52, long: 73.85", (18.52, 73.85)),
+    ("longitude=73.85 latitude=18.52", (18.52, 73.85)),
+    ("18.52,73.85", (18.52, 73.85)),
+    ("-33.86 151.21", (-33.86, 151.21)),
+    ("18.52", None),
+    ("lat 95, lng 10", None),
+    ("", None),
+    (None, None),
+])
+def test_parse_coordinates(text, expected):
+    assert parse_coordinates(text) == expected
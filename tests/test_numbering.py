@@ -0,0 +1,30 @@
+import datetime
+
+from app import numbering
+from app.models import order_number_blocks
+from app.numbering import BlockAllocator
+
+from .fakes import DB
+
+
+def test_numbers_come_from_blocks_of_one_sequence_value():
+    allocator = BlockAllocator(order_number_blocks, block_size=3)
+    db = DB([(5,)], [(9,)])
+    assert [allocator.allocate(db) for _ in range(5)] == [15, 16, 17, 27, 28]
+    assert len(db.executed) == 2
+
+
+def test_a_forked_process_reserves_its_own_block(monkeypatch):
+    allocator = BlockAllocator(order_number_blocks, block_size=10)
+    db = DB([(1,)], [(2,)])
+    assert allocator.allocate(db) == 10
+    monkeypatch.setattr(numbering.os, "getpid", lambda: -1)
+    assert allocator.allocate(db) == 20
+
+
+def test_numbers_are_formatted_with_the_order_date(monkeypatch):
+    monkeypatch.setattr(numbering, "FORMATS", {"7": {"order": "OC{date:%y%m%d}{n:07d}"}})
+    day = datetime.date(2024, 3, 9)
+    assert numbering.format_number("order", 7, 42, day) == "OC2403090000042"
+    assert numbering.format_number("invoice", 7, 42, day) == "INV2024030900000042"
+    assert numbering.format_number("order", 1, 42, day) == "OD2024030900000042"
@@ -0,0 +1,38 @@
+import datetime
+
+from app import orders
+
+from .fakes import DB
+
+
+def bookings(*ids):
+    return [{"order_id": order_id, "order_number": f"OD{order_id}", "order_date": datetime.date(2024, 1, order_id),
+             "order_amount": 100.0, "invoice_number": f"INV{order_id}"} for order_id in ids]
+
+
+def test_a_full_page_returns_the_cursor_of_its_last_order():
+    db = DB(bookings(9, 8, 7))
+    page, cursor = orders.history(db, 9999900001, limit=3)
+    assert [row["order_id"] for row in page] == [9, 8, 7]
+    assert cursor == {"before_date": datetime.date(2024, 1, 7), "before_id": 7}
+
+
+def test_the_last_page_has_no_cursor():
+    page, cursor = orders.history(DB(bookings(2, 1)), 9999900001, limit=3)
+    assert len(page) == 2
+    assert cursor is None
+
+
+def test_the_cursor_is_passed_back_as_both_keyset_fields():
+    db = DB(bookings(6))
+    orders.history(db, 9999900001, before_date=datetime.date(2024, 1, 7), before_id=7, limit=1)
+    _, params = db.executed[0]
+    assert params == {"customer_contact": 9999900001, "before_date": datetime.date(2024, 1, 7), "before_id": 7,
+                      "limit": 1}
+
+
+def test_the_page_size_is_clamped():
+    for requested, used in ((0, 1), (-5, 1), (10_000, orders.MAX_PAGE_SIZE)):
+        db = DB([])
+        orders.history(db, 9999900001, limit=requested)
+        assert db.executed[0][1]["limit"] == used
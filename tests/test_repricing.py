@@ -0,0 +1,61 @@
+from collections import namedtuple
+
+import numpy as np
+
+from app.repricing import compute, deal_discounts, rule_discounts
+
+from .fakes import DB
+
+Rule = namedtuple("Rule", "scope target_id percent")
+Deal = namedtuple("Deal", "product_id deal_type deal_discount")
+
+
+def prices(cost, base=0, rule=0, deal=0, flat=0):
+    price, discount = compute(*(np.array([value], dtype=float) for value in (cost, base, rule, deal, flat)))
+    return float(price[0]), int(discount[0])
+
+
+def test_the_best_percentage_wins():
+    assert prices(200, base=10) == (180.0, 10)
+    assert prices(200, base=10, rule=25) == (150.0, 25)
+    assert prices(200, base=10, rule=25, deal=30) == (140.0, 30)
+
+
+def test_the_lower_of_percentage_and_flat_price_wins():
+    assert prices(200, deal=10, flat=50) == (150.0, 25)
+    assert prices(200, deal=40, flat=50) == (120.0, 40)
+
+
+def test_prices_are_rounded_to_cents_and_discounts_to_whole_percent():
+    assert prices(99.99, base=33) == (66.99, 33)
+    assert prices(10, flat=3.333) == (6.67, 33)
+
+
+def test_prices_never_drop_below_zero_or_rise_above_cost():
+    assert prices(100, flat=250) == (0.0, 100)
+    assert prices(100, base=150) == (0.0, 100)
+    assert prices(100, base=-20) == (100.0, 0)
+
+
+def test_free_variants_have_no_discount():
+    assert prices(0, base=50) == (0.0, 0)
+
+
+def test_rules_cover_their_scope_and_the_largest_applies():
+    product_ids = np.array([1, 2, 3, 4])
+    brand_ids = np.array([10, 10, 20, 30])
+    rules = [Rule("all", None, 5), Rule("brand", 10, 15), Rule("product", 2, 30), Rule("product", 1, 10),
+             Rule("category", 7, 20), Rule("unknown", 3, 90)]
+    db = DB([(7, 3), (7, 99)])
+    rule_pct = rule_discounts(db, product_ids, brand_ids, rules)
+    assert rule_pct.tolist() == [15, 30, 20, 5]
+    assert db.executed[0][1] == {"ids": [7]}
+
+
+def test_deals_apply_to_their_product_and_split_by_type():
+    product_ids = np.array([3, 1, 3, 2])
+    deals = [Deal(3, "percent", 10), Deal(3, "Percent", 25), Deal(1, "flat", 40), Deal(1, "amount", 60),
+             Deal(9, "percent", 50)]
+    deal_pct, deal_flat = deal_discounts(DB(deals), product_ids, now=None)
+    assert deal_pct.tolist() == [25, 0, 25, 0]
+    assert deal_flat.tolist() == [0, 60, 0, 0]